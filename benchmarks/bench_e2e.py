@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Offline end to end benchmark of building presentations websites.
+
+The google slides api is replaced by benchmarks/fakeslides.FakeService and the thumbnails are served by a local
+ImageServer (configurable latency, error rate, rate limit and images size), so no credentials or network are needed.
+
+Every deck size is timed stage by stage (download, transparent conversion, background layering, resize,
+fused post processing and html render, each stage on a copy of the previous output) and end to end with Tool.build_revealjs_site.
+Results are written as json to compare runs.
+
+    python3 benchmarks/bench_e2e.py --slides 10,100,1000 --latency 0.05 --errorrate 0.01 --output bench.json
+
+With --serverlimit the server answers 429 beyond that many concurrent requests, compare the end to end builds
+with the adaptive --downloads limit and with --noadaptive (fixed limit).
+"""
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import contextlib
+import click
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fakeslides import FakeService, ImageServer, make_presentation  # noqa: E402
+from slides2html.tool import Tool, get_slides_info  # noqa: E402
+from slides2html.downloader import Downloader, make_session, ENGINES, FETCH_STRATEGIES  # noqa: E402
+from slides2html.scheduler import Scheduler  # noqa: E402
+from slides2html.generator import Generator  # noqa: E402
+from slides2html.manifest import Manifest  # noqa: E402
+from slides2html.revealjstemplate import BASIC_TEMPLATE  # noqa: E402
+from slides2html.image_utils import images_to_transparent_background, set_background_for_images, resize_images, \
+    process_images  # noqa: E402
+
+BACKGROUND_PRESENTATION = "background"
+BACKGROUND_LINK = "https://docs.google.com/presentation/d/{}/edit#slide=id.p0".format(BACKGROUND_PRESENTATION)
+
+
+def timed(fn, quiet=True):
+    """seconds taken by fn(), its output is discarded if quiet"""
+    out = io.StringIO() if quiet else sys.stdout
+    with contextlib.redirect_stdout(out):
+        start = time.perf_counter()
+        fn()
+        return time.perf_counter() - start
+
+
+def stage_result(seconds, slides):
+    return {'seconds': round(seconds, 4), 'slides_per_second': round(slides / seconds, 2) if seconds else None}
+
+
+def copy_deck(src, dst):
+    shutil.copytree(src, dst)
+    return dst
+
+
+def bench_deck(workdir, service, slides, engine, concurrency, newsize, quiet, fetch="thumbnail", server=None, scheduler=None):
+    presentation_id = "deck{}".format(slides)
+    service.presentations_resources[presentation_id] = make_presentation(presentation_id, slides)
+    stages = {}
+
+    # download: metadata, thumbnails urls resolution and images.
+    destdir = os.path.join(workdir, "download", presentation_id)
+    manifest = Manifest(destdir)
+    downloader = Downloader(presentation_id, service, session=make_session(concurrency), max_workers=concurrency, engine=engine)
+    stages['download'] = stage_result(timed(lambda: downloader.download(destdir, manifest=manifest), quiet), slides)
+    files = manifest.files()
+    bgdir = os.path.join(workdir, "background")
+    os.makedirs(bgdir, exist_ok=True)
+    bgpath = downloader.get_background(BACKGROUND_LINK, bgdir)
+
+    # separate passes, each on the output of the previous one.
+    transparent = copy_deck(destdir, os.path.join(workdir, "transparent", presentation_id))
+    stages['transparent'] = stage_result(timed(lambda: images_to_transparent_background(transparent, files=files), quiet), slides)
+    layered = copy_deck(transparent, os.path.join(workdir, "background_layering", presentation_id))
+    stages['background'] = stage_result(timed(lambda: set_background_for_images(layered, bgpath, files=files), quiet), slides)
+    resized = copy_deck(layered, os.path.join(workdir, "resize", presentation_id))
+    stages['resize'] = stage_result(timed(lambda: resize_images(resized, newsize, files=files), quiet), slides)
+
+    # the fused process pool stage used by the builds (transparent, background and resize at once).
+    processed = copy_deck(destdir, os.path.join(workdir, "process", presentation_id))
+    stages['process'] = stage_result(timed(lambda: process_images(processed, files=files, bgpath=bgpath, newsize=newsize), quiet), slides)
+
+    entryfile = os.path.join(workdir, "process", presentation_id + ".html")
+
+    def render():
+        slides_infos = get_slides_info(processed, manifest=manifest)
+        Generator(presentation_id).write_html(slides_infos, BASIC_TEMPLATE, entryfile)
+    stages['render'] = stage_result(timed(render, quiet), slides)
+
+    # end to end (cold) build.
+    site = os.path.join(workdir, "site")
+    tool = Tool(presentation_id, service=service, session=make_session(concurrency), scheduler=scheduler, engine=engine, fetch=fetch,
+                authorization=lambda: {'Authorization': "Bearer benchmark"})
+    tool.downloader.max_workers = concurrency
+    if server is not None:
+        tool.downloader.export_template = server.export_template
+    api_calls = service.api_calls
+    throttled = server.throttled if server is not None else 0
+
+    def build():
+        tool.build_revealjs_site(os.path.join(site, presentation_id), os.path.join(site, presentation_id + ".html"),
+                                 background=BACKGROUND_LINK, resize=newsize)
+    end_to_end = stage_result(timed(build, quiet), slides)
+    end_to_end['api_calls'] = service.api_calls - api_calls
+    end_to_end['throttled'] = server.throttled - throttled if server is not None else 0
+
+    # incremental rebuild of the unchanged presentation.
+    def rebuild():
+        tool.build_revealjs_site(os.path.join(site, presentation_id), os.path.join(site, presentation_id + ".html"),
+                                 background=BACKGROUND_LINK, resize=newsize, incremental=True)
+    incremental = stage_result(timed(rebuild, quiet), slides)
+    return {'slides': slides, 'stages': stages, 'end_to_end': end_to_end, 'incremental_noop': incremental}
+
+
+@click.command()
+@click.option("--slides", default="10,100", help="comma separated deck sizes e.g 10,100,1000")
+@click.option("--width", default=800, help="slides images width")
+@click.option("--height", default=450, help="slides images height")
+@click.option("--latency", default=0.0, help="images server latency in seconds")
+@click.option("--apilatency", default=0.0, help="fake slides api latency in seconds")
+@click.option("--errorrate", default=0.0, help="ratio of images requests failing with 503 (retried by the downloader)")
+@click.option("--engine", type=click.Choice(ENGINES), default="threads", help="downloader network engine")
+@click.option("--fetch", type=click.Choice(FETCH_STRATEGIES), default="thumbnail", help="slides images urls of the end to end builds")
+@click.option("--exportstatus", default=200, help="status of the export urls e.g 403 to benchmark the fallback to thumbnails")
+@click.option("--concurrency", default=10, help="concurrent images downloads")
+@click.option("--serverlimit", type=int, help="concurrent requests of the images server beyond which it answers 429")
+@click.option("--downloads", type=int, help="shared downloads limit of the end to end builds (default: unbounded)")
+@click.option("--noadaptive", default=False, is_flag=True, help="fixed --downloads limit instead of adapting it to the 429s")
+@click.option("--output", help="write the json results to this file (default: stdout)")
+@click.option("--verbose", default=False, is_flag=True, help="keep the output of the benchmarked code")
+def main(slides, width, height, latency, apilatency, errorrate, engine, fetch, exportstatus, concurrency, serverlimit, downloads, noadaptive,
+         output, verbose):
+    sizes = [int(n) for n in slides.split(",") if n.strip()]
+    params = {'slides': sizes, 'width': width, 'height': height, 'latency': latency, 'apilatency': apilatency,
+              'errorrate': errorrate, 'engine': engine, 'fetch': fetch, 'exportstatus': exportstatus, 'concurrency': concurrency,
+              'serverlimit': serverlimit, 'downloads': downloads, 'adaptive': not noadaptive}
+    results = []
+    with ImageServer(size=(width, height), latency=latency, error_rate=errorrate, export_status=exportstatus, max_concurrent=serverlimit) as server:
+        service = FakeService(server.url, [make_presentation(BACKGROUND_PRESENTATION, 1)], latency=apilatency)
+        for n in sizes:
+            with tempfile.TemporaryDirectory() as workdir:
+                result = bench_deck(workdir, service, n, engine, concurrency, (width // 2, height // 2), not verbose, fetch=fetch,
+                                    server=server, scheduler=Scheduler(downloads=downloads, adaptive=not noadaptive))
+            results.append(result)
+            summary = ", ".join("{} {}/s".format(name, stage['slides_per_second']) for name, stage in result['stages'].items())
+            end_to_end = result['end_to_end']
+            print("{} slides: end to end {}s, {} api calls, {} throttled ({})".format(
+                n, end_to_end['seconds'], end_to_end['api_calls'], end_to_end['throttled'], summary), file=sys.stderr)
+        params['image_requests'] = server.requests
+        params['image_errors'] = server.errors
+        params['image_exports'] = server.exports
+        params['image_throttled'] = server.throttled
+
+    report = {'benchmark': "e2e", 'python': platform.python_version(), 'cpus': os.cpu_count(), 'params': params, 'results': results}
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=1)
+    else:
+        print(json.dumps(report, indent=1))
+
+
+if __name__ == "__main__":
+    main()
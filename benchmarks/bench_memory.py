@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Peak memory benchmark of building presentations of growing sizes offline (see bench_e2e.py).
+
+Every deck is built in a new process with Tool.build_revealjs_site (background layering and resize, so every image goes
+through the pipeline), the peak resident set size of the build process and of its image worker processes is reported.
+With the pipeline limits (--inflight, --memory) the peak should stay flat whatever the number of slides.
+
+    python3 benchmarks/bench_memory.py --slides 50,200,800 --width 1600 --height 900 --output memory.json
+"""
+import os
+import sys
+import json
+import platform
+import subprocess
+import click
+
+BUILD = """
+import os, sys, json, resource, tempfile
+sys.path.insert(0, {root!r})
+sys.path.insert(0, {benchmarks!r})
+from fakeslides import FakeService, ImageServer, make_presentation
+from slides2html.tool import Tool
+from slides2html.downloader import make_session
+from slides2html.scheduler import Scheduler
+
+background = "https://docs.google.com/presentation/d/background/edit#slide=id.p0"
+with ImageServer(size=({width}, {height})) as server, tempfile.TemporaryDirectory() as site:
+    service = FakeService(server.url, [make_presentation("deck", {slides}), make_presentation("background", 1)])
+    scheduler = Scheduler(images={inflight}, memory={memory} * 1024 * 1024)
+    tool = Tool("deck", service=service, session=make_session({concurrency}), scheduler=scheduler, engine={engine!r})
+    tool.downloader.max_workers = {concurrency}
+    tool.build_revealjs_site(os.path.join(site, "deck"), os.path.join(site, "deck.html"), background=background,
+                             resize=({width} // 2, {height} // 2))
+# ru_maxrss is in KB on linux (bytes on macOS).
+scale = 1 if sys.platform == "darwin" else 1024
+print(json.dumps({{'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+                  'workers_peak_rss': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale}}))
+"""
+
+
+@click.command()
+@click.option("--slides", default="50,200", help="comma separated deck sizes e.g 50,200,800")
+@click.option("--width", default=1600, help="slides images width")
+@click.option("--height", default=900, help="slides images height")
+@click.option("--inflight", default=64, help="max slides images between download and indexing")
+@click.option("--memory", default=1024, help="max MB of decoded images post processed at once")
+@click.option("--engine", type=click.Choice(["threads", "asyncio"]), default="threads", help="downloader network engine")
+@click.option("--concurrency", default=10, help="concurrent images downloads")
+@click.option("--output", help="write the json results to this file (default: stdout)")
+def main(slides, width, height, inflight, memory, engine, concurrency, output):
+    benchmarks = os.path.dirname(os.path.abspath(__file__))
+    sizes = [int(n) for n in slides.split(",") if n.strip()]
+    params = {'slides': sizes, 'width': width, 'height': height, 'inflight': inflight, 'memory': memory, 'engine': engine,
+              'concurrency': concurrency}
+    results = []
+    for n in sizes:
+        code = BUILD.format(root=os.path.dirname(benchmarks), benchmarks=benchmarks, slides=n, width=width, height=height,
+                            inflight=inflight, memory=memory, engine=engine, concurrency=concurrency)
+        out = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE, check=True).stdout
+        result = dict(json.loads(out.decode().strip().splitlines()[-1]), slides=n)
+        results.append(result)
+        print("{} slides: peak rss {}MB (image workers {}MB)".format(n, round(result['peak_rss'] / 2 ** 20, 1),
+                                                                     round(result['workers_peak_rss'] / 2 ** 20, 1)), file=sys.stderr)
+
+    report = {'benchmark': "memory", 'python': platform.python_version(), 'cpus': os.cpu_count(), 'params': params, 'results': results}
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=1)
+    else:
+        print(json.dumps(report, indent=1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Presentation metadata benchmark: payload size and parse time of presentations().get without a field mask (full resource)
+and with the partial responses requested by the Downloader: downloader.PRESENTATION_FIELDS (incremental builds),
+SLIDES_NOTES_FIELDS (full builds) and SLIDES_IDS_FIELDS (background).
+
+Decks are generated by benchmarks/fakeslides.make_presentation with styled page elements on every slide, layout and master,
+the partial responses are computed like the api does from the field masks. Parse time is json decoding of the response
+plus downloader.parse_presentation (median of --runs).
+
+    python3 benchmarks/bench_metadata.py --slides 10,200 --elements 10 --layouts 10 --output metadata.json
+"""
+import os
+import sys
+import json
+import time
+import platform
+import statistics
+import click
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fakeslides import FakeService, make_presentation  # noqa: E402
+from slides2html.downloader import parse_presentation, PRESENTATION_FIELDS, SLIDES_NOTES_FIELDS, SLIDES_IDS_FIELDS  # noqa: E402
+
+MASKS = {'full': None, 'presentation': PRESENTATION_FIELDS, 'slides_notes': SLIDES_NOTES_FIELDS, 'slides_ids': SLIDES_IDS_FIELDS}
+
+
+def median_seconds(fn, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def bench_deck(slides, elements, layouts, runs):
+    presentation_id = "deck{}".format(slides)
+    service = FakeService("http://127.0.0.1", [make_presentation(presentation_id, slides, elements=elements, layouts=layouts)])
+    results = {}
+    for name, fields in MASKS.items():
+        request = service.presentations().get(presentationId=presentation_id, fields=fields)
+        content = json.dumps(request.fn()).encode()
+        with_elements = fields in (None, PRESENTATION_FIELDS)
+        decode = median_seconds(lambda: json.loads(content), runs)
+        parse = median_seconds(lambda: parse_presentation(json.loads(content), elements=with_elements), runs)
+        results[name] = {'bytes': len(content), 'decode_seconds': round(decode, 6), 'parse_seconds': round(parse, 6)}
+    full = results['full']
+    for result in results.values():
+        result['bytes_ratio'] = round(result['bytes'] / full['bytes'], 4)
+        result['parse_speedup'] = round(full['parse_seconds'] / result['parse_seconds'], 2) if result['parse_seconds'] else None
+    return {'slides': slides, 'masks': results}
+
+
+@click.command()
+@click.option("--slides", default="10,200", help="comma separated deck sizes e.g 10,200")
+@click.option("--elements", default=10, help="styled page elements per slide, layout and master")
+@click.option("--layouts", default=10, help="layouts and masters of the decks")
+@click.option("--runs", default=5, help="parse runs (median is reported)")
+@click.option("--output", help="write the json results to this file (default: stdout)")
+def main(slides, elements, layouts, runs, output):
+    sizes = [int(n) for n in slides.split(",") if n.strip()]
+    results = []
+    for n in sizes:
+        result = bench_deck(n, elements, layouts, runs)
+        results.append(result)
+        summary = ", ".join("{} {}KB {}ms".format(name, round(mask['bytes'] / 1024, 1), round(mask['parse_seconds'] * 1000, 2))
+                            for name, mask in result['masks'].items())
+        print("{} slides: {}".format(n, summary), file=sys.stderr)
+
+    report = {'benchmark': "metadata", 'python': platform.python_version(), 'cpus': os.cpu_count(),
+              'params': {'slides': sizes, 'elements': elements, 'layouts': layouts, 'runs': runs}, 'results': results}
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=1)
+    else:
+        print(json.dumps(report, indent=1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark of building presentations to object storage offline (see bench_e2e.py), the storage is a local fakeslides.ObjectStore.
+
+Every deck is built twice: staged, built in a local directory with Tool.build_revealjs_site then every file read again and uploaded,
+and streamed, built in memory with Tool.render_revealjs_site straight to a sink.S3Sink. Requires boto3.
+
+    python3 benchmarks/bench_sink.py --slides 50,200 --formats webp --uploadlatency 0.02 --output sink.json
+"""
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import click
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fakeslides import FakeService, ImageServer, ObjectStore, make_presentation  # noqa: E402
+from slides2html.tool import Tool  # noqa: E402
+from slides2html.sink import S3Sink, LocalSink  # noqa: E402
+from slides2html.downloader import make_session  # noqa: E402
+from slides2html.scheduler import Scheduler  # noqa: E402
+
+BACKGROUND = "https://docs.google.com/presentation/d/background/edit#slide=id.p0"
+
+
+def directory_size(directory):
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(directory) for f in files)
+
+
+@click.command()
+@click.option("--slides", default="50,200", help="comma separated deck sizes e.g 50,200,800")
+@click.option("--width", default=1600, help="slides images width")
+@click.option("--height", default=900, help="slides images height")
+@click.option("--formats", default="webp", help="encoded versions of the images, comma separated")
+@click.option("--latency", default=0.0, help="images server latency in seconds")
+@click.option("--uploadlatency", default=0.0, help="object storage latency in seconds")
+@click.option("--concurrency", default=10, help="concurrent images downloads (and uploads)")
+@click.option("--output", help="write the json results to this file (default: stdout)")
+def main(slides, width, height, formats, latency, uploadlatency, concurrency, output):
+    sizes = [int(n) for n in slides.split(",") if n.strip()]
+    formats = [fmt.strip() for fmt in formats.split(",") if fmt.strip()]
+    params = {'slides': sizes, 'width': width, 'height': height, 'formats': formats, 'latency': latency, 'uploadlatency': uploadlatency,
+              'concurrency': concurrency}
+    options = dict(background=BACKGROUND, resize=(width // 2, height // 2), formats=formats)
+    results = []
+    for n in sizes:
+        with ImageServer(size=(width, height), latency=latency) as server, ObjectStore(latency=uploadlatency) as store:
+            service = FakeService(server.url, [make_presentation("deck", n), make_presentation("background", 1)])
+            tool = Tool("deck", service=service, session=make_session(concurrency), scheduler=Scheduler())
+            tool.downloader.max_workers = concurrency
+            sink = S3Sink("site", endpoint_url=store.url, aws_access_key_id="bench", aws_secret_access_key="bench", region_name="us-east-1")
+
+            with tempfile.TemporaryDirectory() as site:
+                start = time.time()
+                tool.build_revealjs_site(os.path.join(site, "deck"), os.path.join(site, "deck.html"), **options)
+                build_time = time.time() - start
+                staged = LocalSink(site)
+                names = [name for name in staged.names() if not name.startswith("presentations.")]
+                with ThreadPoolExecutor(concurrency) as executor:
+                    list(executor.map(lambda name: sink.write(name, staged.read(name)), names))
+                staged_time = time.time() - start
+                staged_bytes = directory_size(site)
+            uploads = store.puts
+
+            start = time.time()
+            tool.render_revealjs_site(S3Sink("streamed", client=sink.client), **options)
+            streamed_time = time.time() - start
+
+        result = {'slides': n, 'staged': round(staged_time, 3), 'staged_build': round(build_time, 3), 'staged_disk_bytes': staged_bytes,
+                  'streamed': round(streamed_time, 3), 'uploads': uploads, 'streamed_uploads': store.puts - uploads}
+        results.append(result)
+        print("{} slides: staged {}s ({}MB on disk), streamed {}s".format(
+            n, result['staged'], round(staged_bytes / 2 ** 20, 1), result['streamed']), file=sys.stderr)
+
+    report = {'benchmark': "sink", 'python': platform.python_version(), 'cpus': os.cpu_count(), 'params': params, 'results': results}
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=1)
+    else:
+        print(json.dumps(report, indent=1))
+
+
+if __name__ == "__main__":
+    main()
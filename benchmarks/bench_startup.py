@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Command line startup time benchmark.
+
+Every case runs in a new python process (--runs times) so imports are measured cold from the interpreter point of view
+(the os file cache is warm after the first run, the median is reported):
+
+    python    bare interpreter, the baseline
+    import    import slides2html.tool (the command line module)
+    help      slides2html --help
+    usage     slides2html without the required options (argument error)
+    daemon    slides2html-daemon --help
+    service   slides service built from the bundled or cached discovery document (no credentials, an api key is used)
+
+The heavy modules imported by `import slides2html.tool` are listed too, they should only be imported by the builds.
+
+    python3 benchmarks/bench_startup.py --runs 10 --output startup.json
+"""
+import os
+import sys
+import json
+import time
+import platform
+import statistics
+import subprocess
+import tempfile
+import click
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+HEAVY_MODULES = ["PIL", "jinja2", "requests", "aiohttp", "httplib2", "googleapiclient", "oauth2client", "google.oauth2",
+                 "google_auth_httplib2"]
+
+SERVICE = """
+from googleapiclient.discovery import build_from_document
+from slides2html.tool import get_discovery_document
+build_from_document(get_discovery_document({cachedir!r}), developerKey="benchmark")
+"""
+
+CASES = {
+    'python': "pass",
+    'import': "import slides2html.tool",
+    'help': "from slides2html.tool import cli; cli(['--help'])",
+    'usage': "from slides2html.tool import cli; cli([])",
+    'daemon': "from slides2html.daemon import daemon; daemon(['--help'])",
+}
+
+
+def run(code):
+    """seconds taken by a python process running code"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, os.environ.get("PYTHONPATH", "")]))
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def result(times):
+    return {'median': round(statistics.median(times), 4), 'min': round(min(times), 4), 'max': round(max(times), 4)}
+
+
+def imported_heavy_modules():
+    code = "import sys, json, slides2html.tool; print(json.dumps([m for m in {!r} if m in sys.modules]))".format(HEAVY_MODULES)
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, stdout=subprocess.PIPE, check=True).stdout
+    return json.loads(out.decode())
+
+
+@click.command()
+@click.option("--runs", default=10, help="runs of every case")
+@click.option("--service/--no-service", default=True, help="time building the slides service (needs googleapiclient)")
+@click.option("--output", help="write the json results to this file (default: stdout)")
+def main(runs, service, output):
+    results = {}
+    for name, code in CASES.items():
+        results[name] = result([run(code) for _ in range(runs)])
+        print("{}: {}s".format(name, results[name]['median']), file=sys.stderr)
+
+    if service:
+        with tempfile.TemporaryDirectory() as cachedir:
+            # the first run may fetch the discovery document (googleapiclient 1.x), the next ones use the cached document.
+            code = SERVICE.format(cachedir=cachedir)
+            first = run(code)
+            results['service_first'] = result([first])
+            results['service'] = result([run(code) for _ in range(runs)])
+        print("service: {}s (first {}s)".format(results['service']['median'], round(first, 4)), file=sys.stderr)
+
+    baseline = results['python']['median']
+    overhead = {name: round(value['median'] - baseline, 4) for name, value in results.items() if name != "python"}
+    report = {'benchmark': "startup", 'python': platform.python_version(), 'cpus': os.cpu_count(), 'params': {'runs': runs},
+              'results': results, 'overhead': overhead, 'heavy_modules_imported': imported_heavy_modules()}
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=1)
+    else:
+        print(json.dumps(report, indent=1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Per slide benchmark of the transparent background conversion (--background).
+
+Compares image_utils.to_transparent_background_image with the previous per pixel implementation
+and checks that both produce byte identical files.
+
+    python3 benchmarks/bench_transparent.py --width 1600 --height 900 --runs 3
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+import click
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from slides2html.image_utils import to_transparent_background_image  # noqa: E402
+
+
+def per_pixel_transparent_background_image(path, newpath):
+    img = Image.open(path)
+    img = img.convert("RGBA")
+
+    pixdata = img.load()
+
+    width, height = img.size
+    for y in range(height):
+        for x in range(width):
+            if pixdata[x, y] == (255, 255, 255, 255):
+                pixdata[x, y] = (255, 255, 255, 0)
+
+    img.save(newpath)
+
+
+def make_slide(path, size):
+    """white slide with some colored boxes and near white noise."""
+    rnd = random.Random(42)
+    img = Image.new("RGB", size, (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    for _ in range(40):
+        x, y = rnd.randrange(size[0]), rnd.randrange(size[1])
+        color = tuple(rnd.randrange(256) for _ in range(3))
+        draw.rectangle([x, y, x + rnd.randrange(200), y + rnd.randrange(100)], fill=color)
+    for _ in range(2000):
+        img.putpixel((rnd.randrange(size[0]), rnd.randrange(size[1])), (254, 255, 253))
+    img.save(path)
+
+
+def timeit(fn, runs):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+@click.command()
+@click.option("--width", default=1600, help="slide width")
+@click.option("--height", default=900, help="slide height")
+@click.option("--runs", default=3, help="runs per implementation (best is reported)")
+def main(width, height, runs):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        src = os.path.join(tmpdir, "slide.png")
+        old = os.path.join(tmpdir, "old.png")
+        new = os.path.join(tmpdir, "new.png")
+        make_slide(src, (width, height))
+
+        old_time = timeit(lambda: per_pixel_transparent_background_image(src, old), runs)
+        new_time = timeit(lambda: to_transparent_background_image(src, new), runs)
+
+        with open(old, "rb") as f1, open(new, "rb") as f2:
+            identical = f1.read() == f2.read()
+
+    print("slide size: {}x{}".format(width, height))
+    print("per pixel:  {:.4f}s".format(old_time))
+    print("vectorized: {:.4f}s".format(new_time))
+    print("speedup:    {:.1f}x".format(old_time / new_time))
+    print("identical output: {}".format(identical))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,430 @@
+"""
+Offline stand-ins for the google slides api and the thumbnails server used by the benchmarks.
+
+FakeService implements the parts of the slides service used by the Downloader (presentations().get with partial responses,
+pages().getThumbnail and batch requests), thumbnails urls point to an ImageServer serving synthetic slides images from localhost.
+ObjectStore stands in for the S3 compatible storage of sink.S3Sink.
+"""
+import io
+import json
+import time
+import random
+import threading
+import hashlib
+import urllib.parse
+from xml.sax.saxutils import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from PIL import Image, ImageDraw
+
+
+def make_slide_image(size, seed=0):
+    """white slide with some colored boxes (as png bytes)"""
+    rnd = random.Random(seed)
+    img = Image.new("RGB", size, (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    for _ in range(20):
+        x, y = rnd.randrange(size[0]), rnd.randrange(size[1])
+        color = tuple(rnd.randrange(256) for _ in range(3))
+        draw.rectangle([x, y, x + rnd.randrange(size[0] // 4), y + rnd.randrange(size[1] // 4)], fill=color)
+    buf = io.BytesIO()
+    img.save(buf, "PNG")
+    return buf.getvalue()
+
+
+def make_element(object_id, text, styled=True):
+    """shape page element with text, positioned and styled like the elements of a designed slide"""
+    element = {'objectId': object_id, 'shape': {'shapeType': "TEXT_BOX", 'text': {'textElements': [
+        {'endIndex': len(text), 'paragraphMarker': {'style': {'direction': "LEFT_TO_RIGHT"}}},
+        {'endIndex': len(text), 'textRun': {'content': text}}]}}}
+    if styled:
+        element['size'] = {'width': {'magnitude': 3000000, 'unit': "EMU"}, 'height': {'magnitude': 800000, 'unit': "EMU"}}
+        element['transform'] = {'scaleX': 1, 'scaleY': 1, 'translateX': 311700, 'translateY': 744575, 'unit': "EMU"}
+        element['shape']['shapeProperties'] = {
+            'shapeBackgroundFill': {'propertyState': "INHERIT", 'solidFill': {'color': {'rgbColor': {'red': 1, 'green': 1, 'blue': 1}}, 'alpha': 1}},
+            'outline': {'propertyState': "INHERIT", 'weight': {'magnitude': 9525, 'unit': "EMU"}, 'dashStyle': "SOLID"},
+            'contentAlignment': "TOP", 'autofit': {'autofitType': "NONE", 'fontScale': 1}}
+        element['shape']['text']['textElements'][1]['textRun']['style'] = {
+            'fontFamily': "Roboto", 'fontSize': {'magnitude': 18, 'unit': "PT"}, 'bold': False,
+            'foregroundColor': {'opaqueColor': {'themeColor': "DARK1"}},
+            'weightedFontFamily': {'fontFamily': "Roboto", 'weight': 400}}
+    return element
+
+
+def make_presentation(presentation_id, slides, revision="1", elements=1, layouts=0):
+    """presentation resource (as returned by presentations().get) of slides slides with speaker notes
+
+    Keyword Arguments:
+        revision {str} -- revisionId suffix (default: {"1"})
+        elements {int} -- styled page elements per slide (default: {1})
+        layouts {int} -- layouts (and masters) of the presentation, each with elements page elements (default: {0})
+    """
+    def page(object_id, kind):
+        return {'objectId': object_id, 'pageType': kind,
+                'pageElements': [make_element("{}_e{}".format(object_id, j), "text {} of {}".format(j, object_id)) for j in range(elements)],
+                'pageProperties': {'pageBackgroundFill': {'solidFill': {'color': {'themeColor': "LIGHT1"}, 'alpha': 1}}}}
+
+    return {
+        'presentationId': presentation_id,
+        'title': "benchmark deck of {} slides".format(slides),
+        'revisionId': "{}-{}".format(presentation_id, revision),
+        'pageSize': {'width': {'magnitude': 9144000, 'unit': "EMU"}, 'height': {'magnitude': 5143500, 'unit': "EMU"}},
+        'locale': "en",
+        'slides': [dict(page("p{}".format(i), "SLIDE"), slideProperties={
+            'layoutObjectId': "layout",
+            'masterObjectId': "master",
+            'notesPage': {
+                'objectId': "p{}_notes".format(i), 'pageType': "NOTES",
+                'notesProperties': {'speakerNotesObjectId': "n{}".format(i)},
+                'pageProperties': {'pageBackgroundFill': {'propertyState': "NOT_RENDERED"}},
+                'pageElements': [make_element("n{}".format(i), "notes of slide {} https://example.com/{}\n".format(i, i), styled=False)],
+            },
+        }) for i in range(slides)],
+        'layouts': [dict(page("layout{}".format(i), "LAYOUT"), layoutProperties={'masterObjectId': "master", 'name': "LAYOUT_{}".format(i)})
+                    for i in range(layouts)],
+        'masters': [dict(page("master{}".format(i), "MASTER"), masterProperties={'displayName': "master {}".format(i)})
+                    for i in range(layouts)],
+    }
+
+
+def parse_fields(fields):
+    """field mask of a partial response e.g "title,slides(objectId,notesPage/pageElements)" as a tree of names ({} selects everything)"""
+    pos = 0
+
+    def name():
+        nonlocal pos
+        start = pos
+        while pos < len(fields) and fields[pos] not in ",()/":
+            pos += 1
+        return fields[start:pos].strip()
+
+    def selection():
+        nonlocal pos
+        tree = {}
+        while pos < len(fields) and fields[pos] != ")":
+            node = tree.setdefault(name(), {})
+            while pos < len(fields) and fields[pos] == "/":
+                pos += 1
+                node = node.setdefault(name(), {})
+            if pos < len(fields) and fields[pos] == "(":
+                pos += 1
+                node.update(selection())
+                pos += 1
+            if pos < len(fields) and fields[pos] == ",":
+                pos += 1
+        return tree
+
+    return selection()
+
+
+def apply_fields(value, tree):
+    """part of value (json resource) selected by field mask tree (see parse_fields)"""
+    if not tree:
+        return value
+    if isinstance(value, list):
+        return [apply_fields(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {key: apply_fields(value[key], subtree) for key, subtree in tree.items() if key in value}
+    return value
+
+
+class ImageServer:
+    def __init__(self, size=(800, 450), latency=0.0, error_rate=0.0, variants=8, seed=0, export_status=200, max_concurrent=None):
+        """Local http server of synthetic slides images, /{presentation_id}/{page_id}.png and export urls (see export_template)
+
+        Keyword Arguments:
+            size {tuple} -- (width, height) of the images (default: {(800, 450)})
+            latency {float} -- delay in seconds before every response (default: {0.0})
+            error_rate {float} -- ratio of requests answered with 503 (default: {0.0})
+            variants {int} -- number of distinct images served (default: {8})
+            seed {int} -- random seed of the images and errors (default: {0})
+            export_status {int} -- status of the export urls, e.g 403 when export is unavailable (default: {200})
+            max_concurrent {int} -- requests beyond this many at once are answered with 429 like a rate limiting server (default: unlimited)
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.export_status = export_status
+        self.exports = 0
+        self.max_concurrent = max_concurrent
+        self.active = 0
+        self.throttled = 0
+        self.images = [make_slide_image(size, seed + i) for i in range(variants)]
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with server._lock:
+                    throttled = server.max_concurrent is not None and server.active >= server.max_concurrent
+                    if throttled:
+                        server.throttled += 1
+                    else:
+                        server.active += 1
+                if throttled:
+                    self.send_response(429)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                # a slot is held while the server works (latency), not while the response is sent.
+                try:
+                    if server.latency:
+                        time.sleep(server.latency)
+                finally:
+                    with server._lock:
+                        server.active -= 1
+                self._serve()
+
+            def _serve(self):
+                export = "/export/" in self.path
+                if export and server.export_status != 200:
+                    self.send_response(server.export_status)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                with server._lock:
+                    server.requests += 1
+                    server.exports += export
+                    failed = server._random.random() < server.error_rate
+                    if failed:
+                        server.errors += 1
+                if failed:
+                    self.send_response(503)
+                    self.send_header("Content-Length", "0")
+                    self.send_header("Retry-After", "0")
+                    self.end_headers()
+                    return
+                digest = hashlib.sha1(self.path.encode()).digest()
+                body = server.images[digest[0] % len(server.images)]
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = "http://127.0.0.1:{}".format(self.httpd.server_address[1])
+        # replaces downloader.DOWNLOAD_SLIDE_AS_PNG_TEMPLATE (Downloader.export_template).
+        self.export_template = self.url + "/presentation/d/{presentationId}/export/png?id={presentationId}&pageid={pageId}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        return False
+
+
+class ObjectStore:
+    def __init__(self, latency=0.0):
+        """Local stand-in of an S3 compatible object storage (path style: /{bucket}/{key}) for sink.S3Sink
+
+        Implements PutObject (plain and aws-chunked bodies), GetObject, DeleteObject and ListObjectsV2, any bucket exists
+        and requests aren't authenticated. Objects are kept in memory: objects[(bucket, key)] = (content type, body).
+
+            with ObjectStore() as store:
+                sink = S3Sink("site", endpoint_url=store.url, aws_access_key_id="x", aws_secret_access_key="x", region_name="us-east-1")
+
+        Keyword Arguments:
+            latency {float} -- delay in seconds before every response (default: {0.0})
+        """
+        self.latency = latency
+        self.objects = {}
+        self.puts = 0
+        self.bytes_uploaded = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _target(self):
+                path, _, query = self.path.partition("?")
+                bucket, _, key = urllib.parse.unquote(path.lstrip("/")).partition("/")
+                return bucket, key, urllib.parse.parse_qs(query)
+
+            def _send(self, status, body=b"", content_type="application/xml", headers=()):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _body(self):
+                if "chunked" in self.headers.get("Transfer-Encoding", ""):
+                    body = b""
+                    while True:
+                        size = int(self.rfile.readline().split(b";")[0], 16)
+                        if not size:
+                            while self.rfile.readline() not in (b"\r\n", b""):
+                                pass
+                            break
+                        body += self.rfile.read(size + 2)[:size]
+                else:
+                    body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if "aws-chunked" not in self.headers.get("Content-Encoding", ""):
+                    return body
+                # aws-chunked: size[;chunk-signature=...]\r\n data \r\n ... 0\r\n trailing checksums
+                stream, decoded = io.BytesIO(body), b""
+                while True:
+                    size = int(stream.readline().split(b";")[0], 16)
+                    if not size:
+                        return decoded
+                    decoded += stream.read(size)
+                    stream.readline()
+
+            def do_PUT(self):
+                bucket, key, _ = self._target()
+                body = self._body()
+                if server.latency:
+                    time.sleep(server.latency)
+                with server._lock:
+                    server.objects[(bucket, key)] = (self.headers.get("Content-Type", "binary/octet-stream"), body)
+                    server.puts += 1
+                    server.bytes_uploaded += len(body)
+                self._send(200, headers=[("ETag", '"{}"'.format(hashlib.md5(body).hexdigest()))])
+
+            def do_GET(self):
+                bucket, key, query = self._target()
+                if server.latency:
+                    time.sleep(server.latency)
+                if not key:
+                    prefix = query.get("prefix", [""])[0]
+                    with server._lock:
+                        keys = sorted(k for b, k in server.objects if b == bucket and k.startswith(prefix))
+                        contents = "".join("<Contents><Key>{}</Key><Size>{}</Size></Contents>".format(
+                            escape(k), len(server.objects[(bucket, k)][1])) for k in keys)
+                    body = ('<?xml version="1.0" encoding="UTF-8"?><ListBucketResult><Name>{}</Name><Prefix>{}</Prefix>'
+                            "<KeyCount>{}</KeyCount><IsTruncated>false</IsTruncated>{}</ListBucketResult>").format(
+                                escape(bucket), escape(prefix), len(keys), contents)
+                    self._send(200, body.encode())
+                    return
+                with server._lock:
+                    found = server.objects.get((bucket, key))
+                if found is None:
+                    self._send(404, "<Error><Code>NoSuchKey</Code><Key>{}</Key></Error>".format(escape(key)).encode())
+                    return
+                self._send(200, found[1], content_type=found[0])
+
+            def do_DELETE(self):
+                bucket, key, _ = self._target()
+                with server._lock:
+                    server.objects.pop((bucket, key), None)
+                self._send(204)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = "http://127.0.0.1:{}".format(self.httpd.server_address[1])
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        return False
+
+
+class FakeRequest:
+    def __init__(self, fn, latency=0.0, service=None):
+        self.fn = fn
+        self.latency = latency
+        self.service = service
+        # like googleapiclient.http.HttpRequest, the response body is parsed by postproc.
+        self.postproc = lambda response, content: json.loads(content)
+
+    def execute(self, http=None, num_retries=0):
+        if self.service is not None:
+            self.service.count_call()
+        if self.latency:
+            time.sleep(self.latency)
+        return self.postproc(None, json.dumps(self.fn()).encode())
+
+
+class FakeBatch:
+    def __init__(self, callback, latency=0.0):
+        self.callback = callback
+        self.latency = latency
+        self.requests = []
+
+    def add(self, request, request_id=None):
+        self.requests.append((request_id, request))
+
+    def execute(self, http=None):
+        # one round trip for the whole batch.
+        if self.latency:
+            time.sleep(self.latency)
+        for request_id, request in self.requests:
+            # every request of a batch counts for the api quota.
+            if request.service is not None:
+                request.service.count_call()
+            self.callback(request_id, request.fn(), None)
+
+
+class _Pages:
+    def __init__(self, service):
+        self.service = service
+
+    def getThumbnail(self, presentationId, pageObjectId, thumbnailProperties_thumbnailSize="MEDIUM"):
+        url = "{}/{}/{}.png".format(self.service.images_url, presentationId, pageObjectId)
+        return FakeRequest(lambda: {'contentUrl': url, 'width': 800, 'height': 450}, self.service.latency, self.service)
+
+
+class _Presentations:
+    def __init__(self, service):
+        self.service = service
+
+    def get(self, presentationId, fields=None):
+        presentation = self.service.presentations_resources[presentationId]
+        if fields:
+            tree = parse_fields(fields)
+            return FakeRequest(lambda: apply_fields(presentation, tree), self.service.latency, self.service)
+        return FakeRequest(lambda: presentation, self.service.latency, self.service)
+
+    def pages(self):
+        return _Pages(self.service)
+
+
+class FakeService:
+    def __init__(self, images_url, presentations=(), latency=0.0):
+        """Stand-in for the google slides service (googleapiclient.discovery.build("slides", "v1"))
+
+        Arguments:
+            images_url {str} -- base url of the thumbnails (see ImageServer)
+
+        Keyword Arguments:
+            presentations {[dict]} -- presentations resources (see make_presentation) (default: {()})
+            latency {float} -- delay in seconds of every api request (default: {0.0})
+        """
+        self.images_url = images_url
+        self.latency = latency
+        self.presentations_resources = {p['presentationId']: p for p in presentations}
+        self.api_calls = 0
+        self._lock = threading.Lock()
+
+    def count_call(self):
+        with self._lock:
+            self.api_calls += 1
+
+    def presentations(self):
+        return _Presentations(self)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(callback, self.latency)
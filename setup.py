@@ -16,10 +16,12 @@ setup(name='slides2html',
       description='convert google presentations to reveal.js website',
       long_description='convert google presentations to reveal.js website',
       packages=['slides2html'],
-      scripts=['scripts/slides2html'],
+      scripts=['scripts/slides2html', 'scripts/slides2html-daemon'],
       url="https://github.com/threefoldtech/slides2html",
       license='BSD 3-Clause License',
       install_requires=required,
+      # process pools initializer (image workers), http.server.ThreadingHTTPServer (daemon), asyncio.get_running_loop.
+      python_requires='>=3.7',
       classifiers=[
           'Development Status :: 4 - Beta',
           'Environment :: Console',
@@ -27,5 +29,6 @@ setup(name='slides2html',
           'License :: OSI Approved :: BSD License',
           'Operating System :: OS Independent',
           'Programming Language :: Python',
+          'Programming Language :: Python :: 3 :: Only',
       ],
       )
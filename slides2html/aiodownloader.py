@@ -0,0 +1,195 @@
+"""
+asyncio network engine of the Downloader (engine="asyncio").
+
+Images are fetched with aiohttp on a single event loop so hundreds of downloads can be in flight without a thread each.
+Blocking work (google api client requests, files writes, waiting for the limits shared with other threads) is handed off to executors.
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from slides2html.downloader import DEFAULT_TIMEOUT, DEFAULT_WORKERS, RETRY_STATUSES, CHUNK_SIZE
+from slides2html.scheduler import PUSHBACK_STATUSES
+from slides2html.metrics import metrics
+
+try:
+    import aiohttp
+except ImportError:  # optional dependency, only needed by the asyncio engine
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+
+def run(coro):
+    """Run coroutine to completion on a new event loop."""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def client_timeout(timeout):
+    if isinstance(timeout, (tuple, list)):
+        connect, read = timeout
+    else:
+        connect = read = timeout
+    return aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+
+
+# threads blocked in the acquire of the limits shared with other threads (see acquire), created by the first wait.
+_waiters = None
+_waiters_lock = threading.Lock()
+WAITERS = 64
+
+
+def _waiters_executor():
+    global _waiters
+    with _waiters_lock:
+        if _waiters is None:
+            _waiters = ThreadPoolExecutor(max_workers=WAITERS, thread_name_prefix="slides2html-limit")
+        return _waiters
+
+
+async def acquire(limit):
+    """acquire threading limit (shared with other threads) without blocking the event loop.
+
+    Waits in a thread of its own executor: not one of the executor writing the files, whose writes release the limit.
+    """
+    if limit.acquire(blocking=False):
+        return
+    future = asyncio.get_running_loop().run_in_executor(_waiters_executor(), limit.acquire)
+    try:
+        await asyncio.shield(future)
+    except asyncio.CancelledError:
+        # the thread still acquires the limit, give it back.
+        future.add_done_callback(lambda f: limit.release() if not f.cancelled() and f.exception() is None else None)
+        raise
+
+
+async def download_one(session, url, destfile, retries=5, backoff=0.5, limit=None, executor=None):
+    """asyncio version of downloader.download_one
+
+    Arguments:
+        session {aiohttp.ClientSession} -- session to reuse connections from
+        url {str} -- url to download
+        destfile {str} -- destination file
+
+    Keyword Arguments:
+        retries {int} -- max number of retries (default: {5})
+        backoff {float} -- initial delay between retries in seconds, doubled on every retry (default: {0.5})
+        limit {AdaptiveLimit} -- threading limit held while downloading, given the outcome (default: {None})
+        executor {Executor} -- writes the file, not to block the event loop (default: the loop default executor)
+
+    Returns:
+        bool -- True if destfile exists after the call.
+    """
+    if os.path.exists(destfile):
+        metrics.count("downloads_skipped")
+        return True
+    loop = asyncio.get_running_loop()
+    tmpfile = destfile + ".part"
+    for attempt in range(retries + 1):
+        delay = backoff * 2 ** attempt
+        if limit is not None:
+            await acquire(limit)
+        try:
+            # spans of the event loop thread overlap, they're still one per download.
+            with metrics.span("download_image", "network", file=os.path.basename(destfile), attempt=attempt):
+                start = time.monotonic()
+                async with session.get(url) as r:
+                    if limit is not None:
+                        if r.status in PUSHBACK_STATUSES:
+                            limit.backoff("status {}".format(r.status))
+                        else:
+                            limit.success(time.monotonic() - start)
+                    if r.status == 200:
+                        size = 0
+                        f = await loop.run_in_executor(executor, open, tmpfile, 'wb')
+                        try:
+                            async for chunk in r.content.iter_chunked(CHUNK_SIZE):
+                                await loop.run_in_executor(executor, f.write, chunk)
+                                size += len(chunk)
+                        finally:
+                            await loop.run_in_executor(executor, f.close)
+                        await loop.run_in_executor(executor, os.replace, tmpfile, destfile)
+                        metrics.count("bytes_downloaded", size)
+                        metrics.count("images_downloaded")
+                        return True
+                    if r.status not in RETRY_STATUSES:
+                        logger.error("failed to download %s to %s: status %s", url, destfile, r.status)
+                        metrics.count("downloads_failed")
+                        return False
+                    retry_after = r.headers.get("Retry-After", "")
+                    if retry_after.isdigit():
+                        delay = max(delay, int(retry_after))
+                    logger.debug("download of %s got status %s (attempt %s)", url, r.status, attempt + 1)
+        except asyncio.TimeoutError as e:
+            if limit is not None:
+                limit.backoff("timeout")
+            logger.debug("download of %s timed out (attempt %s): %r", url, attempt + 1, e)
+        except aiohttp.ClientError as e:
+            logger.debug("download of %s failed (attempt %s): %r", url, attempt + 1, e)
+        finally:
+            if limit is not None:
+                limit.release()
+            if os.path.exists(tmpfile):
+                await loop.run_in_executor(executor, os.remove, tmpfile)
+        if attempt < retries:
+            metrics.count("download_retries")
+            await asyncio.sleep(delay)
+    logger.error("failed to download %s to %s after %s attempts", url, destfile, retries + 1)
+    metrics.count("downloads_failed")
+    return False
+
+
+async def download_entries(entries, destdir="/tmp", batches=(), concurrency=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, limit=None,
+                           resolve_workers=None):
+    """asyncio version of downloader.download_entries
+
+    Arguments:
+        entries List[(url, save_as, slide_meta, presentation_title)] -- entries (url is None until resolved)
+
+    Keyword Arguments:
+        destdir {str} -- destination directory (default: {"/tmp"})
+        batches {[callable]} -- blocking calls each returning [(save_as, url)], run concurrently in an executor,
+                                images of a batch are downloaded as soon as it resolves (default: {()})
+        concurrency {int} -- max number of in flight downloads (default: {DEFAULT_WORKERS})
+        timeout {tuple} -- (connect, read) timeouts in seconds (default: {DEFAULT_TIMEOUT})
+        limit {Semaphore} -- shared threading limit on concurrent downloads e.g with other presentations (default: {None})
+        resolve_workers {int} -- number of threads resolving batches (default: executor default)
+
+    Returns:
+        List[(url, save_as, slide_meta, presentation_title)] -- entries with their final urls
+    """
+    if aiohttp is None:
+        raise RuntimeError("asyncio engine requires aiohttp: pip install aiohttp")
+
+    loop = asyncio.get_running_loop()
+    os.makedirs(destdir, exist_ok=True)
+    entries = list(entries)
+    indices = {entry[1]: i for i, entry in enumerate(entries)}
+
+    # resolving batches takes seconds, files writes must not wait for them.
+    with ThreadPoolExecutor(max_workers=resolve_workers) as executor, ThreadPoolExecutor(thread_name_prefix="slides2html-io") as io:
+        semaphore = asyncio.Semaphore(concurrency)
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        async with aiohttp.ClientSession(connector=connector, timeout=client_timeout(timeout)) as session:
+
+            async def fetch(save_as, url):
+                async with semaphore:
+                    destfile = os.path.join(destdir, save_as)
+                    logger.debug("downloading %s to %s", url, destfile)
+                    await download_one(session, url, destfile, limit=limit, executor=io)
+
+            async def resolve(batch):
+                resolved = await loop.run_in_executor(executor, batch)
+                for save_as, url in resolved:
+                    i = indices[save_as]
+                    entries[i] = (url,) + entries[i][1:]
+                await asyncio.gather(*(fetch(save_as, url) for save_as, url in resolved))
+
+            await asyncio.gather(*(resolve(batch) for batch in batches))
+    return entries
@@ -0,0 +1,304 @@
+"""
+Long running daemon rebuilding presentations when they change.
+
+Every presentation revisionId is polled (a light request) at jittered intervals, changed presentations are rebuilt incrementally
+once their revision is stable for the debounce delay (or changed for too long), so a burst of edits causes a single rebuild.
+A small local http server exposes the status of the presentations and manual triggers:
+
+    GET  /status         status of all of the presentations
+    POST /build          rebuild all of the presentations
+    POST /build/{id}     rebuild presentation id
+"""
+import json
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import click
+from slides2html.tool import SiteBuilder, build_options, setup_logging, write_profile, read_presentations_ids
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 20
+DEFAULT_DEBOUNCE = 10
+DEFAULT_MAX_DELAY = 60
+DEFAULT_PORT = 8421
+
+
+class DeckState:
+    def __init__(self, presentation_id):
+        self.presentation_id = presentation_id
+        self.built_revision = None  # revision of the last successful build
+        self.seen_revision = None  # last polled revision
+        self.changed_at = None  # when a not built revision was first seen, None if up to date
+        self.stable_since = None  # when seen_revision was first seen
+        self.unversioned = False  # no revision is returned, the deck is rebuilt on every poll
+        self.next_poll = 0
+        self.building = False
+        self.triggered = False  # triggered while building, built again whatever the revision
+        self.builds = 0
+        self.failures = 0
+        self.last_build = None
+        self.last_duration = None
+        self.last_error = None
+
+    def as_dict(self):
+        return {
+            'presentation_id': self.presentation_id,
+            'built_revision': self.built_revision,
+            'seen_revision': self.seen_revision,
+            'unversioned': self.unversioned,
+            'pending': self.changed_at is not None,
+            'building': self.building,
+            'builds': self.builds,
+            'failures': self.failures,
+            'last_build': self.last_build,
+            'last_duration': self.last_duration,
+            'last_error': self.last_error,
+        }
+
+
+class Daemon:
+    def __init__(self, presentations_ids, build, revision_id, interval=DEFAULT_INTERVAL, debounce=DEFAULT_DEBOUNCE, max_delay=DEFAULT_MAX_DELAY,
+                 jitter=0.2, parallel=4, on_build=None):
+        """Rebuild presentations when their revision changes
+
+        Arguments:
+            presentations_ids {[str]} -- presentations to watch
+            build {callable} -- build(presentation_id), raises on failure
+            revision_id {callable} -- revision_id(presentation_id) current revision of the presentation,
+                                      None if it isn't known: the presentation is rebuilt on every poll
+
+        Keyword Arguments:
+            interval {float} -- seconds between polls of a presentation (default: {DEFAULT_INTERVAL})
+            debounce {float} -- seconds a new revision must stay unchanged before rebuilding (default: {DEFAULT_DEBOUNCE})
+            max_delay {float} -- rebuild anyway if the presentation keeps changing for this long (default: {DEFAULT_MAX_DELAY})
+            jitter {float} -- random +/- ratio of the intervals so presentations polls are spread (default: {0.2})
+            parallel {int} -- number of presentations built at the same time (default: {4})
+            on_build {callable} -- called with the DeckState after every build (default: {None})
+        """
+        self.build = build
+        self.revision_id = revision_id
+        self.interval = interval
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.on_build = on_build
+        self.decks = {presentation_id: DeckState(presentation_id) for presentation_id in presentations_ids}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=parallel)
+        # first polls are spread a bit so they don't all hit the api at once.
+        now = time.monotonic()
+        for deck in self.decks.values():
+            deck.next_poll = now + random.uniform(0, jitter * interval)
+
+    def _delay(self, seconds):
+        return seconds * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def trigger(self, presentation_id=None):
+        """Rebuild presentation (all of them if None) as soon as possible
+
+        Returns:
+            bool -- False if presentation_id isn't watched
+        """
+        with self._lock:
+            if presentation_id is not None and presentation_id not in self.decks:
+                return False
+            decks = [self.decks[presentation_id]] if presentation_id is not None else self.decks.values()
+            now = time.monotonic()
+            for deck in decks:
+                deck.changed_at = now - self.max_delay
+                deck.next_poll = now
+                # the build in progress may have fetched the presentation before the trigger.
+                deck.triggered = deck.building
+        self._wakeup.set()
+        return True
+
+    def status(self):
+        with self._lock:
+            return {'decks': [deck.as_dict() for deck in self.decks.values()]}
+
+    def poll(self, deck):
+        """Check the revision of deck and schedule its next poll"""
+        now = time.monotonic()
+        try:
+            revision = self.revision_id(deck.presentation_id)
+        except Exception as e:
+            logger.warning("failed to get revision of %s: %r", deck.presentation_id, e)
+            with self._lock:
+                deck.next_poll = now + self._delay(self.interval)
+            return
+        with self._lock:
+            if revision is None:
+                # changes can't be seen (e.g view only credentials), rebuilding every interval is the only way to keep up.
+                if not deck.unversioned:
+                    logger.warning("no revision of %s (view only access?), rebuilding it on every poll", deck.presentation_id)
+                    deck.unversioned = True
+                deck.seen_revision = None
+                deck.stable_since = now - self.debounce
+                if deck.changed_at is None:
+                    deck.changed_at = now
+                deck.next_poll = now + self._delay(self.interval)
+                return
+            deck.unversioned = False
+            if revision != deck.seen_revision:
+                deck.seen_revision = revision
+                deck.stable_since = now
+            if revision != deck.built_revision and deck.changed_at is None:
+                logger.info("presentation %s changed (revision %s)", deck.presentation_id, revision)
+                deck.changed_at = now
+            # changed presentations are polled again after the debounce delay.
+            deck.next_poll = now + self._delay(self.debounce if deck.changed_at is not None else self.interval)
+
+    def _due(self, deck, now):
+        if deck.building or deck.changed_at is None:
+            return False
+        if now - deck.changed_at >= self.max_delay:
+            return True
+        return deck.stable_since is not None and now - deck.stable_since >= self.debounce
+
+    def _build(self, deck, revision):
+        start = time.monotonic()
+        error = None
+        try:
+            self.build(deck.presentation_id)
+        except Exception as e:
+            logger.exception("failed to build %s", deck.presentation_id)
+            error = e
+        with self._lock:
+            deck.building = False
+            deck.builds += 1
+            deck.last_build = time.time()
+            deck.last_duration = round(time.monotonic() - start, 3)
+            if error is None:
+                deck.built_revision = revision
+                deck.last_error = None
+                # unless it changed again or was triggered during the build.
+                if deck.seen_revision == revision and not deck.triggered:
+                    deck.changed_at = None
+            else:
+                deck.failures += 1
+                deck.last_error = repr(error)
+                if not deck.triggered:
+                    deck.changed_at = None  # retried on the next poll.
+            deck.triggered = False
+            deck.next_poll = min(deck.next_poll, time.monotonic() + self._delay(self.interval))
+        if self.on_build is not None:
+            self.on_build(deck)
+        self._wakeup.set()
+
+    def step(self):
+        """Poll the presentations due and start the builds due
+
+        Returns:
+            float -- seconds until the next poll
+        """
+        now = time.monotonic()
+        with self._lock:
+            to_poll = [deck for deck in self.decks.values() if deck.next_poll <= now and not deck.building]
+        for deck in to_poll:
+            self.poll(deck)
+
+        now = time.monotonic()
+        with self._lock:
+            for deck in self.decks.values():
+                if self._due(deck, now):
+                    deck.building = True
+                    logger.info("rebuilding %s", deck.presentation_id)
+                    self._executor.submit(self._build, deck, deck.seen_revision)
+            next_poll = min([deck.next_poll for deck in self.decks.values() if not deck.building] or [now + self.interval])
+        return max(0.0, next_poll - time.monotonic())
+
+    def run(self):
+        """Run until stop() is called"""
+        while not self._stopped.is_set():
+            timeout = self.step()
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+        self._executor.shutdown(wait=True)
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+
+def make_server(daemon, host="127.0.0.1", port=DEFAULT_PORT):
+    """http server of the daemon status and triggers (see module docstring)
+
+    Returns:
+        ThreadingHTTPServer -- server, to be run with serve_forever
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status, body):
+            content = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/status":
+                self._reply(200, daemon.status())
+            else:
+                self._reply(404, {'error': "not found"})
+
+        def do_POST(self):
+            parts = [part for part in self.path.split("/") if part]
+            if not parts or parts[0] != "build" or len(parts) > 2:
+                self._reply(404, {'error': "not found"})
+                return
+            presentation_id = parts[1] if len(parts) == 2 else None
+            if not daemon.trigger(presentation_id):
+                self._reply(404, {'error': "unknown presentation {}".format(presentation_id)})
+                return
+            self._reply(202, {'triggered': presentation_id or "all"})
+
+        def log_message(self, format, *args):
+            logger.debug("%s %s", self.address_string(), format % args)
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+@click.command()
+@click.option("--id", help="presentation url or id (can be repeated to watch multiple presentations)", multiple=True, required=False)
+@click.option("--idsfile", help="file with a presentation url or id per line", required=False)
+@click.option("--interval", help="seconds between checks of a presentation", default=DEFAULT_INTERVAL, type=float, required=False)
+@click.option("--debounce", help="seconds a changed presentation must stay unchanged before rebuilding", default=DEFAULT_DEBOUNCE, type=float,
+              required=False)
+@click.option("--maxdelay", help="max seconds a rebuild is delayed by successive changes", default=DEFAULT_MAX_DELAY, type=float, required=False)
+@click.option("--host", help="status and triggers http server address", default="127.0.0.1", required=False)
+@click.option("--port", help="status and triggers http server port (0 to disable)", default=DEFAULT_PORT, type=int, required=False)
+@build_options
+def daemon(id=(), idsfile=None, interval=DEFAULT_INTERVAL, debounce=DEFAULT_DEBOUNCE, maxdelay=DEFAULT_MAX_DELAY, host="127.0.0.1",
+           port=DEFAULT_PORT, parallel=4, profile=None, loglevel="INFO", **options):
+    setup_logging(loglevel, profile)
+    presentations_ids = read_presentations_ids(id, idsfile)
+    if not presentations_ids:
+        raise ValueError("at least one presentation is required: use --id or --idsfile")
+
+    builder = SiteBuilder(**options)
+
+    def build(presentation_id):
+        builder.build(presentation_id, incremental=True)
+
+    watcher = Daemon(presentations_ids, build, builder.revision_id, interval=interval, debounce=debounce, max_delay=maxdelay,
+                     parallel=parallel, on_build=lambda deck: write_profile(profile))
+    server = None
+    if port:
+        server = make_server(watcher, host, port)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logger.info("status on http://%s:%s/status", host, server.server_address[1])
+    logger.info("watching %s presentations", len(presentations_ids))
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        watcher.stop()
+    finally:
+        if server is not None:
+            server.shutdown()
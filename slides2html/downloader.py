@@ -1,25 +1,197 @@
 import os
+import json
+import time
+import logging
+import threading
+import hashlib
+import functools
 from concurrent.futures import ThreadPoolExecutor, wait
-import requests
-from configparser import ConfigParser
 from slides2html.google_links_utils import get_slide_id, get_presentation_id, link_info
+from slides2html.scheduler import Scheduler, PUSHBACK_STATUSES
+from slides2html.manifest import Manifest, slide_elements_hash, extract_links
+from slides2html.sitemeta import site_metadata
+from slides2html.metrics import metrics
 
-# logging.basicConfig()
-# logger = logging.getLogger('downloader')
+logger = logging.getLogger(__name__)
+
+ENGINES = ["threads", "asyncio"]
 
 # The ID template for google presentation.
 DOWNLOAD_SLIDE_AS_JPEG_TEMPLATE = "https://docs.google.com/presentation/d/{presentationId}/export/jpeg?id={presentationId}&pageid={pageId}"
+# version of the presentation file, returned to viewers too (revisionId is only returned to editors).
+DRIVE_VERSION_TEMPLATE = "https://www.googleapis.com/drive/v3/files/{presentationId}?fields=modifiedTime%2Cversion&supportsAllDrives=true"
+DOWNLOAD_SLIDE_AS_PNG_TEMPLATE = "https://docs.google.com/presentation/d/{presentationId}/export/png?id={presentationId}&pageid={pageId}"
+
+# how slides images urls are obtained: a getThumbnail api call per slide or export urls built from the slides ids (no api call).
+FETCH_STRATEGIES = ["thumbnail", "export"]
+
+# (connect, read) timeouts in seconds.
+DEFAULT_TIMEOUT = (10, 60)
+DEFAULT_WORKERS = 10
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+CHUNK_SIZE = 64 * 1024
+
+
+def make_session(pool_size=DEFAULT_WORKERS):
+    """Create http session with a connection pool big enough for pool_size concurrent downloads
+
+    Keyword Arguments:
+        pool_size {int} -- max number of concurrent connections per host (default: {DEFAULT_WORKERS})
+
+    Returns:
+        requests.Session -- session
+    """
+    # requests is only imported when downloading so the command line starts faster.
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def is_pushback(error):
+    """True if error is a google api error (googleapiclient.errors.HttpError) asking to slow down"""
+    status = getattr(getattr(error, "resp", None), "status", None)
+    return status is not None and int(status) in PUSHBACK_STATUSES
+
+
+def _fetch(url, save, name, session=None, timeout=DEFAULT_TIMEOUT, retries=5, backoff=0.5, limit=None, headers=None, content_type=None,
+           log_errors=True):
+    """Retries of download_one and download_bytes
+
+    Arguments:
+        url {str} -- url to download
+        save {callable} -- save(response) stores the body of a successful response, returns its size
+        name {str} -- destination in logs and spans
+
+    Keyword Arguments:
+        see download_one
+
+    Returns:
+        bool -- True if the body was saved.
+    """
+    import requests
+    session = session or requests
+    limit = limit or Scheduler().downloads
+    for attempt in range(retries + 1):
+        delay = backoff * 2 ** attempt
+        try:
+            with limit, metrics.span("download_image", "network", file=os.path.basename(name), attempt=attempt):
+                start = time.monotonic()
+                r = session.get(url, stream=True, timeout=timeout, headers=headers)
+                # until the response headers, the same whatever the size of the image.
+                latency = time.monotonic() - start
+                if r.status_code in PUSHBACK_STATUSES:
+                    limit.backoff("status {}".format(r.status_code))
+                else:
+                    limit.success(latency)
+                with r:
+                    if r.status_code == 200 and content_type and not r.headers.get("Content-Type", "").startswith(content_type):
+                        if log_errors:
+                            logger.error("failed to download %s to %s: content type %s", url, name, r.headers.get("Content-Type"))
+                            metrics.count("downloads_failed")
+                        return False
+                    if r.status_code == 200:
+                        metrics.count("bytes_downloaded", save(r))
+                        metrics.count("images_downloaded")
+                        return True
+                    if r.status_code not in RETRY_STATUSES:
+                        if log_errors:
+                            logger.error("failed to download %s to %s: status %s", url, name, r.status_code)
+                            metrics.count("downloads_failed")
+                        return False
+                    retry_after = r.headers.get("Retry-After", "")
+                    if retry_after.isdigit():
+                        delay = max(delay, int(retry_after))
+                    logger.debug("download of %s got status %s (attempt %s)", url, r.status_code, attempt + 1)
+        except requests.Timeout as e:
+            limit.backoff("timeout")
+            logger.debug("download of %s timed out (attempt %s): %s", url, attempt + 1, e)
+        except requests.RequestException as e:  # connection errors and broken streams.
+            logger.debug("download of %s failed (attempt %s): %s", url, attempt + 1, e)
+        if attempt < retries:
+            metrics.count("download_retries")
+            time.sleep(delay)
+    if log_errors:
+        logger.error("failed to download %s to %s after %s attempts", url, name, retries + 1)
+        metrics.count("downloads_failed")
+    return False
+
+
+def download_one(url, destfile, session=None, timeout=DEFAULT_TIMEOUT, retries=5, backoff=0.5, limit=None, headers=None, content_type=None,
+                 log_errors=True):
+    """Download url to destfile unless it already exists
+
+    The response is streamed to a temporary file renamed to destfile once complete,
+    so destfile never contains a partial download.
+    Rate limited (429) and server errors (5xx) are retried with exponential backoff,
+    pushback (429, 503, timeouts) and latency are reported to limit so the shared downloads limit adapts (see scheduler.AdaptiveLimit).
+
+    Arguments:
+        url {str} -- url to download
+        destfile {str} -- destination file
+
+    Keyword Arguments:
+        session {requests.Session} -- session to reuse connections from (default: {None})
+        timeout {tuple} -- (connect, read) timeouts in seconds (default: {DEFAULT_TIMEOUT})
+        retries {int} -- max number of retries (default: {5})
+        backoff {float} -- initial delay between retries in seconds, doubled on every retry (default: {0.5})
+        limit {AdaptiveLimit} -- held while downloading (not while waiting between retries), given the outcome (default: {None})
+        headers {dict} -- request headers e.g Authorization (default: {None})
+        content_type {str} -- required prefix of the response content type e.g "image/" (default: any)
+        log_errors {bool} -- log and count failures, False when the caller has a fallback (default: {True})
+
+    Returns:
+        bool -- True if destfile exists after the call.
+    """
+    if os.path.exists(destfile):
+        metrics.count("downloads_skipped")
+        return True
+    tmpfile = destfile + ".part"
+
+    def save(r):
+        size = 0
+        with open(tmpfile, 'wb') as f:
+            for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+                size += len(chunk)
+        os.replace(tmpfile, destfile)
+        return size
+
+    try:
+        return _fetch(url, save, destfile, session=session, timeout=timeout, retries=retries, backoff=backoff, limit=limit, headers=headers,
+                      content_type=content_type, log_errors=log_errors)
+    finally:
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+
+
+def download_bytes(url, session=None, timeout=DEFAULT_TIMEOUT, retries=5, backoff=0.5, limit=None, headers=None, content_type=None,
+                   log_errors=True, name="memory"):
+    """In memory version of download_one
+
+    Keyword Arguments:
+        name {str} -- destination in logs and spans e.g slide image file name (default: {"memory"})
+        see download_one
+
+    Returns:
+        bytes -- content of url, None if the download failed.
+    """
+    content = []
 
+    def save(r):
+        content[:] = [b"".join(r.iter_content(chunk_size=CHUNK_SIZE))]
+        return len(content[0])
 
-def download_one(url, destfile):
-    r = requests.get(url)
-    if r.status_code == 200 and not os.path.exists(destfile):
-        with open(destfile, 'wb') as f:
-            content = r.content
-            f.write(content)
+    if _fetch(url, save, name, session=session, timeout=timeout, retries=retries, backoff=backoff, limit=limit, headers=headers,
+              content_type=content_type, log_errors=log_errors):
+        return content[0]
+    return None
 
 
-def download_entry(entry, destdir="/tmp"):
+def download_entry(entry, destdir="/tmp", session=None, timeout=DEFAULT_TIMEOUT, limit=None):
     """Download single entry
 
     Arguments:
@@ -27,6 +199,9 @@ def download_entry(entry, destdir="/tmp"):
 
     Keyword Arguments:
         destdir {str} -- destination directory (default: {"/tmp"})
+        session {requests.Session} -- session to reuse connections from (default: {None})
+        timeout {tuple} -- (connect, read) timeouts in seconds (default: {DEFAULT_TIMEOUT})
+        limit {Semaphore} -- held while downloading (default: {None})
 
     Returns:
         string -- [destination file to download]
@@ -35,18 +210,17 @@ def download_entry(entry, destdir="/tmp"):
     url, save_as, slide_meta, presentation_title = entry
     destfile = os.path.join(destdir, save_as)
 
-    print("Downloading {} to {}".format(url, destfile))
-    metapath = destfile + ".meta"
-    print("Metapath: ", metapath)
-    with open(metapath, 'w') as f:
-        f.write("".join(slide_meta))
+    if url is None:  # resolved later or unchanged slide (incremental build)
+        return destfile
 
-    download_one(url, destfile)
+    logger.debug("downloading %s to %s", url, destfile)
+    download_one(url, destfile, session=session, timeout=timeout, limit=limit)
 
     return destfile
 
 
-def download_entries(entries, destdir="/tmp"):
+def download_entries(entries, destdir="/tmp", resolved=None, session=None, timeout=DEFAULT_TIMEOUT, max_workers=DEFAULT_WORKERS,
+                     limit=None):
     """Download slides to destination website directory
 
     Arguments:
@@ -54,139 +228,555 @@ def download_entries(entries, destdir="/tmp"):
 
     Keyword Arguments:
         destdir {str} -- [description] (default: {"/tmp"})
+        resolved Iterable[(save_as, url)] -- urls of entries resolved lazily, each entry is downloaded
+                                             as soon as its url is available (default: {None})
+        session {requests.Session} -- session to reuse connections from (default: new session sized to max_workers)
+        timeout {tuple} -- (connect, read) timeouts in seconds (default: {DEFAULT_TIMEOUT})
+        max_workers {int} -- number of concurrent downloads (default: {DEFAULT_WORKERS})
+        limit {Semaphore} -- shared limit on concurrent downloads e.g with other presentations (default: {None})
+
+    Returns:
+        List[(url, save_as, slide_meta, presentation_title)] -- entries with their final urls
     """
 
     results = []
     os.makedirs(destdir, exist_ok=True)
+    entries = list(entries)
+    indices = {entry[1]: i for i, entry in enumerate(entries)}
+    session = session or make_session(max_workers)
 
-    with ThreadPoolExecutor(max_workers=10) as executor:
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
         for entry in entries:
-            future = executor.submit(download_entry, entry, destdir)
+            future = executor.submit(download_entry, entry, destdir, session, timeout, limit)
+            results.append(future)
+
+        # downloads are already running while the remaining urls get resolved.
+        for save_as, url in (resolved or []):
+            i = indices[save_as]
+            entries[i] = (url,) + entries[i][1:]
+            destfile = os.path.join(destdir, save_as)
+            logger.debug("downloading %s to %s", url, destfile)
+            future = executor.submit(download_one, url, destfile, session, timeout, limit=limit)
             results.append(future)
     wait(results)
+    return entries
+
+
+# partial responses of presentations().get (see parse_presentation), instead of every layout, master and notes page property:
+# the slides content (elements hash) and the text runs of the speaker notes.
+NOTES_FIELDS = "notesPage(pageElements(shape(text(textElements(textRun(content))))))"
+PRESENTATION_FIELDS = "title,revisionId,slides(objectId,pageElements,pageProperties,slideProperties(layoutObjectId,masterObjectId,{}))".format(
+    NOTES_FIELDS)
+# the slides content is most of the payload of designed decks and only incremental builds compare it.
+SLIDES_NOTES_FIELDS = "title,revisionId,slides(objectId,slideProperties({}))".format(NOTES_FIELDS)
+# only the slides ids, e.g for the background slide.
+SLIDES_IDS_FIELDS = "title,revisionId,slides(objectId)"
+# from the least to the most detailed, a presentation fetched with a mask has what the previous ones request.
+PRESENTATION_MASKS = (SLIDES_IDS_FIELDS, SLIDES_NOTES_FIELDS, PRESENTATION_FIELDS)
+
+
+def speaker_notes(slide):
+    """Text runs of the speaker notes of a slide resource (missing parts of partial responses are skipped)
+
+    Arguments:
+        slide {dict} -- slide resource (as returned by presentations().get)
+
+    Returns:
+        [str] -- text runs contents
+    """
+    runs = []
+    notes_page = slide.get('slideProperties', {}).get('notesPage', {})
+    for page_element in notes_page.get('pageElements', ()):
+        for text_element in page_element.get('shape', {}).get('text', {}).get('textElements', ()):
+            content = text_element.get('textRun', {}).get('content')
+            if content is not None:
+                runs.append(content)
+    return runs
+
+
+def parse_presentation(presentation, elements=True):
+    """Keep what is needed to download the slides of a presentation resource (as returned by presentations().get)
+
+    Arguments:
+        presentation {dict} -- presentation resource
+
+    Keyword Arguments:
+        elements {bool} -- presentation has the slides content (PRESENTATION_FIELDS) to hash (default: {True})
+
+    Returns:
+        dict -- title, revision_id and slides: list of objectId, notes (text runs of the speaker notes) and elements (hash of the slide content)
+    """
+    slides = [{'objectId': slide['objectId'], 'notes': speaker_notes(slide), 'elements': slide_elements_hash(slide) if elements else None}
+              for slide in presentation.get('slides', [])]
+    return {'title': presentation['title'], 'revision_id': presentation.get('revisionId'), 'slides': slides}
+
+
+def mask_covers(fields, requested):
+    """True if a presentation fetched with field mask fields has what the mask requested asks for (see PRESENTATION_MASKS)"""
+    return fields in PRESENTATION_MASKS and PRESENTATION_MASKS.index(fields) >= PRESENTATION_MASKS.index(requested)
+
+
+def measure_payload(request, name):
+    """Count the response bytes of api request as {name}_bytes and time their parsing as {name}_parse (when metrics are enabled)
+
+    Arguments:
+        request {HttpRequest} -- api request, its response is parsed by request.postproc
+        name {str} -- metrics name
+
+    Returns:
+        HttpRequest -- request
+    """
+    postproc = getattr(request, "postproc", None)
+    if postproc is None or not metrics.enabled:
+        return request
+
+    def measured(response, content):
+        metrics.count(name + "_bytes", len(content))
+        with metrics.span(name + "_parse", "cpu", bytes=len(content)):
+            return postproc(response, content)
+    request.postproc = measured
+    return request
 
 
 class Downloader:
-    def __init__(self, presentation_id, service, thumbnailsize="MEDIUM"):
+    def __init__(self, presentation_id, service, thumbnailsize="MEDIUM", resolve_batch_size=20, timeout=DEFAULT_TIMEOUT,
+                 max_workers=DEFAULT_WORKERS, session=None, scheduler=None, http_factory=None, engine="threads", store=None,
+                 metacache=None, fetch="thumbnail", authorization=None):
         """
         Download class responsible for downloading slides as images
         Arguments:
             presentation_id {str} -- presentation id from google presentation id
             service {Service} -- Google api service (created by build)
             thumbnailsize {str} -- image size (medium or large)
+            resolve_batch_size {int} -- max number of thumbnail urls resolved in one batch request
+            timeout {tuple} -- (connect, read) timeouts in seconds of images downloads
+            max_workers {int} -- number of concurrent images downloads (in flight requests for asyncio engine)
+            session {requests.Session} -- http session shared with other downloaders (default: new session)
+            scheduler {Scheduler} -- limits shared with other downloaders (default: unbounded)
+            http_factory {callable} -- creates authorized httplib2.Http, needed when the service is shared
+                                       between threads as httplib2 isn't thread safe (default: service http)
+            engine {str} -- network engine: threads or asyncio (requires aiohttp) (default: {"threads"})
+            store {ContentStore} -- images store shared between presentations (default: {None})
+            metacache {MetadataCache} -- cache of the presentations metadata (default: {None})
+            fetch {str} -- slides images urls: thumbnail (getThumbnail api calls) or export (export urls of the slides ids,
+                           falling back to thumbnails if export is unavailable), see slide_urls (default: {"thumbnail"})
+            authorization {callable} -- returns the headers authorizing export urls requests (default: {None})
         """
 
         self.presentation_id = presentation_id
         self.service = service
+        self.resolve_batch_size = resolve_batch_size
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.session = session or make_session(max_workers)
+        self.scheduler = scheduler or Scheduler()
+        self.http_factory = http_factory
+        self._local = threading.local()
+        if engine not in ENGINES:
+            raise ValueError("invalid engine should be one of {}".format(ENGINES))
+        self.engine = engine
+        if fetch not in FETCH_STRATEGIES:
+            raise ValueError("invalid fetch should be one of {}".format(FETCH_STRATEGIES))
+        if fetch == "export" and engine != "threads":
+            raise ValueError("export fetch requires the threads engine")
+        self.fetch = fetch
+        self.authorization = authorization
+        self.export_template = DOWNLOAD_SLIDE_AS_PNG_TEMPLATE
+        self._export_failed = False
+        self._export_lock = threading.Lock()
+        self.store = store
+        self.metacache = metacache
         self.thumbnailsize = thumbnailsize.upper()  # "LARGE."
         if thumbnailsize not in ["MEDIUM", "LARGE"]:
             raise ValueError("invalid thumbnailsize should be large or medium")
 
-    def _get_slides_download_info(self):
-        presentation = self.service.presentations().get(
-            presentationId=self.presentation_id).execute()
+    def get_revision_id(self, presentation_id=None):
+        """Current revisionId of the presentation, a light request to check if it changed
+
+        Keyword Arguments:
+            presentation_id {str} -- presentation id (default: self.presentation_id)
+
+        Returns:
+            str -- revisionId
+        """
+        presentation_id = presentation_id or self.presentation_id
+        with metrics.span("metadata_revision", "api", presentation=presentation_id):
+            current = self._execute(self.service.presentations().get(presentationId=presentation_id, fields="revisionId"))
+        return current.get('revisionId')
+
+    def get_drive_version(self, presentation_id=None):
+        """Version of the drive file of the presentation, changes with every edit like its revisionId (see get_revision_id)
+        which google only returns to the editors of the presentation
+
+        Keyword Arguments:
+            presentation_id {str} -- presentation id (default: self.presentation_id)
+
+        Returns:
+            str -- {version}:{modifiedTime} of the file
+        """
+        from googleapiclient.http import HttpRequest
+        presentation_id = presentation_id or self.presentation_id
+        http = self._http() or self.service._http
+        request = HttpRequest(http, lambda resp, content: json.loads(content), DRIVE_VERSION_TEMPLATE.format(presentationId=presentation_id))
+        with metrics.span("drive_version", "api", presentation=presentation_id):
+            current = self._execute(request)
+        return "{}:{}".format(current.get('version'), current.get('modifiedTime'))
+
+    def _get_presentation(self, presentation_id, elements=True, notes=True):
+        """Get parsed presentation (see parse_presentation), from self.metacache if the presentation didn't change since cached.
+
+        Arguments:
+            presentation_id {str} -- presentation id
+
+        Keyword Arguments:
+            elements {bool} -- the slides content hash is needed e.g by incremental builds (default: {True})
+            notes {bool} -- the speaker notes are needed, without elements and notes only the slides ids are requested (default: {True})
+
+        Returns:
+            dict -- parsed presentation
+        """
+        fields = PRESENTATION_FIELDS if elements else SLIDES_NOTES_FIELDS if notes else SLIDES_IDS_FIELDS
+        if self.metacache is not None:
+            cached = self.metacache.get(presentation_id)
+            # entries are kept with the mask they were fetched with, e.g notes of full builds don't have the elements hashes.
+            if cached is not None and cached['revision_id'] and mask_covers(cached.get('fields'), fields):
+                if self.get_revision_id(presentation_id) == cached['revision_id']:
+                    metrics.count("metadata_cache_hits")
+                    return cached
+            metrics.count("metadata_cache_misses")
+
+        with metrics.span("metadata", "api", presentation=presentation_id):
+            request = self.service.presentations().get(presentationId=presentation_id, fields=fields)
+            presentation = parse_presentation(self._execute(measure_payload(request, "metadata")), elements=elements)
+        if self.metacache is not None:
+            self.metacache.put(presentation_id, dict(presentation, fields=fields))
+        return presentation
+
+    def _get_slides_download_info(self, manifest, incremental=False):
+        """Get download entries of the presentation slides and fill the slides index (manifest)
+
+        Thumbnail urls aren't resolved here (url is None), see self.resolve_thumbnails.
+
+        Arguments:
+            manifest {Manifest} -- slides index of the presentation
+
+        Keyword Arguments:
+            incremental {bool} -- manifest is the index of the previous build, only new or changed slides need downloading (default: {False})
+
+        Returns:
+            (List[(url, save_as, slide_meta, presentation_title)], dict, str) -- entries,
+                page ids of slides to download keyed by save_as and presentation title
+        """
+        # the slides fingerprints of full builds are never compared: elements hashes are None, once the presentation changes
+        # the next incremental build downloads every slide.
+        presentation = self._get_presentation(self.presentation_id, elements=incremental)
         presentation_title = presentation['title']
-        slides = presentation.get('slides')
-        slides_ids = [slide["objectId"] for slide in slides]
+        revision_id = presentation['revision_id']
+        slides = presentation['slides']
+        manifest.title = presentation_title
+
+        # exported images don't have the size of the thumbnails.
+        imagesize = self.thumbnailsize if self.fetch == "thumbnail" else "EXPORT"
+        if incremental and manifest.is_uptodate(revision_id, imagesize):
+            logger.info("presentation %s didn't change since last build.", self.presentation_id)
+            return [], {}, presentation_title
 
         links = []
+        page_ids = {}
+        index = []
         zerofills = len(str(len(slides)))
-        for i, slide_id in enumerate(slides_ids):
-            # slide_index = slide_id.split("_")[2]
-            slide = slides[i]
-            slide_meta = []
-            notesPage = slide['slideProperties']['notesPage']
-            # speakerNotesObjectId = notesPage['notesProperties']['speakerNotesObjectId'] #i3
-
-            pageElements = notesPage['pageElements']
-            for page_element in pageElements:
-                # if page_element['objectId'] == speakerNotesObjectId:
-                shape = page_element['shape']
-                if 'text' in shape and 'textElements' in shape['text']:
-                    for text_element in shape['text']['textElements']:
-                        if 'textRun' in text_element and 'content' in text_element['textRun']:
-                            slide_meta.append(
-                                text_element['textRun']['content'])
-            pageId = slide_id
-            presentationId = self.presentation_id
-            url = self.service.presentations().pages().getThumbnail(presentationId=presentationId, pageObjectId=pageId,
-                                                                    thumbnailProperties_thumbnailSize=self.thumbnailsize).execute()["contentUrl"]
+        for i, slide in enumerate(slides):
+            pageId = slide['objectId']
             image_id = str(i).zfill(zerofills)
             save_as = "{image_id}_{page_id}.png".format(
                 image_id=image_id, page_id=pageId)
-            links.append((url, save_as, slide_meta, presentation_title))
-        return links, presentation_title
+            links.append((None, save_as, slide['notes'], presentation_title))
+            page_ids[save_as] = pageId
+            notes = "".join(slide['notes'])
+            index.append({'file': save_as, 'fingerprint': manifest.fingerprint(slide, imagesize),
+                          'notes': notes, 'links': extract_links(notes)})
+
+        if incremental:
+            to_fetch = manifest.sync(revision_id, index)
+            page_ids = {save_as: page_id for save_as, page_id in page_ids.items() if save_as in to_fetch}
+        else:
+            manifest.set_slides(revision_id, index)
+        return links, page_ids, presentation_title
+
+    def _http(self):
+        if self.http_factory is None:
+            return None
+        if not hasattr(self._local, "http"):
+            self._local.http = self.http_factory()
+        return self._local.http
+
+    def _execute(self, request, **kwargs):
+        """Execute google api (or batch) request within the api calls limit, backs it off when the api pushes back."""
+        limit = self.scheduler.api
+        with limit:
+            try:
+                response = request.execute(http=self._http(), **kwargs)
+            except Exception as e:
+                if is_pushback(e):
+                    limit.backoff("status {}".format(e.resp.status))
+                raise
+            # within the limit: it only grows while it's reached.
+            # api calls latencies depend on the request (e.g size of the presentation), only pushback statuses are taken into account.
+            limit.success()
+        return response
+
+    def _thumbnail_request(self, presentation_id, page_id):
+        return self.service.presentations().pages().getThumbnail(presentationId=presentation_id, pageObjectId=page_id,
+                                                                 thumbnailProperties_thumbnailSize=self.thumbnailsize)
+
+    def _resolve_batches(self, page_ids):
+        """Split thumbnails urls resolution into batches of self.resolve_batch_size slides.
 
-    def get_background(self, slidelink, destdir):
+        Arguments:
+            page_ids {dict} -- page ids keyed by save_as
+
+        Returns:
+            [callable] -- each call resolves a batch and returns its [(save_as, url)]
+        """
+        items = list(page_ids.items())
+        return [functools.partial(self._resolve_batch, items[start:start + self.resolve_batch_size])
+                for start in range(0, len(items), self.resolve_batch_size)]
+
+    def _resolve_batch(self, items):
+        """Resolve thumbnails urls of items using a single batch request
+
+        Arguments:
+            items List[(save_as, page_id)] -- slides to resolve
+
+        Returns:
+            List[(save_as, url)] -- thumbnails urls
+        """
+        resolved = []
+        failed = []
+
+        def callback(request_id, response, exception):
+            if exception is not None:
+                if is_pushback(exception):
+                    self.scheduler.api.backoff("status {}".format(exception.resp.status))
+                failed.append(request_id)
+            else:
+                resolved.append((request_id, response["contentUrl"]))
+
+        page_ids = dict(items)
+        batch = self.service.new_batch_http_request(callback=callback)
+        for save_as, page_id in items:
+            batch.add(self._thumbnail_request(self.presentation_id, page_id), request_id=save_as)
+        with metrics.span("resolve_thumbnails", "api", presentation=self.presentation_id, slides=len(items)):
+            self._execute(batch)
+        # failed parts of the batch (e.g rate limited) are retried one by one with backoff.
+        for save_as in failed:
+            metrics.count("resolve_retries")
+            with metrics.span("resolve_thumbnail", "api", presentation=self.presentation_id, file=save_as):
+                response = self._execute(self._thumbnail_request(self.presentation_id, page_ids[save_as]), num_retries=5)
+            resolved.append((save_as, response["contentUrl"]))
+        return resolved
+
+    def resolve_thumbnails(self, page_ids):
+        """Resolve thumbnails urls using batch requests of self.resolve_batch_size slides.
+
+        Arguments:
+            page_ids {dict} -- page ids keyed by save_as
+
+        Yields:
+            (str, str) -- save_as and thumbnail url, as soon as the batch containing them is resolved.
+        """
+        for batch in self._resolve_batches(page_ids):
+            yield from batch()
+
+    def _background_slide(self, slidelink):
+        """(presentation id, presentation, file name, page id) of the background slide of slidelink, file name and page id are None if not found"""
         presentation_id, background_slide_id = link_info(slidelink)
 
         if not background_slide_id:
             raise ValueError("invalid slide link")
-        presentation = self.service.presentations().get(
-            presentationId=presentation_id).execute()
-        presentation_title = presentation['title']
-        slides = presentation.get('slides')
+        presentation = self._get_presentation(presentation_id, elements=False, notes=False)
+        slides = presentation['slides']
         slides_ids = [slide["objectId"] for slide in slides]
 
-        links = []
         zerofills = len(str(len(slides)))
 
         if len(background_slide_id) < 5:
             background_slide_id = slides_ids[0]
 
         for i, slide_id in enumerate(slides_ids):
-            if slide_id != background_slide_id:
-                continue
-            else:
-                slide = slides[i]
-                slide_meta = []
-                notesPage = slide['slideProperties']['notesPage']
-                # speakerNotesObjectId = notesPage['notesProperties']['speakerNotesObjectId'] #i3
-
-                pageElements = notesPage['pageElements']
-                for page_element in pageElements:
-                    # if page_element['objectId'] == speakerNotesObjectId:
-                    shape = page_element['shape']
-                    if 'text' in shape and 'textElements' in shape['text']:
-                        for text_element in shape['text']['textElements']:
-                            if 'textRun' in text_element and 'content' in text_element['textRun']:
-                                slide_meta.append(
-                                    text_element['textRun']['content'])
-                pageId = slide_id
-                presentationId = presentation_id
-                url = self.service.presentations().pages().getThumbnail(presentationId=presentationId, pageObjectId=pageId,
-                                                                        thumbnailProperties_thumbnailSize=self.thumbnailsize).execute()["contentUrl"]
+            if slide_id == background_slide_id:
                 image_id = str(i).zfill(zerofills)
                 save_as = "background_{image_id}_{page_id}.png".format(
-                    image_id=image_id, page_id=pageId)
-                save_as_path = os.path.join(destdir, save_as)
-                download_one(url, save_as_path)
+                    image_id=image_id, page_id=slide_id)
+                return presentation_id, presentation, save_as, slide_id
+        return presentation_id, presentation, None, None
+
+    def background_version(self, slidelink):
+        """Version of the background slide of slidelink, changes when the background deck is edited
+
+        Returns:
+            str -- revisionId of the background presentation, digest of the background image if the revision isn't returned
+                   (only editors of a presentation get its revisionId), None if the background isn't found
+        """
+        presentation_id, _ = link_info(slidelink)
+        revision_id = self.get_revision_id(presentation_id)
+        if revision_id:
+            return revision_id
+        data = self.fetch_background(slidelink)
+        return hashlib.sha256(data).hexdigest() if data is not None else None
+
+    def get_background(self, slidelink, destdir):
+        presentation_id, presentation, save_as, pageId = self._background_slide(slidelink)
+        if save_as is None:
+            return None
+        save_as_path = os.path.join(destdir, save_as)
+        # the background of the previous build may be outdated, download_one would keep it.
+        if os.path.exists(save_as_path):
+            os.remove(save_as_path)
+
+        store_key = None
+        if self.store is not None:
+            # same background slide revision is downloaded once for all of the presentations.
+            store_key = "background:{}:{}:{}:{}".format(presentation_id, pageId, presentation['revision_id'], self.thumbnailsize)
+            digest = self.store.get_key(store_key)
+            if digest is not None:
+                metrics.count("store_background_hits")
+                self.store.link(digest, save_as_path)
                 return save_as_path
 
-    def download(self, destdir):
-        """Download images of self.presentation_id to destination dir
+        url = self._execute(self._thumbnail_request(presentation_id, pageId))["contentUrl"]
+        download_one(url, save_as_path, session=self.session, timeout=self.timeout, limit=self.scheduler.downloads)
+        if store_key is not None and os.path.exists(save_as_path):
+            self.store.put_key(store_key, save_as_path)
+        return save_as_path
+
+    def fetch_background(self, slidelink):
+        """In memory version of get_background
+
+        Returns:
+            bytes -- background slide image, None if the slide isn't found or the download failed
+        """
+        presentation_id, _, save_as, page_id = self._background_slide(slidelink)
+        if save_as is None:
+            return None
+        url = self._execute(self._thumbnail_request(presentation_id, page_id))["contentUrl"]
+        return download_bytes(url, session=self.session, timeout=self.timeout, limit=self.scheduler.downloads, name=save_as)
+
+    def prepare(self, destdir, manifest=None, incremental=False):
+        """Fill the slides index of the presentation and list the slides to download (see download)
 
         Arguments:
-            destdir {str} -- destination dir.
+            destdir {str} -- destination dir, None for in memory builds (see fetch_slide), nothing is written then
+
+        Keyword Arguments:
+            manifest {Manifest} -- slides index of the presentation (default: new index of destdir, required without destdir)
+            incremental {bool} -- manifest is the index of the previous build, only new or changed slides are listed (default: {False})
+
+        Returns:
+            (List[(url, save_as, slide_meta, presentation_title)], dict) -- entries and page ids of the slides to download keyed by save_as
         """
+        if manifest is None:
+            manifest = Manifest(destdir)
+        if destdir is None:
+            return self._get_slides_download_info(manifest, incremental)[:2]
+        os.makedirs(destdir, exist_ok=True)
+        entries, page_ids, title = self._get_slides_download_info(manifest, incremental)
+
+        # the website presentations metadata, shared with the other builds of the website.
+        site_metadata(os.path.dirname(os.path.abspath(destdir))).update(self.presentation_id, title=title, revision_id=manifest.revision_id)
+        return entries, page_ids
+
+    def slide_urls(self, page_ids):
+        """Urls of the slides images with the self.fetch strategy, export urls don't need any api call,
+        thumbnails urls are resolved in batches (see resolve_thumbnails), also once export failed.
+
+        Arguments:
+            page_ids {dict} -- page ids keyed by save_as
 
-        entries, title = self._get_slides_download_info()
+        Yields:
+            (str, str, str) -- save_as, url and source (export or thumbnail) to be downloaded with download_slide
+        """
+        remaining = dict(page_ids)
+        if self.fetch == "export":
+            for save_as, page_id in page_ids.items():
+                if self._export_failed:
+                    break
+                del remaining[save_as]
+                yield save_as, self.export_template.format(presentationId=self.presentation_id, pageId=page_id), "export"
+        for save_as, url in self.resolve_thumbnails(remaining):
+            yield save_as, url, "thumbnail"
+
+    def download_slide(self, destdir, save_as, url, source="thumbnail"):
+        """Download a slide image (see slide_urls) to destdir within the shared downloads limit
+
+        A failed export falls back to the thumbnail of the slide, and disables export for the next slides.
+
+        Returns:
+            str -- source of the image (export or thumbnail), None if the download failed
+        """
+        destfile = os.path.join(destdir, save_as)
+        return self._get_slide(save_as, url, source, lambda url, **options: download_one(url, destfile, **options))[1]
 
-        parser = ConfigParser()
+    def fetch_slide(self, save_as, url, source="thumbnail"):
+        """In memory version of download_slide
 
-        website_dir = os.path.dirname(destdir)
-        presentations_meta_path = os.path.join(
-            website_dir, "presentations.meta")
+        Returns:
+            (bytes, str) -- content and source of the image, (None, None) if the download failed
+        """
+        return self._get_slide(save_as, url, source, lambda url, **options: download_bytes(url, name=save_as, **options))
+
+    def _get_slide(self, save_as, url, source, get):
+        """download_slide with get(url, **options) downloading url (see download_one), returns (result of get, source)"""
+        options = dict(session=self.session, timeout=self.timeout, limit=self.scheduler.downloads)
+        if source == "export":
+            if not self._export_failed:
+                logger.debug("exporting %s to %s", url, save_as)
+                headers = self.authorization() if self.authorization is not None else None
+                result = get(url, headers=headers, content_type="image/", log_errors=False, **options)
+                if result:
+                    metrics.count("slides_exported")
+                    return result, source
+                with self._export_lock:
+                    if not self._export_failed:
+                        logger.warning("export of %s is unavailable, falling back to thumbnails", self.presentation_id)
+                        self._export_failed = True
+            metrics.count("export_fallbacks")
+            page_id = save_as.split("_", 1)[1][:-len(".png")]
+            with metrics.span("resolve_thumbnail", "api", presentation=self.presentation_id, file=save_as):
+                url = self._execute(self._thumbnail_request(self.presentation_id, page_id), num_retries=5)["contentUrl"]
+            source = "thumbnail"
+        logger.debug("downloading %s to %s", url, save_as)
+        result = get(url, **options)
+        if result:
+            metrics.count("slides_thumbnails")
+            return result, source
+        return None, None
+
+    def download(self, destdir, manifest=None, incremental=False):
+        """Download images of self.presentation_id to destination dir
 
-        if os.path.exists(presentations_meta_path):
-            parser.read(presentations_meta_path)
-        if not parser.has_section(self.presentation_id):
-            parser.add_section(self.presentation_id)
-        parser.set(self.presentation_id, 'title', title)
-        with open(presentations_meta_path, "w") as metafile:
-            parser.write(metafile)
+        Arguments:
+            destdir {str} -- destination dir.
 
-        download_entries(entries, destdir)
+        Keyword Arguments:
+            manifest {Manifest} -- slides index of the presentation filled with the downloaded slides (default: new index of destdir)
+            incremental {bool} -- manifest is the index of the previous build, only download new or changed slides (default: {False})
 
-        print("done downloading.")
-        return (entries, destdir)
+        Returns:
+            (List[(url, save_as, slide_meta, presentation_title)], str) -- downloaded entries and destination dir
+        """
+        entries, page_ids = self.prepare(destdir, manifest, incremental)
+
+        if self.engine == "asyncio":
+            from slides2html import aiodownloader
+            # without a thread safe way to execute api requests batches are resolved one at a time.
+            resolve_workers = None if self.http_factory is not None else 1
+            entries = aiodownloader.run(aiodownloader.download_entries(
+                entries, destdir, batches=self._resolve_batches(page_ids), concurrency=self.max_workers, timeout=self.timeout,
+                limit=self.scheduler.downloads, resolve_workers=resolve_workers))
+        else:
+            entries = download_entries(entries, destdir, resolved=self.resolve_thumbnails(page_ids), session=self.session,
+                                       timeout=self.timeout, max_workers=self.max_workers, limit=self.scheduler.downloads)
+
+        logger.debug("done downloading %s.", self.presentation_id)
+        return ([entry for entry in entries if entry[0] is not None], destdir)
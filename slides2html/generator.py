@@ -1,4 +1,89 @@
-from jinja2 import Template
+import os
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+# compiled templates kept by the environment, and their sources.
+CACHE_SIZE = 64
+# compiled templates are looked up by sha1 of their content (see get_template), least recently used first.
+_sources = OrderedDict()
+_sources_lock = threading.Lock()
+# created (and jinja2 imported) by the first render, see _get_environment.
+_environment = None
+_environment_lock = threading.Lock()
+_bytecode_cache_dir = None
+
+# path: (mtime, content) of the templates files (see read_template)
+_files = {}
+_files_lock = threading.Lock()
+
+
+def enable_bytecode_cache(directory):
+    """Keep the compiled templates in directory so they're not compiled again by the next runs
+
+    Arguments:
+        directory {str} -- cache directory
+    """
+    global _bytecode_cache_dir
+    directory = os.path.expanduser(directory)
+    os.makedirs(directory, exist_ok=True)
+    with _environment_lock:
+        _bytecode_cache_dir = directory
+        if _environment is not None:
+            from jinja2 import FileSystemBytecodeCache
+            _environment.bytecode_cache = FileSystemBytecodeCache(directory)
+
+
+def _get_environment():
+    global _environment
+    with _environment_lock:
+        if _environment is None:
+            from jinja2 import Environment, FunctionLoader, FileSystemBytecodeCache
+            bytecode_cache = FileSystemBytecodeCache(_bytecode_cache_dir) if _bytecode_cache_dir else None
+            _environment = Environment(loader=FunctionLoader(_sources.get), auto_reload=False, cache_size=CACHE_SIZE, bytecode_cache=bytecode_cache)
+        return _environment
+
+
+def get_template(source):
+    """Compiled template of source, only compiled once per process (and once per bytecode cache)
+
+    Arguments:
+        source {str} -- template content
+
+    Returns:
+        jinja2.Template -- compiled template
+    """
+    name = hashlib.sha1(source.encode()).hexdigest()
+    with _sources_lock:
+        _sources[name] = source
+        _sources.move_to_end(name)
+        # e.g a theme edited again and again in a long running daemon.
+        while len(_sources) > CACHE_SIZE:
+            _sources.popitem(last=False)
+    return _get_environment().get_template(name)
+
+
+def read_template(path):
+    """Content of template file (path), only read again if it was modified
+
+    Arguments:
+        path {str} -- template file path
+
+    Returns:
+        str -- template content
+    """
+    path = os.path.abspath(os.path.expanduser(path))
+    mtime = os.stat(path).st_mtime_ns
+    with _files_lock:
+        cached = _files.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+    with open(path) as f:
+        source = f.read()
+    with _files_lock:
+        _files[path] = (mtime, source)
+    return source
 
 
 class Generator:
@@ -22,6 +107,28 @@ class Generator:
         """
         # if not self.slides_as_images:
         #     raise RuntimeError("need to run self.save_slides_to_dir first.")
-        template = Template(revealjs_template)
+        template = get_template(revealjs_template)
         title = slides_infos[0]['title']
         return template.render(slidesinfos=slides_infos, presentation_title=title)
+
+    def write_html(self, slides_infos, revealjs_template, path):
+        """Render HTML page (see generate_html) streaming it to path, path is replaced once the page is complete.
+
+        Arguments:
+            slides_infos {[dict]} -- slides (see tool.get_slides_info)
+            revealjs_template {str} -- reveal.js template
+            path {str} -- destination file
+        """
+        template = get_template(revealjs_template)
+        title = slides_infos[0]['title']
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=".html")
+        try:
+            with os.fdopen(fd, "w") as f:
+                for chunk in template.generate(slidesinfos=slides_infos, presentation_title=title):
+                    f.write(chunk)
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
@@ -1,7 +1,50 @@
 import sys
 import os
-from concurrent.futures import ThreadPoolExecutor, wait
-from PIL import Image
+import io
+import re
+import time
+import base64
+import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait
+from PIL import Image, ImageChops, ImageFilter
+from slides2html.metrics import metrics
+from slides2html.store import write_atomic
+
+logger = logging.getLogger(__name__)
+
+# {index}_{page_id}.png
+SLIDE_IMAGE_PATTERN = re.compile(r"^\d+_.+\.png$")
+
+# encoded versions of the slides images are saved in this sub directory (see encode_images)
+VARIANTS_DIR = "variants"
+# max width and height of the inline placeholders (see encode_image)
+PLACEHOLDER_SIZE = 16
+# format: (extension, mime type), in order of preference for <picture> sources.
+FORMATS = {
+    "avif": (".avif", "image/avif"),
+    "webp": (".webp", "image/webp"),
+    "jpeg": (".jpg", "image/jpeg"),
+    "png": (".png", "image/png"),
+}
+
+
+def list_slides_images(destdir):
+    """slides images (not background) of destdir sorted by slide index"""
+    files = [x for x in os.listdir(destdir) if SLIDE_IMAGE_PATTERN.match(x)]
+    return sorted(files, key=lambda k: int(k.split("_")[0]))
+
+
+def image_size(path):
+    """(width, height) of image (path), only reads the image header"""
+    with Image.open(path) as img:
+        return img.size
+
+
+def save_image(img, path, **params):
+    """save img replacing path atomically (path may be a hard link to a shared image)"""
+    tmp = os.path.join(os.path.dirname(path), ".tmp_" + os.path.basename(path))
+    img.save(tmp, **params)
+    os.replace(tmp, path)
 
 
 def resize_image(path, newsize):
@@ -15,21 +58,26 @@ def resize_image(path, newsize):
     """
     img = Image.open(path)
     img.thumbnail(newsize)
-    img.save(path)
+    save_image(img, path)
 
 
-def resize_images(destdir, newsize):
+def resize_images(destdir, newsize, files=None, max_workers=None):
     """resize batch of images in destdir to a new size 
     
     Arguments:
         destdir {str} -- directory of google slides exported images
         newsize {tuple} -- tuple of width, height of the new size
+
+    Keyword Arguments:
+        files {[str]} -- only process these images (names in destdir) (default: all images in destdir)
+        max_workers {int} -- number of threads (default: number of cpus)
     """
 
-    files = [x for x in os.listdir(destdir) if "png" in x and "_" in x and "background_" not in x]
-    files.sort(key=lambda k: int(k.split("_")[0]))
+    if files is None:
+        files = list_slides_images(destdir)
+    files = sorted(files, key=lambda k: int(k.split("_")[0]))
     results = []
-    with ThreadPoolExecutor(max_workers=10) as executor:
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
         for f in files:
             fullpath = os.path.join(destdir, f)
             future = executor.submit(resize_image, fullpath, newsize)
@@ -37,26 +85,49 @@ def resize_images(destdir, newsize):
     wait(results)
 
 
-def to_transparent_background_image(path, newpath):
+def to_transparent_background_image(path, newpath, color=(255, 255, 255), tolerance=0):
     """convert image to image with transparent background
-    
+
+    Opaque pixels matching color (each channel within tolerance) become fully transparent.
+
     Arguments:
         path {str} -- old image
         newpath {str} -- new image
+
+    Keyword Arguments:
+        color {tuple} -- (r, g, b) background color to be made transparent (default: {(255, 255, 255)})
+        tolerance {int} -- max difference per channel from color (default: {0})
     """
 
     img = Image.open(path)
-    img = img.convert("RGBA")
+    img = transparent_background(img, color, tolerance)
+    save_image(img, newpath)
 
-    pixdata = img.load()
 
-    width, height = img.size
-    for y in range(height):
-        for x in range(width):
-            if pixdata[x, y] == (255, 255, 255, 255):
-                pixdata[x, y] = (255, 255, 255, 0)
+def transparent_background(img, color=(255, 255, 255), tolerance=0):
+    """in memory version of to_transparent_background_image
+
+    Arguments:
+        img {Image} -- image
+
+    Keyword Arguments:
+        color {tuple} -- (r, g, b) background color to be made transparent (default: {(255, 255, 255)})
+        tolerance {int} -- max difference per channel from color (default: {0})
+
+    Returns:
+        Image -- RGBA image with transparent background
+    """
+    img = img.convert("RGBA")
 
-    img.save(newpath)
+    red, green, blue, alpha = img.split()
+    # per band lookup tables instead of walking the pixels in python.
+    mask = alpha.point(lambda v: 255 if v == 255 else 0)
+    for band, value in zip((red, green, blue), color):
+        band_mask = band.point(lambda v, value=value: 255 if abs(v - value) <= tolerance else 0)
+        mask = ImageChops.multiply(mask, band_mask)
+    alpha.paste(0, mask=mask)
+    img.putalpha(alpha)
+    return img
 
 
 def layer_image(foregroundimg, backgroundimg):
@@ -71,41 +142,426 @@ def layer_image(foregroundimg, backgroundimg):
     foreground = Image.open(foregroundimg)
 
     background.paste(foreground, (0, 0), foreground)
-    background.save(foregroundimg)
+    save_image(background, foregroundimg)
 
 
-def images_to_transparent_background(destdir):
+def images_to_transparent_background(destdir, files=None, color=(255, 255, 255), tolerance=0, max_workers=None):
     """convert batch of images to transparent background images
     
     Arguments:
         destdir {str} -- path of a directory with google slides exported images
+
+    Keyword Arguments:
+        files {[str]} -- only process these images (names in destdir) (default: all images in destdir)
+        color {tuple} -- (r, g, b) background color to be made transparent (default: {(255, 255, 255)})
+        tolerance {int} -- max difference per channel from color (default: {0})
+        max_workers {int} -- number of threads (default: number of cpus)
     """
 
-    files = [x for x in os.listdir(destdir) if "png" in x and "_" in x and "background_" not in x]
-    files.sort(key=lambda k: int(k.split("_")[0]))
+    if files is None:
+        files = list_slides_images(destdir)
+    files = sorted(files, key=lambda k: int(k.split("_")[0]))
     results = []
-    with ThreadPoolExecutor(max_workers=10) as executor:
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
         for f in files:
             fullpath = os.path.join(destdir, f)
-            future = executor.submit(to_transparent_background_image, fullpath, fullpath)
+            future = executor.submit(to_transparent_background_image, fullpath, fullpath, color, tolerance)
             results.append(future)
     wait(results)
 
 
-def set_background_for_images(destdir, bgpath):
+def set_background_for_images(destdir, bgpath, files=None, max_workers=None):
     """Apply background to all images in destdir
     
     Arguments:
         destdir {str} -- directory with exported google slides as images
         bgpath {str} -- background path
+
+    Keyword Arguments:
+        files {[str]} -- only process these images (names in destdir) (default: all images in destdir)
+        max_workers {int} -- number of threads (default: number of cpus)
     """
 
-    files = [x for x in os.listdir(destdir) if x.endswith("png") and "_" in x and "background_" not in x]
-    files.sort(key=lambda k: int(k.split("_")[0]))
+    if files is None:
+        files = list_slides_images(destdir)
+    files = sorted(files, key=lambda k: int(k.split("_")[0]))
     results = []
-    with ThreadPoolExecutor(max_workers=10) as executor:
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
         for f in files:
             fullpath = os.path.join(destdir, f)
             future = executor.submit(layer_image, fullpath, bgpath)
             results.append(future)
     wait(results)
+
+
+# background decoded once per worker process (see process_images)
+_background = None
+
+
+def _init_worker(background):
+    global _background
+    if background is not None:
+        _background = Image.open(io.BytesIO(background) if isinstance(background, bytes) else background)
+        _background.load()
+
+
+def process_image(path, background=None, color=(255, 255, 255), tolerance=0, newsize=None):
+    """Apply all of the post processing of a slide in a single decode/encode
+
+    Arguments:
+        path {str} -- image path (overwritten)
+
+    Keyword Arguments:
+        background {Image} -- decoded background, slide is made transparent and layered on top of it (default: {None})
+        color {tuple} -- (r, g, b) color of the slide made transparent (default: {(255, 255, 255)})
+        tolerance {int} -- max difference per channel from color (default: {0})
+        newsize {tuple} -- resize to (width, height) (default: {None})
+    """
+    save_image(_apply(Image.open(path), background, color, tolerance, newsize), path)
+
+
+def process_data(data, background=None, color=(255, 255, 255), tolerance=0, newsize=None):
+    """In memory version of process_image
+
+    Arguments:
+        data {bytes} -- encoded image
+
+    Returns:
+        bytes -- processed image as png
+    """
+    img = _apply(Image.open(io.BytesIO(data)), background, color, tolerance, newsize)
+    buf = io.BytesIO()
+    img.save(buf, "PNG")
+    return buf.getvalue()
+
+
+def _apply(img, background, color, tolerance, newsize):
+    if background is not None:
+        foreground = transparent_background(img, color, tolerance)
+        img = background.copy()
+        img.paste(foreground, (0, 0), foreground)
+    if newsize:
+        img.thumbnail(newsize)
+    return img
+
+
+def _process_image(path, color, tolerance, newsize):
+    return _timed(process_image, path, _background, color, tolerance, newsize)
+
+
+def _process_data(data, color, tolerance, newsize):
+    return _timed(process_data, data, _background, color, tolerance, newsize)
+
+
+def _timed(fn, *args):
+    """call fn in a worker process, returns (pid, start, end, result of fn), times to be recorded by the parent (see _record)"""
+    start = time.time()
+    result = fn(*args)
+    return os.getpid(), start, time.time(), result
+
+
+def _submit(executor, limit, fn, *args):
+    """executor.submit(fn, *args) holding limit (e.g Scheduler.transforms shared with other pools) until the work is done"""
+    if limit is None:
+        return executor.submit(fn, *args)
+    limit.acquire()
+    try:
+        future = executor.submit(fn, *args)
+    except Exception:
+        limit.release()
+        raise
+    future.add_done_callback(lambda f: limit.release())
+    return future
+
+
+def _record(name, futures):
+    """record the spans of the finished _timed futures (keyed by file name) and log the failed ones"""
+    for f, future in futures.items():
+        error = future.exception()
+        if error is not None:
+            logger.error("%s of %s failed: %r", name, f, error)
+            metrics.count(name + "_failed")
+            continue
+        pid, start, end, _ = future.result()
+        metrics.add_span(name, start, end, "image", pid=pid, tid=pid, file=f)
+
+
+class ImageProcessor:
+    def __init__(self, bgpath=None, color=(255, 255, 255), tolerance=0, newsize=None, max_workers=None, limit=None):
+        """Process pool applying background and resize to images one at a time (see process_image), e.g as they are downloaded
+
+        Used as a context manager, the worker processes are stopped on exit.
+
+        Keyword Arguments:
+            bgpath {str} -- background path (or encoded image), decoded once per worker (default: {None})
+            color {tuple} -- (r, g, b) color of the slides made transparent (default: {(255, 255, 255)})
+            tolerance {int} -- max difference per channel from color (default: {0})
+            newsize {tuple} -- resize to (width, height) (default: {None})
+            max_workers {int} -- number of worker processes (default: number of cpus)
+            limit {Semaphore} -- held by every image processed e.g Scheduler.transforms shared with other pools (default: {None})
+        """
+        self.color = color
+        self.tolerance = tolerance
+        self.newsize = newsize
+        self.max_workers = max_workers or os.cpu_count()
+        self.limit = limit
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker, initargs=(bgpath,))
+        # workers are started now, not forked later while other threads (e.g downloads of a pipeline) may hold locks.
+        self._executor.submit(int).result()
+
+    def submit(self, path):
+        """Process image path (overwritten) in a worker
+
+        Returns:
+            Future -- (pid, start, end, None) of the processing (see _record)
+        """
+        return _submit(self._executor, self.limit, _process_image, path, self.color, self.tolerance, self.newsize)
+
+    def process(self, path):
+        """Process image path (overwritten), waits until it's done and raises if it failed"""
+        pid, start, end, _ = self.submit(path).result()
+        metrics.add_span("process_image", start, end, "image", pid=pid, tid=pid, file=os.path.basename(path))
+
+    def process_data(self, data, name="memory"):
+        """In memory version of process
+
+        Arguments:
+            data {bytes} -- encoded image
+
+        Keyword Arguments:
+            name {str} -- image name in the spans (default: {"memory"})
+
+        Returns:
+            bytes -- processed image as png
+        """
+        future = _submit(self._executor, self.limit, _process_data, data, self.color, self.tolerance, self.newsize)
+        pid, start, end, processed = future.result()
+        metrics.add_span("process_image", start, end, "image", pid=pid, tid=pid, file=name)
+        return processed
+
+    def encode_data(self, data, filename, formats, quality=80, widths=(), placeholder=False):
+        """Encoded versions of image data in a worker (see encode_data)
+
+        Returns:
+            dict -- encoded versions (bytes) keyed by their names in VARIANTS_DIR
+        """
+        future = _submit(self._executor, self.limit, _timed, encode_data, data, filename, formats, quality, widths, placeholder)
+        pid, start, end, variants = future.result()
+        metrics.add_span("encode_image", start, end, "image", pid=pid, tid=pid, file=filename)
+        return variants
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def process_images(destdir, files=None, bgpath=None, color=(255, 255, 255), tolerance=0, newsize=None, max_workers=None, limit=None):
+    """Apply background and resize to batch of images in destdir using a process pool
+
+    Equivalent to images_to_transparent_background, set_background_for_images then resize_images
+    but every image is decoded and encoded once.
+
+    Arguments:
+        destdir {str} -- directory with exported google slides as images
+
+    Keyword Arguments:
+        files {[str]} -- only process these images (names in destdir) (default: all images in destdir)
+        bgpath {str} -- background path (default: {None})
+        color {tuple} -- (r, g, b) color of the slides made transparent (default: {(255, 255, 255)})
+        tolerance {int} -- max difference per channel from color (default: {0})
+        newsize {tuple} -- resize to (width, height) (default: {None})
+        max_workers {int} -- number of worker processes (default: number of cpus)
+        limit {Semaphore} -- held by every image processed e.g Scheduler.transforms (default: {None})
+    """
+
+    if bgpath is None and not newsize:
+        return
+    if files is None:
+        files = list_slides_images(destdir)
+    files = sorted(files, key=lambda k: int(k.split("_")[0]))
+    if not files:
+        return
+    with ImageProcessor(bgpath, color, tolerance, newsize, max_workers, limit) as processor:
+        results = {f: processor.submit(os.path.join(destdir, f)) for f in files}
+        wait(results.values())
+    _record("process_image", results)
+
+
+def check_formats(formats):
+    """Raise if any of formats is unknown or not supported by the installed Pillow"""
+    for fmt in formats:
+        if fmt not in FORMATS:
+            raise ValueError("invalid format {} should be one of {}".format(fmt, list(FORMATS)))
+    if "avif" in formats and ".avif" not in Image.registered_extensions():
+        try:
+            import pillow_avif  # noqa: F401
+        except ImportError:
+            raise RuntimeError("avif isn't supported by the installed Pillow: pip install pillow-avif-plugin")
+
+
+def variant_name(filename, fmt, width=None):
+    """name of the fmt encoded version of slide image filename (in VARIANTS_DIR), resized to width if given"""
+    base = os.path.splitext(filename)[0]
+    if width:
+        base += ".w{}".format(width)
+    return base + FORMATS[fmt][0]
+
+
+def placeholder_name(filename):
+    """name of the placeholder (data uri) of slide image filename (in VARIANTS_DIR)"""
+    return os.path.splitext(filename)[0] + ".placeholder"
+
+
+def fallback_format(formats):
+    """format of the <img> fallback for formats, None for the exported image itself"""
+    for fmt in ("png", "jpeg"):
+        if fmt in formats:
+            return fmt
+    return None
+
+
+def _encoded(img, fmt, quality):
+    """img encoded as fmt (bytes)"""
+    buf = io.BytesIO()
+    if fmt == "webp":
+        img.save(buf, "WEBP", quality=quality, method=6)
+    elif fmt == "avif":
+        img.save(buf, "AVIF", quality=quality)
+    elif fmt == "jpeg":
+        rgb = img
+        if img.mode in ("RGBA", "LA", "P"):
+            rgb = Image.new("RGB", img.size, (255, 255, 255))
+            rgb.paste(img, (0, 0), img.convert("RGBA"))
+        rgb.convert("RGB").save(buf, "JPEG", quality=quality, progressive=True, optimize=True)
+    elif fmt == "png":
+        # fast octree also handles RGBA images.
+        quantized = img.quantize(colors=256, method=2) if img.mode == "RGBA" else img.convert("RGB").quantize(colors=256)
+        quantized.save(buf, "PNG", optimize=True)
+    return buf.getvalue()
+
+
+def encode_variants(img, filename, formats, quality=80, widths=(), placeholder=False):
+    """Encoded versions of image img (see encode_image)
+
+    Arguments:
+        img {Image} -- image
+        filename {str} -- image file name, the versions are named after it (see variant_name, placeholder_name)
+        formats {[str]} -- formats of FORMATS
+
+    Keyword Arguments:
+        quality {int} -- quality of the lossy formats (default: {80})
+        widths {[int]} -- also encode versions resized to these widths (smaller than the image) (default: {()})
+        placeholder {bool} -- also a tiny blurred version of the image as data uri (default: {False})
+
+    Returns:
+        dict -- encoded versions (bytes) keyed by their names in VARIANTS_DIR
+    """
+    if "avif" in formats:
+        check_formats(formats)  # registers the avif plugin in the worker process
+    img.load()
+    width, height = img.size
+    variants = {}
+
+    for fmt in formats:
+        variants[variant_name(filename, fmt)] = _encoded(img, fmt, quality)
+    for w in sorted(set(widths)):
+        if w >= width:
+            continue
+        resized = img.resize((w, max(1, round(height * w / width))), Image.LANCZOS)
+        for fmt in formats:
+            variants[variant_name(filename, fmt, w)] = _encoded(resized, fmt, quality)
+        if fallback_format(formats) is None:
+            buf = io.BytesIO()
+            resized.save(buf, "PNG")
+            variants[variant_name(filename, "png", w)] = buf.getvalue()
+
+    if placeholder:
+        # the blur filter needs an 8 bits per channel image, not e.g a palette or 16 bits png.
+        has_alpha = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+        tiny = img.convert("RGBA" if has_alpha else "RGB")
+        tiny.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+        tiny = tiny.filter(ImageFilter.GaussianBlur(1))
+        buf = io.BytesIO()
+        tiny.save(buf, "PNG", optimize=True)
+        variants[placeholder_name(filename)] = ("data:image/png;base64," + base64.b64encode(buf.getvalue()).decode()).encode()
+    return variants
+
+
+def encode_image(path, formats, quality=80, widths=(), placeholder=False):
+    """Save encoded versions of image (path) in VARIANTS_DIR next to it, the image itself is kept as is.
+
+    Arguments:
+        path {str} -- image path
+        formats {[str]} -- formats of FORMATS: png is quantized and optimized, jpeg is progressive.
+
+    Keyword Arguments:
+        quality {int} -- quality of the lossy formats (default: {80})
+        widths {[int]} -- also save versions resized to these widths (smaller than the image) for srcset,
+                          as plain png if formats have no png or jpeg fallback (default: {()})
+        placeholder {bool} -- save a tiny blurred version of the image as data uri (see placeholder_name) (default: {False})
+    """
+    outdir = os.path.join(os.path.dirname(path), VARIANTS_DIR)
+    for name, data in encode_variants(Image.open(path), os.path.basename(path), formats, quality, widths, placeholder).items():
+        write_atomic(os.path.join(outdir, name), data)
+
+
+def encode_data(data, filename, formats, quality=80, widths=(), placeholder=False):
+    """In memory version of encode_image: encoded versions of image data (bytes) named after filename (see encode_variants)"""
+    return encode_variants(Image.open(io.BytesIO(data)), filename, formats, quality, widths, placeholder)
+
+
+def encode_images(destdir, formats, files=None, current=None, quality=80, widths=(), placeholder=False, max_workers=None, limit=None):
+    """Save encoded versions of batch of images of destdir (see encode_image) using a process pool
+
+    Images missing any of the encoded versions are encoded as well, encoded versions of images that are no longer in destdir are removed.
+
+    Arguments:
+        destdir {str} -- directory with exported google slides as images
+        formats {[str]} -- formats of FORMATS
+
+    Keyword Arguments:
+        files {[str]} -- only encode these images (names in destdir) (default: all images in destdir)
+        current {[str]} -- all of the images of destdir e.g from the slides index (default: listed from destdir)
+        quality {int} -- quality of the lossy formats (default: {80})
+        widths {[int]} -- also save versions resized to these widths for srcset (default: {()})
+        placeholder {bool} -- save tiny placeholders of the images (default: {False})
+        max_workers {int} -- number of worker processes (default: number of cpus)
+        limit {Semaphore} -- held by every image encoded e.g Scheduler.transforms (default: {None})
+    """
+    if not formats and not widths and not placeholder:
+        return
+    check_formats(formats)
+    outdir = os.path.join(destdir, VARIANTS_DIR)
+    os.makedirs(outdir, exist_ok=True)
+
+    if current is None:
+        current = list_slides_images(destdir)
+    widths_formats = list(formats) if fallback_format(formats) else list(formats) + ["png"]
+    # versions expected for every image, resized versions only exist for images wider than the width.
+    required = {f: [variant_name(f, fmt) for fmt in formats] + ([placeholder_name(f)] if placeholder else []) for f in current}
+    wanted = {name for names in required.values() for name in names}
+    wanted |= {variant_name(f, fmt, w) for f in current for fmt in widths_formats for w in widths}
+    existing = set(os.listdir(outdir))
+    for f in existing - wanted:
+        os.remove(os.path.join(outdir, f))
+
+    if files is None:
+        files = current
+    missing = [f for f in current if any(name not in existing for name in required[f])]
+    files = sorted(set(files) | set(missing), key=lambda k: int(k.split("_")[0]))
+    if not files:
+        return
+    results = {}
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        for f in files:
+            fullpath = os.path.join(destdir, f)
+            future = _submit(executor, limit, _timed, encode_image, fullpath, formats, quality, widths, placeholder)
+            results[f] = future
+    wait(results.values())
+    _record("encode_image", results)
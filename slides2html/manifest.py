@@ -0,0 +1,209 @@
+import os
+import re
+import json
+import hashlib
+
+MANIFEST_FILENAME = "manifest.json"
+
+# slide images are saved as {index}_{page_id}.png (sidecar {index}_{page_id}.png.meta notes files of older builds are removed too)
+SLIDE_FILE_PATTERN = re.compile(r"^\d+_.+\.png(\.meta)?$")
+LINK_PATTERN = re.compile(r"https?://\S+")
+
+# image properties set once the images are post processed (see Manifest.set_image)
+IMAGE_KEYS = ('width', 'height', 'digest', 'source')
+
+
+def extract_links(notes):
+    """Links of speaker notes text"""
+    return LINK_PATTERN.findall(notes)
+
+
+def slide_elements_hash(slide):
+    """Hash of the content of a slide resource (as returned by presentations().get) that affects its image"""
+    slide_properties = slide.get('slideProperties', {})
+    content = {
+        'pageElements': slide.get('pageElements', []),
+        'pageProperties': slide.get('pageProperties', {}),
+        'layoutObjectId': slide_properties.get('layoutObjectId'),
+        'masterObjectId': slide_properties.get('masterObjectId'),
+    }
+    return hashlib.sha1(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+def slide_fingerprint(slide, thumbnailsize, options=None):
+    """Fingerprint of everything that affects the rendered image of a slide.
+
+    Arguments:
+        slide {dict} -- parsed slide (objectId and elements hash, see downloader.parse_presentation)
+        thumbnailsize {str} -- thumbnail size (MEDIUM, LARGE) or EXPORT for export urls
+
+    Keyword Arguments:
+        options {dict} -- post processing options applied to the image (default: {None})
+
+    Returns:
+        dict -- fingerprint of the slide
+    """
+    return {
+        'objectId': slide['objectId'],
+        'elements': slide['elements'],
+        'thumbnailsize': thumbnailsize,
+        'options': options or {},
+    }
+
+
+class Manifest:
+    def __init__(self, destdir, options=None):
+        """Per presentation index of the slides (ordered files, notes, links, dimensions and hashes of the images),
+        written by every build and used by the later stages instead of scanning the presentation directory.
+        Fingerprints of the slides are used for incremental rebuilds.
+
+        Arguments:
+            destdir {str} -- presentation directory (where the slides images are saved)
+
+        Keyword Arguments:
+            options {dict} -- post processing options of the current build (default: {None})
+        """
+        self.destdir = destdir
+        self.path = os.path.join(destdir, MANIFEST_FILENAME)
+        self.options = options or {}
+        self.revision_id = None
+        self.title = None
+        self.slides = []
+
+    @classmethod
+    def load(cls, destdir, options=None):
+        manifest = cls(destdir, options)
+        if os.path.exists(manifest.path):
+            with open(manifest.path) as f:
+                try:
+                    data = json.load(f)
+                except ValueError:  # corrupted manifest, rebuild everything.
+                    data = {}
+            manifest.revision_id = data.get('revision_id')
+            manifest.title = data.get('title')
+            manifest.slides = data.get('slides', [])
+        return manifest
+
+    def fingerprint(self, slide, thumbnailsize):
+        return slide_fingerprint(slide, thumbnailsize, self.options)
+
+    def files(self):
+        """Slides images file names in presentation order"""
+        return [slide['file'] for slide in self.slides]
+
+    def get(self, filename):
+        """Index entry of slide image filename (None if not in the index)"""
+        for slide in self.slides:
+            if slide['file'] == filename:
+                return slide
+        return None
+
+    def set_slides(self, revision_id, slides):
+        """Replace the slides of the index, all of their images need to be downloaded.
+
+        Arguments:
+            revision_id {str} -- presentation revisionId
+            slides [dict] -- file, fingerprint, notes and links of the current slides of the presentation
+        """
+        self.revision_id = revision_id
+        self.slides = [dict(slide) for slide in slides]
+
+    def set_image(self, filename, width, height, digest, source=None):
+        """Set dimensions, content hash and source (export or thumbnail, see Downloader.slide_urls) of the (post processed) image of slide filename"""
+        slide = self.get(filename)
+        if slide is not None:
+            slide.update({'width': width, 'height': height, 'digest': digest})
+            if source is not None:
+                slide['source'] = source
+
+    def is_uptodate(self, revision_id, thumbnailsize=None):
+        """Check if the previous build is still valid for presentation revision (revision_id)
+
+        Arguments:
+            revision_id {str} -- presentation revisionId
+
+        Keyword Arguments:
+            thumbnailsize {str} -- images size of the current build (MEDIUM, LARGE or EXPORT, see slide_fingerprint) (default: {None})
+
+        Returns:
+            bool -- True if nothing changed since the previous build.
+        """
+        if not revision_id or revision_id != self.revision_id or not self.slides:
+            return False
+        for slide in self.slides:
+            if slide['fingerprint']['options'] != self.options:
+                return False
+            if thumbnailsize is not None and slide['fingerprint'].get('thumbnailsize') != thumbnailsize:
+                return False
+            if 'digest' not in slide or not os.path.exists(os.path.join(self.destdir, slide['file'])):
+                return False
+        return True
+
+    def sync(self, revision_id, slides):
+        """Reuse unchanged slides images, remove stale ones and return slides that need to be downloaded.
+
+        Slides that only moved in the presentation are renamed instead of being downloaded again.
+
+        Arguments:
+            revision_id {str} -- presentation revisionId
+            slides [dict] -- file, fingerprint, notes and links of the current slides of the presentation
+
+        Returns:
+            set -- file names (save_as) that need to be downloaded.
+        """
+        previous = {}
+        for slide in self.slides:
+            # without a digest the post processing of the image didn't finish (failed or interrupted build), it's downloaded again.
+            if 'digest' in slide and os.path.exists(os.path.join(self.destdir, slide['file'])):
+                previous[slide['file']] = slide
+        previous_by_fingerprint = {json.dumps(slide['fingerprint'], sort_keys=True): f for f, slide in previous.items()}
+
+        to_fetch = set()
+        renames = []
+        index = []
+        for slide in slides:
+            save_as = slide['file']
+            entry = dict(slide)
+            index.append(entry)
+            if save_as in previous and previous[save_as]['fingerprint'] == slide['fingerprint']:
+                old = save_as
+            else:
+                old = previous_by_fingerprint.get(json.dumps(slide['fingerprint'], sort_keys=True))
+                if old is None:
+                    to_fetch.add(save_as)
+                    continue
+                renames.append((old, save_as))
+            # reused images keep their dimensions and hash.
+            entry.update({key: previous[old][key] for key in IMAGE_KEYS if key in previous[old]})
+
+        # two phases so renames chains (a -> b, b -> c) don't overwrite each other.
+        staged = []
+        for old, new in renames:
+            tmp = ".rename_" + new
+            os.replace(os.path.join(self.destdir, old), os.path.join(self.destdir, tmp))
+            staged.append((tmp, new))
+        for tmp, new in staged:
+            os.replace(os.path.join(self.destdir, tmp), os.path.join(self.destdir, new))
+
+        current = {slide['file'] for slide in slides}
+        for f in os.listdir(self.destdir):
+            if not SLIDE_FILE_PATTERN.match(f):
+                continue
+            image = f[:-len(".meta")] if f.endswith(".meta") else f
+            # stale slides and outdated images (downloader doesn't overwrite existing files)
+            if image not in current or image in to_fetch:
+                os.remove(os.path.join(self.destdir, f))
+
+        self.revision_id = revision_id
+        self.slides = index
+        return to_fetch
+
+    def dumps(self):
+        """Index as saved in the manifest file (json)"""
+        return json.dumps({'title': self.title, 'revision_id': self.revision_id, 'slides': self.slides}, separators=(",", ":"))
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(self.dumps())
+        os.replace(tmp, self.path)
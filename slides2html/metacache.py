@@ -0,0 +1,81 @@
+import os
+import json
+import tempfile
+import threading
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class MetadataCache:
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        """On disk cache of parsed presentations (title, revision, slides and notes) keyed by presentation id.
+
+        Least recently used entries are evicted when the cache grows over max_bytes.
+        Entries must be validated against the current presentation revision before being used.
+
+        Arguments:
+            directory {str} -- cache directory
+
+        Keyword Arguments:
+            max_bytes {int} -- max size of the cache on disk (default: {DEFAULT_MAX_BYTES})
+        """
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _path(self, presentation_id):
+        return os.path.join(self.directory, presentation_id + ".json")
+
+    def get(self, presentation_id):
+        """Cached presentation (None if not cached)
+
+        Arguments:
+            presentation_id {str} -- presentation id
+
+        Returns:
+            dict -- parsed presentation (see downloader.parse_presentation)
+        """
+        path = self._path(presentation_id)
+        try:
+            with open(path) as f:
+                presentation = json.load(f)
+        except (OSError, ValueError):
+            return None
+        os.utime(path)  # mtime is the last use for the LRU eviction.
+        return presentation
+
+    def put(self, presentation_id, presentation):
+        """Cache presentation
+
+        Arguments:
+            presentation_id {str} -- presentation id
+            presentation {dict} -- parsed presentation (see downloader.parse_presentation)
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(presentation, f)
+        os.replace(tmp, self._path(presentation_id))
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in self.max_bytes"""
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.endswith(".json"):
+                    continue
+                try:
+                    st = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, name))
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+                total -= size
@@ -0,0 +1,146 @@
+"""
+Timings and counters of the builds (enabled by --profile).
+
+Stages and network calls are recorded as spans with `with metrics.span("download_image", file=...)`, counters with
+`metrics.count("bytes_downloaded", n)`. Recorded spans feed latency histograms and can be exported as a json summary
+and as a Chrome trace (chrome://tracing, https://ui.perfetto.dev).
+Nothing is recorded until metrics.enable() is called.
+"""
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from collections import defaultdict
+
+# upper bounds in milliseconds of the latency histograms buckets (the last bucket is unbounded).
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+def percentile(values, p):
+    """p-th percentile of sorted values"""
+    if not values:
+        return None
+    k = min(len(values) - 1, max(0, int(round(p / 100.0 * (len(values) - 1)))))
+    return values[k]
+
+
+def histogram(durations):
+    """summary and buckets of durations in seconds"""
+    values = sorted(durations)
+    buckets = [0] * (len(BUCKETS_MS) + 1)
+    for value in values:
+        ms = value * 1000
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                buckets[i] += 1
+                break
+        else:
+            buckets[-1] += 1
+    labels = ["<={}ms".format(bound) for bound in BUCKETS_MS] + [">{}ms".format(BUCKETS_MS[-1])]
+    return {
+        'count': len(values),
+        'total': round(sum(values), 6),
+        'min': round(values[0], 6) if values else None,
+        'mean': round(sum(values) / len(values), 6) if values else None,
+        'p50': round(percentile(values, 50), 6) if values else None,
+        'p90': round(percentile(values, 90), 6) if values else None,
+        'p99': round(percentile(values, 99), 6) if values else None,
+        'max': round(values[-1], 6) if values else None,
+        'buckets': {label: n for label, n in zip(labels, buckets) if n},
+    }
+
+
+class Metrics:
+    def __init__(self):
+        """Thread safe recorder of spans, counters and latencies"""
+        self.enabled = False
+        self._lock = threading.Lock()
+        self.reset()
+
+    def enable(self):
+        self.enabled = True
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.events = []
+            self.counters = defaultdict(int)
+            self.latencies = defaultdict(list)
+
+    @contextmanager
+    def span(self, name, cat="stage", **args):
+        """Record the duration of the block as span name
+
+        Arguments:
+            name {str} -- span name, spans of the same name make a latency histogram
+
+        Keyword Arguments:
+            cat {str} -- category e.g stage, api, network, image (default: {"stage"})
+            args -- shown with the span in the trace e.g file name
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_span(name, start, time.time(), cat, **args)
+
+    def add_span(self, name, start, end, cat="stage", pid=None, tid=None, **args):
+        """Record span name from start to end (time.time()), e.g measured in a worker process (pid)"""
+        if not self.enabled:
+            return
+        event = {'name': name, 'cat': cat, 'start': start, 'end': end, 'pid': pid or os.getpid(), 'tid': tid or threading.get_ident(),
+                 'args': args}
+        with self._lock:
+            self.events.append(event)
+            self.latencies[name].append(end - start)
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] += value
+
+    def summary(self):
+        """Counters and latency histograms (seconds) of every span name
+
+        Returns:
+            dict -- wall_seconds, counters and latencies
+        """
+        with self._lock:
+            return {
+                'wall_seconds': round(time.time() - self.started, 6),
+                'counters': dict(self.counters),
+                'latencies': {name: histogram(durations) for name, durations in sorted(self.latencies.items())},
+            }
+
+    def trace(self):
+        """Recorded spans in Chrome trace event format"""
+        with self._lock:
+            events = list(self.events)
+        trace_events = [{'name': event['name'], 'cat': event['cat'], 'ph': "X",
+                         'ts': round((event['start'] - self.started) * 1e6), 'dur': round((event['end'] - event['start']) * 1e6),
+                         'pid': event['pid'], 'tid': event['tid'], 'args': event['args']} for event in events]
+        return {'traceEvents': trace_events, 'displayTimeUnit': "ms"}
+
+    def write(self, directory):
+        """Write summary.json and trace.json (Chrome trace) to directory
+
+        Returns:
+            (str, str) -- summary and trace paths
+        """
+        os.makedirs(directory, exist_ok=True)
+        summary_path = os.path.join(directory, "summary.json")
+        trace_path = os.path.join(directory, "trace.json")
+        with open(summary_path, "w") as f:
+            json.dump(self.summary(), f, indent=1)
+        with open(trace_path, "w") as f:
+            json.dump(self.trace(), f)
+        return summary_path, trace_path
+
+
+metrics = Metrics()
@@ -0,0 +1,154 @@
+"""
+Staged pipeline connected by bounded queues.
+
+Every stage has its worker threads and a bounded input queue, a stage blocks when the next one is behind (backpressure)
+and items are only admitted while fewer than the in-flight limit are between the first and the last stage,
+so the work queued at once stays the same whatever the number of items e.g slides of a deck:
+
+    pipeline = Pipeline([Stage("download", download, workers=10), Stage("index", index)], inflight=threading.Semaphore(64))
+    indexed = pipeline.run(resolved_urls)
+
+Items are consumed lazily from the source iterable, a stage returning None drops the item.
+"""
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+from slides2html.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class Budget:
+    def __init__(self, limit=None):
+        """Weighted limit e.g on the bytes of the images decoded at once, shared by the pipelines of a process
+
+        An item heavier than the whole limit is let through alone so it can't block forever.
+
+        Keyword Arguments:
+            limit {int} -- max total weight held at once (default: unbounded)
+        """
+        self.limit = limit
+        self.used = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def hold(self, amount):
+        if not self.limit:
+            yield
+            return
+        with self._condition:
+            while self.used and self.used + amount > self.limit:
+                self._condition.wait()
+            self.used += amount
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.used -= amount
+                self._condition.notify_all()
+
+
+class Stage:
+    def __init__(self, name, fn, workers=1, weight=None, budget=None):
+        """Step of a Pipeline
+
+        Arguments:
+            name {str} -- stage name, failures are counted as {name}_failed
+            fn {callable} -- fn(item) returns the item passed to the next stage, None to drop it
+
+        Keyword Arguments:
+            workers {int} -- threads running fn (default: {1})
+            weight {callable} -- weight(item) of budget held while fn runs (default: {None})
+            budget {Budget} -- budget shared with other stages or pipelines (default: {None})
+        """
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.weight = weight
+        self.budget = budget
+
+    def __call__(self, item):
+        if self.budget is None or self.weight is None:
+            return self.fn(item)
+        with self.budget.hold(self.weight(item)):
+            return self.fn(item)
+
+
+class Pipeline:
+    def __init__(self, stages, inflight=None, queue_size=None):
+        """Stages run concurrently, connected by bounded queues
+
+        Arguments:
+            stages {[Stage]} -- stages in order
+
+        Keyword Arguments:
+            inflight {Semaphore} -- held by every item from its admission until it leaves the pipeline,
+                                    can be shared by pipelines e.g Scheduler.images (default: unbounded)
+            queue_size {int} -- size of the input queue of a stage (default: twice its workers)
+        """
+        self.stages = stages
+        self.inflight = inflight
+        self.queue_size = queue_size
+
+    def run(self, items):
+        """Feed items through the stages, waits until every item left the pipeline
+
+        Arguments:
+            items {iterable} -- source, consumed as the pipeline admits items
+
+        Returns:
+            list -- outputs of the last stage (completion order)
+        """
+        queues = [queue.Queue(maxsize=self.queue_size or 2 * stage.workers) for stage in self.stages]
+        outputs = []
+        outputs_lock = threading.Lock()
+
+        def leave():
+            if self.inflight is not None:
+                self.inflight.release()
+
+        def work(i):
+            stage = self.stages[i]
+            while True:
+                item = queues[i].get()
+                if item is _DONE:
+                    return
+                try:
+                    result = stage(item)
+                except Exception as e:
+                    logger.error("%s of %r failed: %r", stage.name, item, e)
+                    metrics.count(stage.name + "_failed")
+                    result = None
+                if result is None:
+                    leave()
+                elif i + 1 < len(self.stages):
+                    queues[i + 1].put(result)
+                else:
+                    with outputs_lock:
+                        outputs.append(result)
+                    leave()
+
+        threads = []
+        for i, stage in enumerate(self.stages):
+            stage_threads = [threading.Thread(target=work, args=(i,), name="{}-{}".format(stage.name, n), daemon=True)
+                             for n in range(stage.workers)]
+            for thread in stage_threads:
+                thread.start()
+            threads.append(stage_threads)
+
+        try:
+            for item in items:
+                if self.inflight is not None:
+                    self.inflight.acquire()
+                queues[0].put(item)
+        finally:
+            # a stage is done once the previous one is done and its queue is drained.
+            for i, stage in enumerate(self.stages):
+                for _ in range(stage.workers):
+                    queues[i].put(_DONE)
+                for thread in threads[i]:
+                    thread.join()
+        return outputs
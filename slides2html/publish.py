@@ -0,0 +1,163 @@
+"""
+Deploy ready copy of built presentations (--publish).
+
+The slides images and their encoded versions are linked (copied across filesystems) under content hashed names
+e.g deck/00_p0.1b2c3d4e5f.png so they can be served with long lived immutable cache headers, and the references of the html
+are rewritten to them. The html and the other text assets get precompressed versions (.gz, .br with brotli installed) to be served as is.
+An assets manifest ({indexfile}.assets.json) lists the published files and what changed since the previous publish,
+so uploads only sync the delta:
+
+    {"html": "deck.html",
+     "files": {"deck.html": {"sha256": "...", "size": 5321, "immutable": false},
+               "deck.html.gz": {"sha256": "...", "size": 1210, "immutable": false, "encoding": "gz", "original": "deck.html"},
+               "deck/00_p0.1b2c3d4e5f.png": {"sha256": "...", "size": 48211, "immutable": true}},
+     "changed": ["deck.html", "deck.html.gz"],
+     "removed": ["deck/00_p0.9a8b7c6d5e.png"]}
+
+Removed files are deleted from the publish directory, the uploader decides when to delete them remotely
+(pages cached with the previous html still use them).
+"""
+import io
+import os
+import re
+import json
+import gzip
+import hashlib
+import logging
+import posixpath
+from slides2html.store import file_digest, link_file, write_atomic
+from slides2html.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# compression: extension of the precompressed files.
+COMPRESSIONS = {"gz": ".gz", "br": ".br"}
+TEXT_EXTENSIONS = (".html", ".css", ".js", ".json", ".svg", ".txt", ".xml")
+HASH_LENGTH = 10
+ASSETS_SUFFIX = ".assets.json"
+
+
+def check_compressions(compressions):
+    """Raise if any of compressions is unknown or its module isn't installed"""
+    for compression in compressions:
+        if compression not in COMPRESSIONS:
+            raise ValueError("invalid compression {} should be one of {}".format(compression, list(COMPRESSIONS)))
+    if "br" in compressions:
+        try:
+            import brotli  # noqa: F401
+        except ImportError:
+            raise RuntimeError("br compression requires brotli: pip install brotli")
+
+
+def hashed_name(name, digest):
+    """name of file name with its content hash (digest) before the extension e.g 00_p0.1b2c3d4e5f.png"""
+    base, ext = os.path.splitext(name)
+    return "{}.{}{}".format(base, digest[:HASH_LENGTH], ext)
+
+
+def compress(data, compression):
+    """data compressed with compression (gz or br) at the max level, the output only depends on data"""
+    if compression == "gz":
+        # gzip.compress only takes mtime from python 3.8.
+        buf = io.BytesIO()
+        with gzip.GzipFile(fileobj=buf, mode="wb", compresslevel=9, mtime=0) as f:
+            f.write(data)
+        return buf.getvalue()
+    import brotli
+    return brotli.compress(data, quality=11)
+
+
+def assets_path(publishdir, htmlname):
+    """path of the assets manifest of html file name htmlname published in publishdir"""
+    return os.path.join(publishdir, os.path.splitext(htmlname)[0] + ASSETS_SUFFIX)
+
+
+def load_assets(path):
+    """assets manifest of the previous publish, empty if there is none (or it's corrupted)"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        try:
+            return json.load(f)
+        except ValueError:
+            return {}
+
+
+def publish(htmlfile, destdir, publishdir, compressions=("gz",), manifest=None):
+    """Publish the html of a built presentation and the images it references to publishdir (see module docstring)
+
+    Arguments:
+        htmlfile {str} -- generated html of the presentation
+        destdir {str} -- presentation directory (images referenced by the html as ./{basename of destdir}/...)
+        publishdir {str} -- publish directory, the html and the presentation directory keep their names and relative location
+
+    Keyword Arguments:
+        compressions {[str]} -- precompressed versions of the text assets, gz and/or br (default: {("gz",)})
+        manifest {Manifest} -- slides index of the build, its images digests save hashing them again (default: {None})
+
+    Returns:
+        dict -- assets manifest
+    """
+    check_compressions(compressions)
+    dirname = os.path.basename(os.path.normpath(destdir))
+    htmlname = os.path.basename(htmlfile)
+    path = assets_path(publishdir, htmlname)
+    previous = load_assets(path).get('files', {})
+    digests = {slide['file']: slide.get('digest') for slide in manifest.slides} if manifest is not None else {}
+    files = {}
+
+    def add_compressed(published, data, digest, immutable):
+        for compression in compressions:
+            name = published + COMPRESSIONS[compression]
+            target = os.path.join(publishdir, *name.split("/"))
+            entry = previous.get(name)
+            # unchanged original: the precompressed file of the previous publish is still valid.
+            if entry is not None and previous.get(published, {}).get('sha256') == digest and os.path.exists(target):
+                files[name] = entry
+                continue
+            compressed = compress(data, compression)
+            if len(compressed) >= len(data):
+                continue
+            write_atomic(target, compressed)
+            files[name] = {'sha256': hashlib.sha256(compressed).hexdigest(), 'size': len(compressed), 'immutable': immutable,
+                           'encoding': compression, 'original': published}
+
+    with open(htmlfile) as f:
+        html = f.read()
+    pattern = re.compile(r"(?<![\w./])\./{}/([^\"'\s,]+)".format(re.escape(dirname)))
+    urls = {}
+    for name in sorted(set(pattern.findall(html))):
+        src = os.path.join(destdir, *name.split("/"))
+        if not os.path.isfile(src):
+            logger.warning("%s references missing %s", htmlfile, src)
+            continue
+        digest = digests.get(name) or file_digest(src)
+        published = posixpath.join(dirname, posixpath.dirname(name), hashed_name(posixpath.basename(name), digest))
+        target = os.path.join(publishdir, *published.split("/"))
+        if not os.path.exists(target):
+            link_file(src, target)
+        files[published] = {'sha256': digest, 'size': os.path.getsize(src), 'immutable': True}
+        urls[name] = "./" + published
+        if compressions and name.endswith(TEXT_EXTENSIONS):
+            with open(src, "rb") as f:
+                add_compressed(published, f.read(), digest, True)
+
+    data = pattern.sub(lambda m: urls.get(m.group(1), m.group(0)), html).encode()
+    digest = hashlib.sha256(data).hexdigest()
+    if previous.get(htmlname, {}).get('sha256') != digest or not os.path.exists(os.path.join(publishdir, htmlname)):
+        write_atomic(os.path.join(publishdir, htmlname), data)
+    files[htmlname] = {'sha256': digest, 'size': len(data), 'immutable': False}
+    add_compressed(htmlname, data, digest, False)
+
+    changed = sorted(name for name, entry in files.items() if previous.get(name, {}).get('sha256') != entry['sha256'])
+    removed = sorted(name for name in previous if name not in files)
+    for name in removed:
+        target = os.path.join(publishdir, *name.split("/"))
+        if os.path.exists(target):
+            os.remove(target)
+    assets = {'html': htmlname, 'files': files, 'changed': changed, 'removed': removed}
+    write_atomic(path, json.dumps(assets, indent=1, sort_keys=True).encode())
+    metrics.count("published_changed", len(changed))
+    metrics.count("published_bytes", sum(files[name]['size'] for name in changed))
+    logger.info("published %s to %s (%s files, %s changed, %s removed)", htmlname, publishdir, len(files), len(changed), len(removed))
+    return assets
@@ -20,6 +20,13 @@ BASIC_TEMPLATE = """
     <!-- Theme used for syntax highlighting of code -->
     <link rel="stylesheet" href="lib/css/zenburn.css">
 
+    <!-- Preload the first slides images -->
+    {% for slideinfo in slidesinfos if slideinfo['preload'] %}
+    <link rel="preload" as="image" href="{{slideinfo['preload']['href']}}"
+        {%- if slideinfo['preload']['srcset'] %} imagesrcset="{{slideinfo['preload']['srcset']}}" imagesizes="100vw"{% endif %}
+        {%- if slideinfo['preload']['type'] %} type="{{slideinfo['preload']['type']}}"{% endif %}>
+    {% endfor %}
+
     <!-- Printing and PDF exports -->
     <script>
         var link = document.createElement('link');
@@ -78,6 +85,30 @@ BASIC_TEMPLATE = """
             ],
             showNotes: true
         });
+
+        // reveal.js lazy loads <img data-src>, slides images with encoded or resized versions (<picture>, srcset)
+        // are loaded here so the browser picks a source before fetching the fallback image (or placeholder).
+        function loadPictures(slide) {
+            if (!slide) return;
+            var sources = slide.querySelectorAll('[data-srcset]');
+            for (var i = 0; i < sources.length; i++) {
+                sources[i].setAttribute('srcset', sources[i].getAttribute('data-srcset'));
+                sources[i].removeAttribute('data-srcset');
+            }
+            var images = slide.querySelectorAll('img[data-lazy-src]');
+            for (var j = 0; j < images.length; j++) {
+                images[j].setAttribute('src', images[j].getAttribute('data-lazy-src'));
+                images[j].removeAttribute('data-lazy-src');
+            }
+        }
+
+        function loadNearbyPictures(event) {
+            loadPictures(event.currentSlide);
+            loadPictures(event.currentSlide.previousElementSibling);
+            loadPictures(event.currentSlide.nextElementSibling);
+        }
+        Reveal.addEventListener('ready', loadNearbyPictures);
+        Reveal.addEventListener('slidechanged', loadNearbyPictures);
     </script>
 </body>
 
@@ -0,0 +1,174 @@
+import os
+import time
+import logging
+import threading
+from slides2html.pipeline import Budget
+from slides2html.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# statuses of servers asking clients to slow down.
+PUSHBACK_STATUSES = (429, 503)
+
+
+class _Unbounded:
+    def acquire(self, blocking=True, timeout=None):
+        return True
+
+    def release(self):
+        pass
+
+    def success(self, latency=None):
+        pass
+
+    def backoff(self, reason="pushback"):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class AdaptiveLimit:
+    def __init__(self, maximum, minimum=1, initial=None, decrease=0.5, latency_factor=3.0, latency_slack=0.1, cooldown=1.0,
+                 name="limit"):
+        """Limit on concurrent work adapted to the pushback of a server (AIMD), used like a semaphore
+
+        The limit grows by one every `limit` successes while it's reached (additive increase)
+        and is multiplied by decrease (multiplicative decrease) when the server pushes back:
+        429/503 statuses, timeouts or a latency rising above latency_factor times its baseline (and latency_slack above it).
+        Decreases are at most once per round trip (average latency, cooldown until one is known),
+        the requests in flight when the server pushed back likely get the same answer.
+        With minimum == maximum the limit is fixed.
+
+        Arguments:
+            maximum {int} -- max concurrent work
+
+        Keyword Arguments:
+            minimum {int} -- min concurrent work (default: {1})
+            initial {int} -- starting limit (default: maximum)
+            decrease {float} -- factor applied to the limit on pushback (default: {0.5})
+            latency_factor {float} -- pushback when the average latency exceeds this factor of its baseline, None to ignore latency (default: {3.0})
+            latency_slack {float} -- seconds the average latency must also exceed its baseline by, ignores jitter of fast servers (default: {0.1})
+            cooldown {float} -- min seconds between two decreases until a latency is known (default: {1.0})
+            name {str} -- decreases are counted as {name}_limit_decreases (default: {"limit"})
+        """
+        self.maximum = maximum
+        self.minimum = max(1, min(minimum, maximum))
+        self.limit = float(initial or maximum)
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.latency_slack = latency_slack
+        self.cooldown = cooldown
+        self.name = name
+        self.active = 0
+        self.latency = None  # moving average of the latencies
+        self.baseline = None  # lowest moving average, follows the latency up when the limit is at its minimum
+        self._decreased_at = None
+        self._condition = threading.Condition()
+
+    @property
+    def adaptive(self):
+        return self.minimum < self.maximum
+
+    def acquire(self, blocking=True, timeout=None):
+        with self._condition:
+            if not blocking:
+                if self.active >= int(self.limit):
+                    return False
+            elif not self._condition.wait_for(lambda: self.active < int(self.limit), timeout):
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+    def success(self, latency=None):
+        """Report work done without pushback
+
+        Keyword Arguments:
+            latency {float} -- seconds the server took to answer e.g until the response headers (default: {None})
+        """
+        if not self.adaptive:
+            return
+        if latency is not None and self.latency_factor:
+            with self._condition:
+                self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+                if self.baseline is None or self.latency < self.baseline:
+                    self.baseline = self.latency
+                elif self.limit <= self.minimum:
+                    # fully backed off and still slow: the server is slower than it was, not overloaded by us.
+                    self.baseline += 0.05 * (self.latency - self.baseline)
+                rising = self.latency > max(self.latency_factor * self.baseline, self.baseline + self.latency_slack)
+            if rising:
+                self.backoff("latency")
+                return
+        with self._condition:
+            # only a limit in use grows, not one that isn't reached e.g while the urls are resolved.
+            if self.limit < self.maximum and self.active >= int(self.limit):
+                previous = int(self.limit)
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+                if int(self.limit) > previous:
+                    self._condition.notify_all()
+
+    def backoff(self, reason="pushback"):
+        """Report pushback of the server, decreases the limit unless it was just decreased
+
+        Keyword Arguments:
+            reason {str} -- logged e.g status 429, timeout, latency (default: {"pushback"})
+        """
+        if not self.adaptive:
+            return
+        with self._condition:
+            now = time.monotonic()
+            cooldown = self.cooldown if self.latency is None else self.latency
+            if self._decreased_at is not None and now - self._decreased_at < cooldown:
+                return
+            previous = self.limit
+            self.limit = max(self.minimum, self.limit * self.decrease)
+            self._decreased_at = now
+        if int(self.limit) < int(previous):
+            logger.debug("%s limit %s -> %s (%s)", self.name, int(previous), int(self.limit), reason)
+            metrics.count(self.name + "_limit_decreases")
+
+
+def _limit(n, adaptive=False, name="limit"):
+    if not n:
+        return _Unbounded()
+    return AdaptiveLimit(n, minimum=1 if adaptive else n, name=name)
+
+
+class Scheduler:
+    def __init__(self, api_calls=None, downloads=None, images=None, memory=None, transforms=None, adaptive=True):
+        """Limits on concurrent work shared between all of the presentations built in the same process
+
+        Used as context managers around each unit of work e.g `with scheduler.api: request.execute()`,
+        network limits are given the outcome of the work (see AdaptiveLimit) so they back off when google pushes back.
+
+        Keyword Arguments:
+            api_calls {int} -- max number of concurrent google api calls (default: unbounded)
+            downloads {int} -- max number of concurrent images downloads (default: unbounded)
+            images {int} -- max number of images between their download and their indexing (see pipeline.Pipeline) (default: unbounded)
+            memory {int} -- max bytes of decoded images being post processed at once (see pipeline.Budget) (default: unbounded)
+            transforms {int} -- max number of images transformed (processed, encoded) at once (default: number of cpus)
+            adaptive {bool} -- adapt api_calls and downloads limits (AIMD) between 1 and their max, fixed limits if False (default: {True})
+        """
+        self.api = _limit(api_calls, adaptive, "api")
+        self.downloads = _limit(downloads, adaptive, "downloads")
+        self.cpus = transforms or os.cpu_count()
+        self.transforms = _limit(self.cpus)
+        self.images = _limit(images)
+        self.memory = Budget(memory)
@@ -0,0 +1,135 @@
+"""
+Output sinks: where in memory builds (see Tool.render_revealjs_site) write the files of the website.
+
+Files are named by their posix path relative to the website e.g deck.html, deck/00_p0.png, deck/variants/00_p0.webp.
+
+    sink = render_revealjs_site(...)                      # MemorySink: sink.files["deck.html"]
+    sink = open_sink("s3://bucket/sites/")                  # S3Sink (requires boto3), endpoint from AWS_ENDPOINT_URL
+    sink = open_sink("/var/www/revealjs")                   # LocalSink
+
+Sinks are used from the threads of the images pipeline, their writes must be thread safe.
+"""
+import os
+import threading
+import mimetypes
+from slides2html.store import write_atomic
+
+S3_SCHEME = "s3://"
+
+# not known by the mimetypes module of every python version.
+CONTENT_TYPES = {".webp": "image/webp", ".avif": "image/avif", ".json": "application/json"}
+
+
+def content_type(name):
+    """Content type of file name, application/octet-stream if unknown"""
+    ext = os.path.splitext(name)[1].lower()
+    return CONTENT_TYPES.get(ext) or mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+
+class LocalSink:
+    def __init__(self, root):
+        """Files written to directory root, each one replaced atomically
+
+        Arguments:
+            root {str} -- website directory
+        """
+        self.root = os.path.abspath(os.path.expanduser(root))
+
+    def _path(self, name):
+        return os.path.join(self.root, *name.split("/"))
+
+    def write(self, name, data):
+        write_atomic(self._path(name), data)
+
+    def read(self, name):
+        with open(self._path(name), "rb") as f:
+            return f.read()
+
+    def names(self):
+        """Names of the files of the sink"""
+        names = []
+        for directory, _, files in os.walk(self.root):
+            relative = os.path.relpath(directory, self.root)
+            for f in files:
+                names.append(f if relative == "." else "/".join(relative.split(os.sep) + [f]))
+        return sorted(names)
+
+
+class MemorySink:
+    def __init__(self):
+        """Files kept in memory (files: bytes keyed by name), e.g to be served or uploaded by the caller"""
+        self.files = {}
+        self._lock = threading.Lock()
+
+    def write(self, name, data):
+        with self._lock:
+            self.files[name] = bytes(data)
+
+    def read(self, name):
+        return self.files[name]
+
+    def names(self):
+        with self._lock:
+            return sorted(self.files)
+
+
+class S3Sink:
+    def __init__(self, bucket, prefix="", client=None, **client_options):
+        """Files uploaded as objects of an S3 compatible object storage
+
+        Arguments:
+            bucket {str} -- bucket name
+
+        Keyword Arguments:
+            prefix {str} -- prefix of the objects keys e.g sites/ (default: {""})
+            client {botocore.client.S3} -- s3 client (default: created from client_options, see boto3.client)
+            client_options -- e.g endpoint_url of a non aws storage (addressed path style), region_name, credentials
+
+        Raises:
+            RuntimeError -- boto3 isn't installed
+        """
+        if client is None:
+            try:
+                import boto3
+                from botocore.config import Config
+            except ImportError:
+                raise RuntimeError("s3 sinks require boto3: pip install boto3")
+            if client_options.get('endpoint_url'):
+                client_options.setdefault('config', Config(s3={'addressing_style': "path"}))
+            client = boto3.client("s3", **client_options)
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = client
+
+    def write(self, name, data):
+        self.client.put_object(Bucket=self.bucket, Key=self.prefix + name, Body=data, ContentType=content_type(name))
+
+    def read(self, name):
+        return self.client.get_object(Bucket=self.bucket, Key=self.prefix + name)['Body'].read()
+
+    def names(self):
+        names = []
+        for page in self.client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=self.prefix):
+            names.extend(item['Key'][len(self.prefix):] for item in page.get('Contents', []))
+        return sorted(names)
+
+
+def open_sink(location, **client_options):
+    """Sink of location: s3://bucket/prefix or a directory
+
+    Keyword Arguments:
+        client_options -- s3 client options (see S3Sink)
+
+    Returns:
+        LocalSink or S3Sink
+    """
+    if location.startswith(S3_SCHEME):
+        bucket, _, prefix = location[len(S3_SCHEME):].partition("/")
+        if not bucket:
+            raise ValueError("invalid sink {} should be s3://bucket/prefix".format(location))
+        if prefix and not prefix.endswith("/"):
+            prefix += "/"
+        if "endpoint_url" not in client_options and os.environ.get("AWS_ENDPOINT_URL"):
+            client_options['endpoint_url'] = os.environ["AWS_ENDPOINT_URL"]
+        return S3Sink(bucket, prefix, **client_options)
+    return LocalSink(location)
@@ -0,0 +1,200 @@
+"""
+Metadata of the presentations of a website: title, revision and build state, in an sqlite database (presentations.db).
+
+Replaces the presentations.meta file read and rewritten whole by every build: builds of the same website, in threads or in processes,
+update the row of their presentation in a transaction and lookups are by presentation id.
+Titles of an existing presentations.meta are imported when the database is created.
+
+The database is in WAL mode (readers don't block the writer) unless the website is on a network filesystem (nfs, cifs...):
+WAL needs shared memory locking those don't provide reliably, the rollback journal (DELETE mode) is used instead, see SiteMetadata.
+
+    sitemeta = site_metadata("/tmp/revealjs")
+    sitemeta.update(presentation_id, title="Intro", revision_id="abc")
+    sitemeta.get(presentation_id)['title']
+"""
+import os
+import time
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DB_FILENAME = "presentations.db"
+LEGACY_FILENAME = "presentations.meta"
+# build states
+BUILDING = "building"
+BUILT = "built"
+FAILED = "failed"
+FIELDS = ("title", "revision_id", "state", "slides", "started", "finished", "error")
+# auto: wal, or delete on a network filesystem.
+JOURNAL_MODES = ("auto", "wal", "delete")
+# filesystems types (/proc/mounts) of the network filesystems.
+NETWORK_FILESYSTEMS = frozenset(["nfs", "nfs4", "cifs", "smb3", "smbfs", "9p", "afs", "ceph", "glusterfs", "lustre", "davfs", "fuse.sshfs",
+                                 "fuse.glusterfs", "fuse.cephfs", "fuse.s3fs"])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS presentations (
+    id TEXT PRIMARY KEY,
+    title TEXT,
+    revision_id TEXT,
+    state TEXT,
+    slides INTEGER,
+    started REAL,
+    finished REAL,
+    error TEXT,
+    updated REAL
+)
+"""
+
+
+def filesystem_type(path):
+    """Type of the filesystem path is on (e.g ext4, nfs4) from the mount points of /proc/mounts, None if unknown (e.g not linux)"""
+    path = os.path.realpath(path)
+    mountpoint, fstype = "", None
+    try:
+        with open("/proc/mounts") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mounted = fields[1].replace("\\040", " ")
+                within = path == mounted or path.startswith(mounted.rstrip("/") + "/")
+                if within and len(mounted) >= len(mountpoint):
+                    mountpoint, fstype = mounted, fields[2]
+    except OSError:
+        return None
+    return fstype
+
+
+class SiteMetadata:
+    def __init__(self, website_dir, timeout=30, journal_mode="auto"):
+        """Presentations metadata of website_dir, safe to use from multiple threads and processes
+
+        WAL mode needs shared memory locking which isn't reliable on network filesystems: with journal_mode auto the rollback
+        journal (delete) is used on the network filesystems of NETWORK_FILESYSTEMS, and whenever sqlite can't switch to WAL.
+        All of the processes using the same website should use the same journal mode.
+
+        Arguments:
+            website_dir {str} -- website directory (where presentations.db is)
+
+        Keyword Arguments:
+            timeout {float} -- seconds to wait for a concurrent transaction (default: {30})
+            journal_mode {str} -- sqlite journal mode of JOURNAL_MODES: auto, wal or delete (default: {"auto"})
+
+        Raises:
+            ValueError -- invalid journal mode
+        """
+        if journal_mode not in JOURNAL_MODES:
+            raise ValueError("invalid journal mode {} should be one of {}".format(journal_mode, JOURNAL_MODES))
+        self.website_dir = os.path.abspath(os.path.expanduser(website_dir))
+        self.path = os.path.join(self.website_dir, DB_FILENAME)
+        self.timeout = timeout
+        if journal_mode == "auto":
+            fstype = filesystem_type(self.website_dir)
+            journal_mode = "delete" if fstype in NETWORK_FILESYSTEMS else "wal"
+            if journal_mode == "delete":
+                logger.info("%s is on a network filesystem (%s), not using WAL mode", self.path, fstype)
+        self.journal_mode = journal_mode
+        self._local = threading.local()
+        self._setup_lock = threading.Lock()
+        self._ready = False
+
+    def _connection(self):
+        """connection of the current thread (sqlite connections can't be shared by threads)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(self.website_dir, exist_ok=True)
+            # transactions are explicit (see _transaction).
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._set_journal_mode(conn)
+            self._local.conn = conn
+            with self._setup_lock:
+                if not self._ready:
+                    self._setup(conn)
+                    self._ready = True
+        return conn
+
+    def _set_journal_mode(self, conn):
+        if self.journal_mode == "wal":
+            try:
+                mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+            except sqlite3.OperationalError as e:
+                mode = repr(e)
+            if mode.lower() == "wal":
+                # durable enough with WAL: a power loss only loses the last transactions.
+                conn.execute("PRAGMA synchronous=NORMAL")
+                return
+            logger.warning("can't use WAL mode for %s (%s), using the rollback journal", self.path, mode)
+            self.journal_mode = "delete"
+        try:
+            conn.execute("PRAGMA journal_mode=DELETE")
+        except sqlite3.OperationalError as e:
+            # leaving WAL mode needs the only connection to the database.
+            logger.warning("can't leave the journal mode of %s: %r", self.path, e)
+        conn.execute("PRAGMA synchronous=FULL")
+
+    @contextmanager
+    def _transaction(self, conn=None):
+        conn = conn or self._connection()
+        # takes the write lock now, not on the first write, so concurrent transactions wait instead of failing.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _setup(self, conn):
+        with self._transaction(conn):
+            conn.execute(SCHEMA)
+            legacy = os.path.join(self.website_dir, LEGACY_FILENAME)
+            if os.path.exists(legacy) and conn.execute("SELECT COUNT(*) FROM presentations").fetchone()[0] == 0:
+                from configparser import ConfigParser
+                parser = ConfigParser()
+                parser.read(legacy)
+                now = time.time()
+                conn.executemany("INSERT OR IGNORE INTO presentations (id, title, updated) VALUES (?, ?, ?)",
+                                 [(section, parser.get(section, "title", fallback=None), now) for section in parser.sections()])
+
+    def update(self, presentation_id, **fields):
+        """Set fields of presentation, added if it isn't known yet
+
+        Arguments:
+            presentation_id {str} -- presentation id
+            fields -- values of FIELDS e.g title, revision_id, state (BUILDING, BUILT or FAILED)
+        """
+        unknown = set(fields) - set(FIELDS)
+        if unknown:
+            raise ValueError("invalid presentation fields {} should be of {}".format(sorted(unknown), list(FIELDS)))
+        names = sorted(fields)
+        assignments = ", ".join("{} = ?".format(name) for name in names + ["updated"])
+        with self._transaction() as conn:
+            conn.execute("INSERT OR IGNORE INTO presentations (id) VALUES (?)", (presentation_id,))
+            conn.execute("UPDATE presentations SET {} WHERE id = ?".format(assignments),
+                         [fields[name] for name in names] + [time.time(), presentation_id])
+
+    def get(self, presentation_id):
+        """Metadata of presentation (dict of FIELDS and updated), None if unknown"""
+        row = self._connection().execute("SELECT * FROM presentations WHERE id = ?", (presentation_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def all(self):
+        """Metadata of all of the presentations of the website, by id"""
+        return [dict(row) for row in self._connection().execute("SELECT * FROM presentations ORDER BY id")]
+
+
+_sites = {}
+_sites_lock = threading.Lock()
+
+
+def site_metadata(website_dir, journal_mode="auto"):
+    """SiteMetadata of website_dir, shared by the builds of the process (journal_mode of the first one, see SiteMetadata)"""
+    key = os.path.abspath(os.path.expanduser(website_dir))
+    with _sites_lock:
+        if key not in _sites:
+            _sites[key] = SiteMetadata(key, journal_mode=journal_mode)
+        return _sites[key]
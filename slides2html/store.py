@@ -0,0 +1,139 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+
+# bump when the images post processing changes to invalidate the stored transforms.
+TRANSFORMS_VERSION = 1
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def write_atomic(path, data):
+    """Write data (bytes or str) to path atomically, creating its directory
+
+    Concurrent writers (threads or processes) each write their own temporary file, the last one replaced wins.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = os.path.join(os.path.dirname(path), ".tmp_{}_{}_{}".format(os.getpid(), threading.get_ident(), os.path.basename(path)))
+    with open(tmp, "wb") as f:
+        f.write(data.encode() if isinstance(data, str) else data)
+    os.replace(tmp, path)
+
+
+def link_file(src, path):
+    """Hard link src to path (copy across filesystems), path is replaced atomically if it exists"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = os.path.join(os.path.dirname(path), ".link_{}_{}_{}".format(os.getpid(), threading.get_ident(), os.path.basename(path)))
+    try:
+        os.link(src, tmp)
+    except OSError:  # different filesystem
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, path)
+
+
+class ContentStore:
+    def __init__(self, root):
+        """Content addressed images store shared between presentations.
+
+        Images are stored once by sha256 of their content and hard linked into the presentations directories.
+        Stored objects are read only, images must be replaced (not written in place) to be changed.
+
+        Arguments:
+            root {str} -- store directory, must be on the same filesystem as the websites to use hard links.
+        """
+        self.root = os.path.abspath(os.path.expanduser(root))
+        self.objects_dir = os.path.join(self.root, "objects")
+        self.transforms_dir = os.path.join(self.root, "transforms")
+        self.keys_dir = os.path.join(self.root, "keys")
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def put(self, path):
+        """Add file to the store and replace it with a link to the stored object
+
+        Arguments:
+            path {str} -- file path
+
+        Returns:
+            str -- digest of the file
+        """
+        digest = file_digest(path)
+        obj = self.object_path(digest)
+        if not os.path.exists(obj):
+            os.makedirs(os.path.dirname(obj), exist_ok=True)
+            tmp = "{}.{}.tmp".format(obj, os.getpid())
+            try:
+                os.link(path, tmp)
+            except OSError:  # different filesystem
+                shutil.copyfile(path, tmp)
+            os.chmod(tmp, 0o444)
+            os.replace(tmp, obj)
+        self.link(digest, path)
+        return digest
+
+    def link(self, digest, path):
+        """Link stored object (digest) to path
+
+        Arguments:
+            digest {str} -- digest of the stored object
+            path {str} -- destination path (replaced if it exists)
+        """
+        obj = self.object_path(digest)
+        if os.path.exists(path) and os.path.samefile(obj, path):
+            return
+        link_file(obj, path)
+
+    def has(self, digest):
+        return digest is not None and os.path.exists(self.object_path(digest))
+
+    def transform_key(self, **options):
+        """Key of a post processing (e.g background digest, resize...) applied to images"""
+        options['version'] = TRANSFORMS_VERSION
+        return hashlib.sha256(json.dumps(options, sort_keys=True).encode()).hexdigest()
+
+    def get_transform(self, digest, transform_key):
+        """Digest of the already produced output of transform_key applied to digest (None if unknown)"""
+        path = os.path.join(self.transforms_dir, digest[:2], "{}_{}".format(digest, transform_key))
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            output = f.read().strip()
+        return output if self.has(output) else None
+
+    def put_transform(self, digest, transform_key, path):
+        """Store the output (path) of transform_key applied to digest
+
+        Returns:
+            str -- digest of the output
+        """
+        output = self.put(path)
+        write_atomic(os.path.join(self.transforms_dir, digest[:2], "{}_{}".format(digest, transform_key)), output)
+        return output
+
+    def get_key(self, key):
+        """Digest stored under a name (e.g background slide at a given revision), None if unknown"""
+        path = os.path.join(self.keys_dir, hashlib.sha256(key.encode()).hexdigest())
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            digest = f.read().strip()
+        return digest if self.has(digest) else None
+
+    def put_key(self, key, path):
+        """Add file to the store under a name
+
+        Returns:
+            str -- digest of the file
+        """
+        digest = self.put(path)
+        write_atomic(os.path.join(self.keys_dir, hashlib.sha256(key.encode()).hexdigest()), digest)
+        return digest
@@ -1,24 +1,43 @@
+import io
 import os
 import os.path
-import re
+import sys
+import json
+import hashlib
+import time
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import click
-from configparser import ConfigParser
-from httplib2 import Http
-from oauth2client import file, client, tools
-from googleapiclient.discovery import build
-from google.oauth2 import service_account
 from slides2html.google_links_utils import get_slide_id, get_presentation_id, link_info
-from slides2html.image_utils import images_to_transparent_background, set_background_for_images, resize_images
-from slides2html.generator import Generator
-from slides2html.downloader import Downloader
+from slides2html.generator import Generator, read_template, enable_bytecode_cache
+from slides2html.downloader import Downloader, make_session, ENGINES, FETCH_STRATEGIES, DEFAULT_WORKERS
+from slides2html.scheduler import Scheduler
+from slides2html.pipeline import Pipeline, Stage
+from slides2html.store import ContentStore, file_digest
+from slides2html.publish import publish, check_compressions
+from slides2html.sitemeta import site_metadata, BUILDING, BUILT, FAILED, JOURNAL_MODES
+from slides2html.metacache import MetadataCache
+from slides2html.manifest import Manifest, MANIFEST_FILENAME
+from slides2html.sink import MemorySink, open_sink
+from slides2html.metrics import metrics
 from slides2html.revealjstemplate import BASIC_TEMPLATE
 
+logger = logging.getLogger(__name__)
+
+LOG_LEVELS = ["DEBUG", "INFO", "WARNING", "ERROR"]
+
+DEFAULT_CACHEDIR = "~/.cache/slides2html"
+# bounds of the images pipelines of all of the presentations (see Tool.fetch_images)
+DEFAULT_INFLIGHT = 64
+DEFAULT_MEMORY_MB = 1024
+
 
 def dir_images_as_htmltags(directory):
 
     images = []
-    files = [x for x in os.listdir(directory) if x.endswith("png") and "_" in x and "background_" not in x]
-    files.sort(key=lambda k: int(k.split("_")[0]))
+    files = Manifest.load(directory).files()
     for p in files:
         dirbasename = os.path.basename(directory)
         images.append(
@@ -26,40 +45,328 @@ def dir_images_as_htmltags(directory):
     return images
 
 
-def get_slides_info(directory):
-    slides_infos = []
-    main_meta = "presentations.meta"
-    website_dir = os.path.dirname(directory)
-    main_meta_path = os.path.join(website_dir, main_meta)
+def _srcset(candidates, width):
+    """srcset of [(url, width)] of an image of width pixels, just the url if there's only the image itself"""
+    if len(candidates) == 1:
+        return candidates[0][0]
+    return ", ".join("{} {}w".format(url, w) for url, w in sorted(candidates, key=lambda c: c[1]))
 
-    parser = ConfigParser()
 
-    parser.read(main_meta_path)
-    presentation_id = os.path.basename(directory)
-    presentation_title = parser.get(presentation_id, 'title')
+def slide_image_info(directory, p, formats=(), widths=(), size=None, variants=None, placeholders=None):
+    """Urls and dimensions of slide image p of directory and its encoded versions of formats (see image_utils.encode_images)
 
-    files = [x for x in os.listdir(
-        directory) if x.endswith(".png") and "_" in x and "background" not in x]
-    files.sort(key=lambda k: int(k.split("_")[0]))
-    for p in files:
-        dirbasename = os.path.basename(directory)
-        meta = []
-        metapath = os.path.join(directory, p + ".meta")
-        if os.path.exists(metapath):
-            with open(metapath, "r") as mp:
-                meta_content = mp.read()
-                meta = re.findall(r'(https?://\S+)', meta_content)
-        print("extracted meta :", meta)
-        image = '<img src="./{dirbasename}/{p}" alt="{p}" />'.format(
-            dirbasename=dirbasename, p=p)
+    Arguments:
+        directory {str} -- presentation directory
+        p {str} -- slide image file name
+
+    Keyword Arguments:
+        formats {[str]} -- encoded versions formats (default: {()})
+        widths {[int]} -- widths of the resized versions (default: {()})
+        size {tuple} -- (width, height) of the image if known e.g from the slides index (default: read from the image)
+        variants {set} -- file names in the variants directory if known (default: checked one by one)
+        placeholders {dict} -- placeholders data uris keyed by slide image file name if known (default: read from the variants directory)
+
+    Returns:
+        dict -- src (png or jpeg), srcset of src (None without resized versions), sources [{srcset, type}] best first,
+                width, height and placeholder (data uri or None)
+    """
+    from slides2html.image_utils import image_size, variant_name, placeholder_name, fallback_format, FORMATS, VARIANTS_DIR
+    dirbasename = os.path.basename(directory)
+    variants_dir = os.path.join(directory, VARIANTS_DIR)
+    if size is None:
+        size = image_size(os.path.join(directory, p))
+    width, height = size
+
+    def exists(name):
+        if variants is not None:
+            return name in variants
+        return os.path.exists(os.path.join(variants_dir, name))
+
+    def url(name):
+        return "./{}/{}/{}".format(dirbasename, VARIANTS_DIR, name)
+
+    def candidates(fmt, full):
+        resized = [(url(variant_name(p, fmt, w)), w) for w in widths if w < width and exists(variant_name(p, fmt, w))]
+        return [(full, width)] + resized
+
+    available = [fmt for fmt in FORMATS if fmt in formats and exists(variant_name(p, fmt))]
+    # browsers that don't support <picture> or any of the sources get png or jpeg.
+    fallback = fallback_format(available)
+    if fallback is None:
+        src = "./{dirbasename}/{p}".format(dirbasename=dirbasename, p=p)
+        fallback_candidates = candidates("png", src)
+    else:
+        src = url(variant_name(p, fallback))
+        fallback_candidates = candidates(fallback, src)
+    srcset = _srcset(fallback_candidates, width) if len(fallback_candidates) > 1 else None
+    sources = [{'srcset': _srcset(candidates(fmt, url(variant_name(p, fmt))), width), 'type': FORMATS[fmt][1]}
+               for fmt in available if fmt not in ("png", "jpeg")]
+
+    placeholder = None
+    if placeholders is not None:
+        placeholder = placeholders.get(p)
+    elif exists(placeholder_name(p)):
+        with open(os.path.join(variants_dir, placeholder_name(p))) as f:
+            placeholder = f.read().strip()
+    return {'src': src, 'srcset': srcset, 'sources': sources, 'width': width, 'height': height, 'placeholder': placeholder}
+
+
+def slide_image_tag(info, lazy=True):
+    """html of slide image, a <picture> if it has encoded versions.
+
+    Arguments:
+        info {dict} -- see slide_image_info
+
+    Keyword Arguments:
+        lazy {bool} -- let reveal.js load the image when the slide gets close to the current one (data-src) (default: {True})
+
+    Returns:
+        str -- html
+    """
+    src_attr = "data-src" if lazy else "src"
+    srcset_attr = "data-srcset" if lazy else "srcset"
+    if lazy and (info['sources'] or info['srcset'] or info['placeholder']):
+        # loaded by the template script once the srcsets are set, reveal.js would load the fallback first.
+        src_attr = "data-lazy-src"
+    attrs = ['{}="{}"'.format(src_attr, info['src'])]
+    if lazy and info['placeholder']:
+        attrs.append('src="{}"'.format(info['placeholder']))
+    if info['srcset']:
+        attrs.append('{}="{}"'.format(srcset_attr, info['srcset']))
+    if info['srcset'] or any(" " in source['srcset'] for source in info['sources']):
+        attrs.append('sizes="100vw"')
+    image = '<img {attrs} width="{width}" height="{height}" alt="{alt}" />'.format(
+        attrs=" ".join(attrs), width=info['width'], height=info['height'], alt=os.path.basename(info['src']))
+    if not info['sources']:
+        return image
+    tags = ['<source {}="{}" type="{}" />'.format(srcset_attr, source['srcset'], source['type']) for source in info['sources']]
+    return "<picture>{}{}</picture>".format("".join(tags), image)
+
+
+def get_slides_info(directory, formats=(), lazy=True, preload=2, widths=(), manifest=None, variants=None, placeholders=None):
+    """Slides of the presentation in directory as rendered by the templates
+
+    Arguments:
+        directory {str} -- presentation directory
+
+    Keyword Arguments:
+        formats {[str]} -- encoded versions formats (default: {()})
+        lazy {bool} -- lazy loading images markup (default: {True})
+        preload {int} -- number of first slides to be preloaded (default: {2})
+        widths {[int]} -- widths of the resized versions (default: {()})
+        manifest {Manifest} -- slides index of the presentation (default: loaded from directory)
+        variants {set} -- file names of the encoded versions, in memory builds (default: listed from directory)
+        placeholders {dict} -- placeholders data uris keyed by slide image file name, in memory builds (default: read from directory)
+
+    Returns:
+        [dict] -- slide_image (html), slide_meta (links of the notes), title, image (see slide_image_info)
+                  and preload (href, srcset and mime type of the image to preload or None)
+    """
+    from slides2html.image_utils import VARIANTS_DIR
+    slides_infos = []
+    if manifest is None:
+        manifest = Manifest.load(directory)
+    presentation_title = manifest.title
+
+    if variants is None:
+        variants_dir = os.path.join(directory, VARIANTS_DIR)
+        # one listing instead of checking every version of every slide.
+        variants = set(os.listdir(variants_dir)) if os.path.isdir(variants_dir) else set()
+    for slide in manifest.slides:
+        p = slide['file']
+        meta = slide.get('links', [])
+        size = (slide['width'], slide['height']) if 'width' in slide else None
+        if size is None and not os.path.exists(os.path.join(directory, p)):  # failed download
+            continue
+        info = slide_image_info(directory, p, formats, widths, size=size, variants=variants, placeholders=placeholders)
+        image = slide_image_tag(info, lazy)
+        preload_image = None
+        if len(slides_infos) < preload:
+            if info['sources']:
+                source = info['sources'][0]
+                preload_image = {'href': source['srcset'].split(" ")[0], 'srcset': source['srcset'], 'type': source['type']}
+            else:
+                preload_image = {'href': info['src'], 'srcset': info['srcset'], 'type': None}
         slides_infos.append(
-            {'slide_image': image, 'slide_meta': meta, 'title': presentation_title})
+            {'slide_image': image, 'slide_meta': meta, 'title': presentation_title, 'image': info, 'preload': preload_image})
 
     return slides_infos
 
 
+SCOPES = ['https://www.googleapis.com/auth/drive']
+DISCOVERY_URL = "https://slides.googleapis.com/$discovery/rest?version=v1"
+# seconds a cached discovery document is used before it's fetched again.
+DISCOVERY_MAX_AGE = 7 * 24 * 3600
+
+# discovery documents and credentials are only read once per process (see get_service).
+_discovery = {}
+_credentials = {}
+_service_lock = threading.Lock()
+
+
+def _fetch_discovery_document(path):
+    """Fetch the slides discovery document and keep it in path (if not None)"""
+    from httplib2 import Http
+    response, content = Http(timeout=30).request(DISCOVERY_URL)
+    if response.status != 200:
+        raise RuntimeError("failed to get the slides api discovery document: http {}".format(response.status))
+    document = content.decode()
+    json.loads(document)
+    if path:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp_")
+        with os.fdopen(fd, "w") as f:
+            f.write(document)
+        os.replace(tmp, path)
+    return document
+
+
+def get_discovery_document(cachedir=DEFAULT_CACHEDIR):
+    """Slides api discovery document, without a request to the discovery service if possible:
+    the document bundled with googleapiclient (2.x), the one cached in cachedir (fetched again after DISCOVERY_MAX_AGE)
+    or fetched and cached in cachedir.
+
+    Keyword Arguments:
+        cachedir {str} -- cache directory, None to not keep the fetched document (default: {DEFAULT_CACHEDIR})
+
+    Returns:
+        str -- discovery document (json)
+    """
+    path = os.path.join(os.path.expanduser(cachedir), "discovery", "slides.v1.json") if cachedir else None
+    with _service_lock:
+        if path in _discovery:
+            return _discovery[path]
+        from googleapiclient import discovery_cache
+        get_static_doc = getattr(discovery_cache, "get_static_doc", None)
+        document = get_static_doc("slides", "v1") if get_static_doc else None
+        if document is None and path and os.path.exists(path) and time.time() - os.path.getmtime(path) < DISCOVERY_MAX_AGE:
+            with open(path) as f:
+                document = f.read()
+        if document is None:
+            try:
+                document = _fetch_discovery_document(path)
+            except Exception as e:
+                if not (path and os.path.exists(path)):
+                    raise
+                logger.warning("failed to refresh the slides api discovery document (%s), using %s", e, path)
+                with open(path) as f:
+                    document = f.read()
+        _discovery[path] = document
+        return document
+
+
+def get_credentials(credfile="credentials.json", serviceaccount=False):
+    """Credentials of credfile, only read again if credfile changed (or the oauth token is invalid)
+
+    Keyword Arguments:
+        credfile {str} -- credentials file path (default: {"credentials.json"})
+        serviceaccount {bool} -- use service account instead of normal oauth flow (default: {False})
+
+    Returns:
+        Credentials -- google.oauth2 service account or oauth2client credentials
+    """
+    key = (credfile, serviceaccount, os.stat(credfile).st_mtime_ns)
+    with _service_lock:
+        credentials = _credentials.get(key)
+        if credentials is not None and (serviceaccount or not credentials.invalid):
+            return credentials
+
+    if serviceaccount:
+        from google.oauth2 import service_account
+        credentials = service_account.Credentials.from_service_account_file(
+            credfile, scopes=SCOPES)
+    else:
+        from oauth2client import file, client, tools
+        userdir = os.path.expanduser("~")
+        tokenjson = os.path.join(userdir, ".token.json")
+        store = file.Storage(tokenjson)
+        credentials = store.get()
+        if not credentials or credentials.invalid:
+            flow = client.flow_from_clientsecrets(credfile, SCOPES)
+            credentials = tools.run_flow(flow, store)
+    with _service_lock:
+        _credentials[key] = credentials
+    return credentials
+
+
+def get_authorization(credfile="credentials.json", serviceaccount=False):
+    """Authorization headers of credfile credentials for requests outside of the api e.g slides export urls
+
+    Keyword Arguments:
+        credfile {str} -- credentials file path (default: {"credentials.json"})
+        serviceaccount {bool} -- use service account instead of normal oauth flow (default: {False})
+
+    Returns:
+        callable -- returns the headers, the access token is refreshed once expired
+    """
+    credentials = get_credentials(os.path.expanduser(credfile), serviceaccount)
+    lock = threading.Lock()
+
+    def authorization():
+        with lock:
+            if serviceaccount:
+                from google.auth.transport.requests import Request
+                if not credentials.valid:
+                    credentials.refresh(Request())
+                return {'Authorization': "Bearer {}".format(credentials.token)}
+            return {'Authorization': "Bearer {}".format(credentials.get_access_token().access_token)}
+    return authorization
+
+
+def get_service(credfile="credentials.json", serviceaccount=False, cachedir=DEFAULT_CACHEDIR):
+    """Authenticate and build google slides service.
+
+    Keyword Arguments:
+        credfile {str} -- credentials file path (default: {"credentials.json"})
+        serviceaccount {bool} -- use service account instead of normal oauth flow (default: {False})
+        cachedir {str} -- cache directory of the api discovery document (default: {DEFAULT_CACHEDIR})
+
+    Raises:
+        RuntimeError -- [In case of invalid credential files.]
+
+    Returns:
+        (Service, callable) -- slides service and factory of authorized http objects
+                               to execute its requests from other threads.
+    """
+    credfile = os.path.expanduser(credfile)
+    if not os.path.exists(credfile):
+        raise RuntimeError(
+            "please provide valid credentials.json file. https://console.developers.google.com/apis/credentials")
+    logger.debug("credfile: %s", credfile)
+
+    from httplib2 import Http
+    from googleapiclient.discovery import build_from_document
+    credentials = get_credentials(credfile, serviceaccount)
+    document = get_discovery_document(cachedir)
+    if serviceaccount:
+        from google_auth_httplib2 import AuthorizedHttp
+        service = build_from_document(document, credentials=credentials)
+
+        def http_factory():
+            return AuthorizedHttp(credentials, http=Http())
+    else:
+        service = build_from_document(document, http=credentials.authorize(Http()))
+
+        def http_factory():
+            return credentials.authorize(Http())
+    return service, http_factory
+
+
+def _manifest_options(background, resize, transparent_color, tolerance, formats, quality, widths, placeholders, background_version=None):
+    """build options kept in the slides index, images built with other options are outdated (see Manifest.is_uptodate)"""
+    options = {'background': background, 'resize': list(resize) if resize else None}
+    if background is not None:
+        options.update({'transparent_color': list(transparent_color), 'tolerance': tolerance, 'background_version': background_version})
+    if formats:
+        options.update({'formats': list(formats), 'quality': quality})
+    if widths or placeholders:
+        options.update({'widths': sorted(widths), 'placeholders': placeholders})
+    return options
+
+
 class Tool:
-    def __init__(self, presentation_id, credfile="credentials.json", serviceaccount=False):
+    def __init__(self, presentation_id, credfile="credentials.json", serviceaccount=False, service=None, http_factory=None,
+                 session=None, scheduler=None, engine="threads", store=None, metacache=None, fetch="thumbnail", authorization=None):
         """Initialize slides2html tool.
 
         Arguments:
@@ -67,43 +374,40 @@ class Tool:
 
         Keyword Arguments:
             credfile {str} -- [description] (default: {"credentials.json"})
+            serviceaccount {bool} -- use service account instead of normal oauth flow (default: {False})
+            service {Service} -- already authenticated slides service to share between tools (default: built from credfile)
+            http_factory {callable} -- factory of authorized http objects for service (see get_service) (default: {None})
+            session {requests.Session} -- images download session to share between tools (default: {None})
+            scheduler {Scheduler} -- concurrency limits to share between tools (default: {None})
+            engine {str} -- downloader network engine: threads or asyncio (default: {"threads"})
+            store {ContentStore or str} -- content addressed images store (or its directory) shared between presentations (default: {None})
+            metacache {MetadataCache or str} -- presentations metadata cache (or its directory) (default: {None})
+            fetch {str} -- slides images urls: thumbnail or export (see Downloader.slide_urls) (default: {"thumbnail"})
+            authorization {callable} -- headers of the export requests (default: from credfile, see get_authorization)
 
         Raises:
             RuntimeError -- [In case of invalid credential files.]
 
         """
         self.presentation_id = presentation_id
-        SCOPES = ['https://www.googleapis.com/auth/drive']
+        self.credfile = os.path.expanduser(credfile)
 
-        if not os.path.exists(credfile):
-            raise RuntimeError(
-                "please provide valid credentials.json file. https://console.developers.google.com/apis/credentials")
+        if service is None:
+            service, http_factory = get_service(self.credfile, serviceaccount)
+        if fetch == "export" and authorization is None:
+            authorization = get_authorization(self.credfile, serviceaccount)
 
-        self.credfile = os.path.expanduser(credfile)
-        print("credfile: ", self.credfile)
-
-        credentials = None
-        service = None
-        if serviceaccount:
-            credentials = service_account.Credentials.from_service_account_file(
-                self.credfile, scopes=SCOPES)
-            service = build('slides', 'v1', credentials=credentials)
-        else:
-            userdir = os.path.expanduser("~")
-            tokenjson = os.path.join(userdir, ".token.json")
-            store = file.Storage(tokenjson)
-            credentials = store.get()
-            self.credfile = os.path.expanduser(credfile)
-            if not credentials or credentials.invalid:
-                flow = client.flow_from_clientsecrets(self.credfile, SCOPES)
-                credentials = tools.run_flow(flow, store)
-
-            service = build('slides', 'v1', http=credentials.authorize(Http()))
-
-        self.downloader = Downloader(presentation_id, service)
+        if isinstance(store, str):
+            store = ContentStore(store)
+        if isinstance(metacache, str):
+            metacache = MetadataCache(metacache)
+        self.downloader = Downloader(presentation_id, service, session=session, scheduler=scheduler, http_factory=http_factory,
+                                     engine=engine, store=store, metacache=metacache, fetch=fetch, authorization=authorization)
         self.generator = Generator(presentation_id)
 
-    def build_revealjs_site(self, destdir="", entryfile="", presentation_dir="", template=BASIC_TEMPLATE):
+    def build_revealjs_site(self, destdir="", entryfile="", presentation_dir="", template=BASIC_TEMPLATE,
+                            background=None, resize=None, incremental=False, transparent_color=(255, 255, 255), tolerance=0,
+                            formats=(), quality=80, lazy=True, preload=2, widths=(), placeholders=False):
         """Build reveal.js based website.
 
         Keyword Arguments:
@@ -111,77 +415,634 @@ class Tool:
             entryfile {str} -- index file name (default: presentation id)
             presentation_dir {str} -- directory to save images (default: {""})
             template {[str]} -- [reveal.js template] (default: {BASIC_TEMPLATE})
+            background {str} -- link of slide to be used as background for all of the slides (default: {None})
+            resize {tuple} -- resize images to (width, height) (default: {None})
+            incremental {bool} -- only download and process new or changed slides (default: {False})
+            transparent_color {tuple} -- (r, g, b) color of the slides replaced by the background (default: {(255, 255, 255)})
+            tolerance {int} -- max difference per channel from transparent_color (default: {0})
+            formats {[str]} -- also encode images in these formats (avif, webp, jpeg, png) served with <picture> (default: {()})
+            quality {int} -- quality of the lossy formats (default: {80})
+            lazy {bool} -- only load the slides images close to the current slide (default: {True})
+            preload {int} -- number of first slides images to preload (default: {2})
+            widths {[int]} -- also resize images to these widths for responsive srcset (default: {()})
+            placeholders {bool} -- inline tiny blurred placeholders of the images shown until they load (default: {False})
+        """
+        from slides2html.image_utils import check_formats, encode_images
+        check_formats(formats)
+        # images layered on the background are outdated once the background deck is edited.
+        background_version = self.downloader.background_version(background) if background is not None else None
+        options = _manifest_options(background, resize, transparent_color, tolerance, formats, quality, widths, placeholders, background_version)
+        # slides index of the presentation, the previous build one is reused by incremental builds.
+        manifest = Manifest.load(destdir, options) if incremental else Manifest(destdir, options)
+
+        scheduler = self.downloader.scheduler
+        with metrics.span("build", presentation=self.presentation_id):
+            if self.downloader.engine == "threads":
+                changed = self.fetch_images(destdir, manifest, incremental=incremental, background=background, color=transparent_color,
+                                            tolerance=tolerance, newsize=resize)
+            else:
+                changed = self._fetch_images_by_stage(destdir, manifest, incremental=incremental, background=background,
+                                                      color=transparent_color, tolerance=tolerance, newsize=resize)
+            files = manifest.files()
+            if formats or widths or placeholders:
+                with metrics.span("encode_images", presentation=self.presentation_id):
+                    encode_images(destdir, formats, files=changed, current=files, quality=quality, widths=widths,
+                                  placeholder=placeholders, max_workers=scheduler.cpus, limit=scheduler.transforms)
+
+            with metrics.span("render", presentation=self.presentation_id):
+                slides_infos = get_slides_info(destdir, formats, lazy=lazy, preload=preload, widths=widths, manifest=manifest)
+                if not entryfile:
+                    entryfile = self.presentation_id
+                self.generator.write_html(slides_infos, template, entryfile)
+            manifest.save()
+        logger.info("built %s (%s slides, %s processed)", self.presentation_id, len(files), len(changed))
+
+    def render_revealjs_site(self, sink=None, entryfile="", template=BASIC_TEMPLATE, background=None, resize=None,
+                             transparent_color=(255, 255, 255), tolerance=0, formats=(), quality=80, lazy=True, preload=2, widths=(),
+                             placeholders=False, manifest=None):
+        """Build reveal.js based website in memory, without touching the filesystem.
+
+        Slides images stream from their download through post processing and encoding to sink in a pipeline (see fetch_images),
+        nothing is staged on disk. Builds are neither incremental nor use the store, images are always downloaded with threads.
+
+        Keyword Arguments:
+            sink {LocalSink, MemorySink or S3Sink} -- where the website files are written (see sink module) (default: new MemorySink)
+            entryfile {str} -- index file name (default: {presentation id}.html)
+            manifest {Manifest} -- new slides index filled by the build, its destdir is the presentation directory in sink (default: {None})
+            see build_revealjs_site for the other options
+
+        Returns:
+            sink -- with entryfile and the presentation directory (presentation id by default): images, variants and manifest.json
         """
-        self.downloader.download(destdir)
-        slides_infos = get_slides_info(destdir)
-        html = self.generator.generate_html(
-            slides_infos, revealjs_template=template)
-        if not entryfile:
-            entryfile = self.presentation_id
+        from slides2html.image_utils import check_formats
+        check_formats(formats)
+        if sink is None:
+            sink = MemorySink()
+        options = _manifest_options(background, resize, transparent_color, tolerance, formats, quality, widths, placeholders)
+        if manifest is None:
+            manifest = Manifest(self.presentation_id)
+        manifest.options = options
+        with metrics.span("build", presentation=self.presentation_id, sink=type(sink).__name__):
+            variants, inline = self.stream_images(sink, manifest, background=background, color=transparent_color, tolerance=tolerance,
+                                                  newsize=resize, formats=formats, quality=quality, widths=widths, placeholders=placeholders)
+            # failed downloads are left out of this build.
+            manifest.slides = [slide for slide in manifest.slides if 'digest' in slide]
+            if not manifest.slides:
+                raise RuntimeError("no slides images of {} could be downloaded".format(self.presentation_id))
+            with metrics.span("render", presentation=self.presentation_id):
+                slides_infos = get_slides_info(manifest.destdir, formats, lazy=lazy, preload=preload, widths=widths, manifest=manifest,
+                                               variants=variants, placeholders=inline if placeholders else None)
+                html = self.generator.generate_html(slides_infos, template)
+            sink.write(entryfile or "{}.html".format(self.presentation_id), html.encode())
+            sink.write("{}/{}".format(manifest.destdir, MANIFEST_FILENAME), manifest.dumps().encode())
+        logger.info("built %s in %s (%s slides)", self.presentation_id, type(sink).__name__, len(manifest.slides))
+        return sink
+
+    def stream_images(self, sink, manifest, background=None, color=(255, 255, 255), tolerance=0, newsize=None, formats=(), quality=80,
+                      widths=(), placeholders=False):
+        """In memory version of fetch_images: download, post process, encode, write to sink and index the slides images
+
+        Images are written under the presentation directory of manifest (its destdir) and the encoded versions under its VARIANTS_DIR.
+
+        Arguments:
+            sink {LocalSink, MemorySink or S3Sink} -- where the images are written
+            manifest {Manifest} -- new slides index of the presentation
 
-        with open(entryfile, "w") as f:
-            f.write(html)
+        Keyword Arguments:
+            see fetch_images and build_revealjs_site
+
+        Returns:
+            (set, dict) -- file names of the encoded versions and placeholders data uris keyed by slide image file name
+        """
+        from slides2html.image_utils import ImageProcessor, image_size, placeholder_name, VARIANTS_DIR
+        with metrics.span("prepare", presentation=self.presentation_id):
+            _, page_ids = self.downloader.prepare(None, manifest)
+        variants = set()
+        inline = {}
+        if not page_ids:
+            return variants, inline
+        background_data = None
+        if background is not None:
+            with metrics.span("background", presentation=self.presentation_id):
+                background_data = self.downloader.fetch_background(background)
+
+        scheduler = self.downloader.scheduler
+        transform = background_data is not None or bool(newsize)
+        encode = bool(formats or widths or placeholders)
+        dirname = manifest.destdir
+
+        def download(item):
+            save_as, url, source = item
+            data, source = self.downloader.fetch_slide(save_as, url, source)
+            return (save_as, source, data, {}) if data is not None else None
+
+        def decoded_size(item):
+            width, height = image_size(io.BytesIO(item[2]))
+            return width * height * 4 * (2 if background_data else 1)
+
+        def process(item):
+            f, source, data, encoded = item
+            if transform:
+                data = processor.process_data(data, f)
+            if encode:
+                encoded = processor.encode_data(data, f, formats, quality, widths, placeholders)
+            return f, source, data, encoded
+
+        def write(item):
+            f, source, data, encoded = item
+            sink.write("{}/{}".format(dirname, f), data)
+            for name, content in encoded.items():
+                if name == placeholder_name(f):
+                    inline[f] = content.decode()
+                    continue
+                sink.write("{}/{}/{}".format(dirname, VARIANTS_DIR, name), content)
+                variants.add(name)
+            manifest.set_image(f, *image_size(io.BytesIO(data)), hashlib.sha256(data).hexdigest(), source=source)
+            return f
+
+        processor = ImageProcessor(background_data, color, tolerance, newsize, max_workers=scheduler.cpus,
+                                   limit=scheduler.transforms) if transform or encode else None
+        try:
+            stages = [Stage("download", download, workers=self.downloader.max_workers)]
+            if processor is not None:
+                stages.append(Stage("process", process, workers=processor.max_workers, weight=decoded_size, budget=scheduler.memory))
+            # uploads to object storage are network bound like the downloads.
+            stages.append(Stage("write", write, workers=self.downloader.max_workers))
+            with metrics.span("pipeline", presentation=self.presentation_id, slides=len(page_ids)):
+                Pipeline(stages, inflight=scheduler.images).run(self.downloader.slide_urls(page_ids))
+        finally:
+            if processor is not None:
+                processor.close()
+        return variants, inline
 
-    def convert_to_transparent_background(self, destdir):
-        images_to_transparent_background(destdir)
+    def fetch_images(self, destdir, manifest, incremental=False, background=None, color=(255, 255, 255), tolerance=0, newsize=None):
+        """Download, post process and index the slides images of the build (new or changed ones if incremental)
+
+        Slides go through a pipeline (see pipeline.Pipeline): urls (see Downloader.slide_urls), download, post processing and indexing
+        run concurrently connected by bounded queues, at most scheduler.images slides are between download and indexing
+        and scheduler.memory bytes of decoded images are post processed at once, whatever the size of the presentation.
+
+        Arguments:
+            destdir {str} -- presentation directory
+            manifest {Manifest} -- slides index of the presentation
+
+        Keyword Arguments:
+            incremental {bool} -- manifest is the index of the previous build (default: {False})
+            background {str} -- link of slide to be used as background (default: {None})
+            color {tuple} -- (r, g, b) color of the slides made transparent (default: {(255, 255, 255)})
+            tolerance {int} -- max difference per channel from color (default: {0})
+            newsize {tuple} -- resize to (width, height) (default: {None})
+
+        Returns:
+            [str] -- slides images of the build, failed downloads are left out
+        """
+        from slides2html.image_utils import ImageProcessor, image_size
+        with metrics.span("prepare", presentation=self.presentation_id):
+            _, page_ids = self.downloader.prepare(destdir, manifest, incremental)
+        if not page_ids:
+            return []
+        bgpath = None
+        if background is not None:
+            with metrics.span("background", presentation=self.presentation_id):
+                bgpath = self.downloader.get_background(background, destdir)
+
+        scheduler = self.downloader.scheduler
+        transform = bgpath is not None or bool(newsize)
+        transform_key = self._transform_key(bgpath, color, tolerance, newsize) if transform and self.downloader.store is not None else None
+
+        def download(item):
+            save_as, url, source = item
+            source = self.downloader.download_slide(destdir, save_as, url, source)
+            return (save_as, source) if source is not None else None
+
+        def process(item):
+            f, source = item
+            return f, source, self.process_image(os.path.join(destdir, f), processor, transform_key)
+
+        def decoded_size(item):
+            width, height = image_size(os.path.join(destdir, item[0]))
+            # RGBA slide, plus the background it's layered on.
+            return width * height * 4 * (2 if bgpath else 1)
+
+        def index(item):
+            f, source, digest = item
+            path = os.path.join(destdir, f)
+            manifest.set_image(f, *image_size(path), digest or file_digest(path), source=source)
+            return f
+
+        processor = ImageProcessor(bgpath, color, tolerance, newsize, max_workers=scheduler.cpus, limit=scheduler.transforms) if transform else None
+        try:
+            stages = [Stage("download", download, workers=self.downloader.max_workers),
+                      Stage("process", process, workers=processor.max_workers if processor else 1,
+                            weight=decoded_size if processor else None, budget=scheduler.memory),
+                      Stage("index", index)]
+            with metrics.span("pipeline", presentation=self.presentation_id, slides=len(page_ids)):
+                return Pipeline(stages, inflight=scheduler.images).run(self.downloader.slide_urls(page_ids))
+        finally:
+            if processor is not None:
+                processor.close()
+
+    def _fetch_images_by_stage(self, destdir, manifest, incremental=False, background=None, color=(255, 255, 255), tolerance=0,
+                               newsize=None):
+        """fetch_images one stage after the other: every image is downloaded (asyncio engine), then post processed and indexed"""
+        from slides2html.image_utils import image_size
+        with metrics.span("download", presentation=self.presentation_id):
+            entries, _ = self.downloader.download(destdir, manifest=manifest, incremental=incremental)
+        changed = [entry[1] for entry in entries] if incremental else manifest.files()
+        # failed downloads are left out of this build.
+        changed = [f for f in changed if os.path.exists(os.path.join(destdir, f))]
+        if not changed:
+            return changed
+
+        bgpath = None
+        if background is not None:
+            with metrics.span("background", presentation=self.presentation_id):
+                bgpath = self.downloader.get_background(background, destdir)
+        with metrics.span("process_images", presentation=self.presentation_id, images=len(changed)):
+            digests = self.process_images(destdir, files=changed, bgpath=bgpath, color=color, tolerance=tolerance, newsize=newsize)
+            for f in changed:
+                path = os.path.join(destdir, f)
+                digest = digests[f] if digests else file_digest(path)
+                manifest.set_image(f, *image_size(path), digest)
+        return changed
+
+    def _transform_key(self, bgpath, color, tolerance, newsize):
+        store = self.downloader.store
+        return store.transform_key(background=store.put(bgpath) if bgpath else None, color=list(color),
+                                   tolerance=tolerance, newsize=list(newsize) if newsize else None)
+
+    def process_image(self, path, processor=None, transform_key=None):
+        """Post process image path with processor (see image_utils.ImageProcessor), reusing the already processed image from the store.
+
+        Arguments:
+            path {str} -- image path (overwritten)
+
+        Keyword Arguments:
+            processor {ImageProcessor} -- post processing, None if there is none (default: {None})
+            transform_key {str} -- store key of the post processing (see _transform_key) (default: {None})
+
+        Returns:
+            str -- digest of the processed image when using the store (None otherwise)
+        """
+        store = self.downloader.store
+        if store is None:
+            if processor is not None:
+                processor.process(path)
+            return None
+        digest = store.put(path)
+        if processor is None:
+            return digest
+        output = store.get_transform(digest, transform_key)
+        if output is not None:
+            metrics.count("store_transform_hits")
+            store.link(output, path)
+            return output
+        processor.process(path)
+        return store.put_transform(digest, transform_key, path)
+
+    def process_images(self, destdir, files=None, bgpath=None, color=(255, 255, 255), tolerance=0, newsize=None):
+        """Post process images (see image_utils.process_images), reusing already processed images from the store.
+
+        Arguments:
+            destdir {str} -- directory with exported google slides as images
+
+        Keyword Arguments:
+            files {[str]} -- only process these images (names in destdir) (default: all images in destdir)
+            bgpath {str} -- background path (default: {None})
+            color {tuple} -- (r, g, b) color of the slides made transparent (default: {(255, 255, 255)})
+            tolerance {int} -- max difference per channel from color (default: {0})
+            newsize {tuple} -- resize to (width, height) (default: {None})
+
+        Returns:
+            dict -- digests of the processed images keyed by file name when using the store (None otherwise)
+        """
+        from slides2html.image_utils import process_images, list_slides_images
+        store = self.downloader.store
+        scheduler = self.downloader.scheduler
+        if store is None:
+            process_images(destdir, files=files, bgpath=bgpath, color=color, tolerance=tolerance, newsize=newsize, max_workers=scheduler.cpus,
+                           limit=scheduler.transforms)
+            return None
+
+        if files is None:
+            files = list_slides_images(destdir)
+        digests = {f: store.put(os.path.join(destdir, f)) for f in files}
+        if bgpath is None and not newsize:
+            return digests
+
+        transform_key = self._transform_key(bgpath, color, tolerance, newsize)
+        to_process = []
+        outputs = {}
+        for f in files:
+            output = store.get_transform(digests[f], transform_key)
+            if output is not None:
+                metrics.count("store_transform_hits")
+                store.link(output, os.path.join(destdir, f))
+                outputs[f] = output
+            else:
+                to_process.append(f)
+
+        process_images(destdir, files=to_process, bgpath=bgpath, color=color, tolerance=tolerance, newsize=newsize, max_workers=scheduler.cpus,
+                       limit=scheduler.transforms)
+        for f in to_process:
+            outputs[f] = store.put_transform(digests[f], transform_key, os.path.join(destdir, f))
+        return outputs
+
+    def convert_to_transparent_background(self, destdir, color=(255, 255, 255), tolerance=0):
+        from slides2html.image_utils import images_to_transparent_background
+        images_to_transparent_background(destdir, color=color, tolerance=tolerance, max_workers=self.downloader.scheduler.cpus)
 
     def set_images_background(self, destdir, bgpath):
-        set_background_for_images(destdir, bgpath)
+        from slides2html.image_utils import set_background_for_images
+        set_background_for_images(destdir, bgpath, max_workers=self.downloader.scheduler.cpus)
 
 
-@click.command()
-@click.option("--website", help="Reveal.js site directory", required=True)
-@click.option("--id", help="presentation url or id", required=True)
-@click.option("--indexfile", help="index filename. will default to presentation id if not provided.", required=False)
-@click.option("--imagesize", help="image size (MEDIUM, LARGE)", default="medium", required=False)
-@click.option("--credfile", help="credentials file path", default="credentials.json", required=False)
-@click.option("--themefile", help="use your own reveal.js theme", default="", required=False)
-@click.option("--serviceaccount", help="use service account instead of normal oauth flow", default=False, is_flag=True, required=False)
-@click.option("--background", help="background image to be used for all of the slides", required=False)
-@click.option("--resize", help="resize image of (width,height)", required=False)
-def cli(website, id, indexfile="", imagesize="medium", credfile="credentials.json", themefile="", serviceaccount=False, background=None, resize=None):
-    presentation_id = id
-    try:
-        presentation_id, slide_id = link_info(id)
-    except ValueError:  # not a url, people using id as in old version.
-        pass
-    imagesize = imagesize.upper()
-    if imagesize not in ["MEDIUM", "LARGE"]:
-        raise ValueError("Invalid image size should be MEDIUM or LARGE")
-
-    if resize and "," in resize:
+def write_profile(directory):
+    """Write the recorded metrics to directory (see metrics.Metrics.write) and log the slowest stages"""
+    if not directory or not metrics.enabled:
+        return
+    summary_path, trace_path = metrics.write(os.path.expanduser(directory))
+    summary = metrics.summary()
+    logger.info("profile written to %s and %s (open the trace in chrome://tracing or https://ui.perfetto.dev)", summary_path, trace_path)
+    for name, latency in sorted(summary['latencies'].items(), key=lambda item: -item[1]['total'])[:10]:
+        logger.info("%-20s count %-6s total %.3fs p50 %.3fs p99 %.3fs", name, latency['count'], latency['total'], latency['p50'], latency['p99'])
+    for name, value in sorted(summary['counters'].items()):
+        logger.info("%-20s %s", name, value)
+
+
+def read_presentations_ids(ids=(), idsfile=None):
+    """Presentations ids from ids (or urls) and idsfile (one id or url per line, # for comments)
+
+    Keyword Arguments:
+        ids {[str]} -- presentations urls or ids (default: {()})
+        idsfile {str} -- path of file listing presentations urls or ids (default: {None})
+
+    Returns:
+        [str] -- presentations ids
+    """
+    ids = list(ids)
+    if idsfile:
+        with open(os.path.expanduser(idsfile)) as f:
+            ids.extend(line.strip() for line in f if line.strip() and not line.strip().startswith("#"))
+
+    presentations_ids = []
+    for id in ids:
+        presentation_id = id
         try:
-            newwidth, newheight = map(lambda x: int(x.strip()), resize.split(","))
-        except:
-            raise ValueError("invalid size for --resize {}: should be 'width,height' ".format(resize))
+            presentation_id, slide_id = link_info(id)
+        except ValueError:  # not a url, people using id as in old version.
+            pass
+        if presentation_id not in presentations_ids:
+            presentations_ids.append(presentation_id)
+    return presentations_ids
 
-    if not indexfile:
-        indexfilepath = os.path.join(website, "{}.html".format(presentation_id))
-    else:
-        indexfilepath = os.path.join(website, "{}.html".format(indexfile))
 
-    destdir = os.path.join(website, presentation_id)
-    credfile = os.path.abspath(os.path.expanduser(credfile))
-    if not os.path.exists(credfile):
-        raise ValueError("Invalid credential file: {}".format(credfile))
+class SiteBuilder:
+    def __init__(self, website, imagesize="medium", credfile="credentials.json", themefile="", serviceaccount=False, background=None,
+                 transparentcolor="255,255,255", tolerance=0, resize=None, formats="", quality=80, nolazy=False, preload=2, widths="",
+                 placeholders=False, timeout=None, incremental=False, apicalls=8, downloads=20, inflight=DEFAULT_INFLIGHT,
+                 memory=DEFAULT_MEMORY_MB, engine="threads", store=None, cachedir=DEFAULT_CACHEDIR, nocache=False, concurrency=DEFAULT_WORKERS,
+                 fetch="thumbnail", transforms=None, noadaptive=False, publish=None, compress="gz", sink=None, journalmode="auto"):
+        """Builds presentations of a website with the command line options (see build_options).
 
-    theme = ""
-    themefilepath = os.path.expanduser(themefile)
-    if os.path.exists(themefilepath):
-        with open(themefilepath) as f:
-            theme = f.read()
-    else:
-        theme = BASIC_TEMPLATE
+        Authentication, api discovery, connections pool, limits, store and caches are shared by all of the presentations.
 
-    p2h = Tool(presentation_id, credfile, serviceaccount=serviceaccount)
-    p2h.downloader.thumbnailsize = imagesize
-    p2h.build_revealjs_site(destdir, indexfilepath, template=theme)
+        Arguments:
+            website {str} -- reveal.js site directory
 
-    if background is not None:
-        bgpath = p2h.downloader.get_background(background, destdir)
-        p2h.convert_to_transparent_background(destdir)
-        p2h.set_images_background(destdir, bgpath)
+        Raises:
+            ValueError -- invalid option
+        """
+        self.website = website
+        imagesize = imagesize.upper()
+        if imagesize not in ["MEDIUM", "LARGE"]:
+            raise ValueError("Invalid image size should be MEDIUM or LARGE")
+        self.imagesize = imagesize
+
+        newsize = None
+        if resize and "," in resize:
+            try:
+                newwidth, newheight = map(lambda x: int(x.strip()), resize.split(","))
+            except:
+                raise ValueError("invalid size for --resize {}: should be 'width,height' ".format(resize))
+            newsize = (newwidth, newheight)
+
+        try:
+            transparent_color = tuple(int(x.strip()) for x in transparentcolor.split(","))
+        except ValueError:
+            raise ValueError("invalid color for --transparentcolor {}: should be 'r,g,b' ".format(transparentcolor))
+        if len(transparent_color) != 3:
+            raise ValueError("invalid color for --transparentcolor {}: should be 'r,g,b' ".format(transparentcolor))
+
+        from slides2html.image_utils import check_formats
+        formats = [fmt.strip().lower() for fmt in formats.split(",") if fmt.strip()]
+        check_formats(formats)
+        try:
+            widths = [int(w.strip()) for w in widths.split(",") if w.strip()]
+        except ValueError:
+            raise ValueError("invalid --widths {}: should be comma separated widths e.g '480,960'".format(widths))
+
+        credfile = os.path.abspath(os.path.expanduser(credfile))
+        if not os.path.exists(credfile):
+            raise ValueError("Invalid credential file: {}".format(credfile))
+        self.credfile = credfile
+        self.serviceaccount = serviceaccount
+        self.themefilepath = os.path.expanduser(themefile)
+        self.timeout = timeout
+        self.engine = engine
+        if fetch == "export" and engine != "threads":
+            raise ValueError("--fetch export requires the threads --engine")
+        self.fetch = fetch
+        self.concurrency = concurrency
+        self.compressions = [c.strip().lower() for c in compress.split(",") if c.strip()]
+        check_compressions(self.compressions)
+        self.publishdir = os.path.abspath(os.path.expanduser(publish)) if publish else None
+        if sink and (incremental or publish):
+            raise ValueError("--sink builds can't be --incremental or --publish")
+        self.sink = open_sink(sink) if sink else None
+        self.build_options = dict(background=background, resize=newsize, incremental=incremental, transparent_color=transparent_color,
+                                  tolerance=tolerance, formats=formats, quality=quality, lazy=not nolazy, preload=preload, widths=widths,
+                                  placeholders=placeholders)
+
+        self.service, self.http_factory = get_service(credfile, serviceaccount, cachedir)
+        self.authorization = get_authorization(credfile, serviceaccount) if fetch == "export" else None
+        self.session = make_session(downloads)
+        self.scheduler = Scheduler(api_calls=apicalls, downloads=downloads, images=inflight, memory=memory * 1024 * 1024, transforms=transforms,
+                                   adaptive=not noadaptive)
+        self.store = ContentStore(store) if store else None
+        self.sitemeta = site_metadata(website, journalmode)
+        cachedir = os.path.expanduser(cachedir)
+        self.metacache = None
+        if not nocache:
+            self.metacache = MetadataCache(os.path.join(cachedir, "presentations"))
+        enable_bytecode_cache(os.path.join(cachedir, "templates"))
+
+    def get_theme(self):
+        # read again only if the theme file changed.
+        if self.themefilepath and os.path.exists(self.themefilepath):
+            return read_template(self.themefilepath)
+        return BASIC_TEMPLATE
+
+    def tool(self, presentation_id):
+        p2h = Tool(presentation_id, self.credfile, serviceaccount=self.serviceaccount, service=self.service, http_factory=self.http_factory,
+                   session=self.session, scheduler=self.scheduler, engine=self.engine, store=self.store,
+                   metacache=self.metacache, fetch=self.fetch, authorization=self.authorization)
+        p2h.downloader.thumbnailsize = self.imagesize
+        p2h.downloader.max_workers = self.concurrency
+        if self.timeout:
+            p2h.downloader.timeout = self.timeout
+        return p2h
+
+    def revision_id(self, presentation_id):
+        """Current revisionId of presentation (light request), its drive version for view only credentials, None if neither is available"""
+        downloader = self.tool(presentation_id).downloader
+        revision_id = downloader.get_revision_id()
+        if revision_id:
+            return revision_id
+        try:
+            return downloader.get_drive_version()
+        except Exception as e:  # e.g the drive api isn't enabled for the credentials
+            logger.debug("failed to get the drive version of %s: %r", presentation_id, e)
+            return None
+
+    def build(self, presentation_id, indexfile="", **options):
+        """Build presentation in the website, its build state is kept in the website metadata (see sitemeta.SiteMetadata)
+
+        Arguments:
+            presentation_id {str} -- presentation id
+
+        Keyword Arguments:
+            indexfile {str} -- index file name (default: presentation id)
+            options -- override build options e.g incremental (see Tool.build_revealjs_site)
+        """
+        indexfilepath = os.path.join(self.website, "{}.html".format(indexfile or presentation_id))
+        destdir = os.path.join(self.website, presentation_id)
+        build_options = dict(self.build_options, **options)
+        self.sitemeta.update(presentation_id, state=BUILDING, started=time.time(), finished=None, error=None)
+        try:
+            if self.sink is not None:
+                build_options.pop('incremental', None)
+                manifest = Manifest(presentation_id)
+                self.tool(presentation_id).render_revealjs_site(self.sink, "{}.html".format(indexfile or presentation_id),
+                                                                template=self.get_theme(), manifest=manifest, **build_options)
+            else:
+                self.tool(presentation_id).build_revealjs_site(destdir, indexfilepath, template=self.get_theme(), **build_options)
+                manifest = Manifest.load(destdir)
+            if self.publishdir:
+                with metrics.span("publish", presentation=presentation_id):
+                    publish(indexfilepath, destdir, self.publishdir, self.compressions, manifest=manifest)
+        except Exception as e:
+            self.sitemeta.update(presentation_id, state=FAILED, finished=time.time(), error=repr(e))
+            raise
+        self.sitemeta.update(presentation_id, state=BUILT, finished=time.time(), revision_id=manifest.revision_id, slides=len(manifest.slides))
+
+
+BUILD_OPTIONS = [
+    click.option("--website", help="Reveal.js site directory", required=True),
+    click.option("--imagesize", help="image size (MEDIUM, LARGE)", default="medium", required=False),
+    click.option("--credfile", help="credentials file path", default="credentials.json", required=False),
+    click.option("--themefile", help="use your own reveal.js theme", default="", required=False),
+    click.option("--serviceaccount", help="use service account instead of normal oauth flow", default=False, is_flag=True, required=False),
+    click.option("--background", help="background image to be used for all of the slides", required=False),
+    click.option("--transparentcolor", help="color (r,g,b) of the slides replaced by --background", default="255,255,255", required=False),
+    click.option("--tolerance", help="max difference per channel from --transparentcolor", default=0, type=int, required=False),
+    click.option("--resize", help="resize image of (width,height)", required=False),
+    click.option("--formats", help="also encode images as comma separated formats (avif, webp, jpeg, png) served with <picture>",
+                 default="", required=False),
+    click.option("--quality", help="quality of the lossy --formats", default=80, type=int, required=False),
+    click.option("--nolazy", help="load all of the slides images when the presentation is opened", default=False, is_flag=True, required=False),
+    click.option("--preload", help="number of first slides images to preload", default=2, type=int, required=False),
+    click.option("--widths", help="also resize images to comma separated widths for responsive srcset e.g 480,960", default="", required=False),
+    click.option("--placeholders", help="inline tiny blurred placeholders shown until the images load", default=False, is_flag=True,
+                 required=False),
+    click.option("--profile", help="write timings and counters (summary.json) and a Chrome trace (trace.json) to this directory", required=False),
+    click.option("--loglevel", help="logging level", type=click.Choice(LOG_LEVELS, case_sensitive=False), default="INFO", required=False),
+    click.option("--timeout", help="timeout in seconds of images downloads", type=float, required=False),
+    click.option("--incremental", help="only download and process new or changed slides", default=False, is_flag=True, required=False),
+    click.option("--parallel", help="number of presentations built at the same time", default=4, type=int, required=False),
+    click.option("--apicalls", help="max concurrent google api calls (all presentations)", default=8, type=int, required=False),
+    click.option("--downloads", help="max concurrent images downloads (all presentations)", default=20, type=int, required=False),
+    click.option("--noadaptive", help="fixed --apicalls and --downloads limits, not backed off when google pushes back (429/503, timeouts, latency)",
+                 default=False, is_flag=True, required=False),
+    click.option("--transforms", help="max images post processed or encoded at once (all presentations) [default: number of cpus]", type=int,
+                 required=False),
+    click.option("--inflight", help="max slides images between download and indexing (all presentations)", default=DEFAULT_INFLIGHT, type=int,
+                 required=False),
+    click.option("--memory", help="max MB of decoded images post processed at once (all presentations)", default=DEFAULT_MEMORY_MB, type=int,
+                 required=False),
+    click.option("--engine", help="network engine (asyncio requires aiohttp)", type=click.Choice(ENGINES), default="threads", required=False),
+    click.option("--fetch", help="slides images from getThumbnail api calls or export urls (no api call, falls back to thumbnails)",
+                 type=click.Choice(FETCH_STRATEGIES), default="thumbnail", required=False),
+    click.option("--store", help="content addressed images store directory shared between presentations", required=False),
+    click.option("--cachedir", help="cache directory", default=DEFAULT_CACHEDIR, required=False),
+    click.option("--nocache", help="don't use cached presentations metadata", default=False, is_flag=True, required=False),
+    click.option("--publish", help="also write a deploy ready copy of the website to this directory: content hashed images, precompressed html "
+                 "and an assets manifest of the changes per presentation", required=False),
+    click.option("--compress", help="precompressed versions of the published text assets, comma separated (gz, br requires brotli)", default="gz",
+                 required=False),
+    click.option("--sink", help="build in memory and write the presentations to s3://bucket/prefix (requires boto3, endpoint from "
+                 "AWS_ENDPOINT_URL) or a directory instead of --website, which keeps the presentations metadata", required=False),
+    click.option("--journalmode", help="journal of the website metadata database: wal, delete for network filesystems, auto detects them",
+                 type=click.Choice(JOURNAL_MODES), default="auto", required=False),
+    click.option("--concurrency", help="max concurrent images downloads per presentation", default=DEFAULT_WORKERS, type=int, required=False),
+]
+
+
+def build_options(command):
+    """Add the build options (see SiteBuilder) to click command"""
+    for option in reversed(BUILD_OPTIONS):
+        command = option(command)
+    return command
+
+
+def setup_logging(loglevel="INFO", profile=None):
+    logging.basicConfig(level=loglevel.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if profile:
+        metrics.enable()
 
-    if resize and "," in resize:
-        newwidth, newheight = map(lambda x: int(x.strip()), resize.split(","))
-        resize_images(destdir, (newwidth, newheight))
\ No newline at end of file
+
+@click.command()
+@click.option("--id", help="presentation url or id (can be repeated to build multiple presentations)", multiple=True, required=False)
+@click.option("--idsfile", help="file with a presentation url or id per line", required=False)
+@click.option("--indexfile", help="index filename. will default to presentation id if not provided.", required=False)
+@build_options
+def cli(id=(), idsfile=None, indexfile="", parallel=4, profile=None, loglevel="INFO", **options):
+    setup_logging(loglevel, profile)
+    presentations_ids = read_presentations_ids(id, idsfile)
+    if not presentations_ids:
+        raise ValueError("at least one presentation is required: use --id or --idsfile")
+    if indexfile and len(presentations_ids) > 1:
+        raise ValueError("--indexfile can't be used with multiple presentations")
+
+    builder = SiteBuilder(**options)
+
+    def build_presentation(presentation_id):
+        builder.build(presentation_id, indexfile=indexfile)
+
+    if len(presentations_ids) == 1:
+        try:
+            build_presentation(presentations_ids[0])
+        finally:
+            write_profile(profile)
+        return
+
+    failures = {}
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        futures = {executor.submit(build_presentation, presentation_id): presentation_id for presentation_id in presentations_ids}
+        for future in as_completed(futures):
+            presentation_id = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                logger.exception("failed to build %s", presentation_id)
+                failures[presentation_id] = e
+    write_profile(profile)
+
+    print("\nbuilt {} presentations, {} failed".format(len(presentations_ids) - len(failures), len(failures)))
+    for presentation_id in presentations_ids:
+        if presentation_id in failures:
+            print("FAILED {}: {!r}".format(presentation_id, failures[presentation_id]))
+        else:
+            print("OK     {}".format(presentation_id))
+    if failures:
+        sys.exit(1)
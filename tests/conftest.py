@@ -0,0 +1,5 @@
+import os
+import sys
+
+# offline google slides api and images server of the benchmarks (fakeslides)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
@@ -0,0 +1,29 @@
+import threading
+
+from slides2html.daemon import Daemon
+
+
+def test_trigger_during_build_builds_again():
+    started, release = threading.Event(), threading.Event()
+    builds = []
+
+    def build(presentation_id):
+        builds.append(presentation_id)
+        started.set()
+        release.wait(5)
+
+    built = threading.Semaphore(0)
+    daemon = Daemon(["deck"], build, lambda presentation_id: "1", interval=60, debounce=0, max_delay=60, jitter=0,
+                    on_build=lambda deck: built.release())
+    daemon.step()
+    assert started.wait(5)
+    assert daemon.trigger("deck")
+    release.set()
+    assert built.acquire(timeout=5)
+
+    daemon.step()
+    assert built.acquire(timeout=5)
+    assert builds == ["deck", "deck"]
+    assert daemon.status()['decks'][0]['pending'] is False
+    daemon.stop()
+    daemon.run()
@@ -0,0 +1,42 @@
+import threading
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from slides2html.downloader import Downloader
+from slides2html.scheduler import Scheduler
+
+
+class Request:
+    def __init__(self, barrier=None, status=None):
+        self.barrier = barrier
+        self.status = status
+
+    def execute(self, http=None):
+        if self.status is not None:
+            raise HttpError(httplib2.Response({'status': self.status}), b"")
+        if self.barrier is not None:
+            # every slot of the limit in use
+            self.barrier.wait(timeout=5)
+        return {}
+
+
+def test_api_limit_grows_back_after_backoff():
+    scheduler = Scheduler(api_calls=4)
+    downloader = Downloader("deck", service=None, scheduler=scheduler)
+    with pytest.raises(HttpError):
+        downloader._execute(Request(status=429))
+    assert int(scheduler.api.limit) == 2
+
+    def worker(barrier):
+        for _ in range(10):
+            downloader._execute(Request(barrier))
+
+    barrier = threading.Barrier(2)
+    threads = [threading.Thread(target=worker, args=(barrier,)) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert int(scheduler.api.limit) > 2
@@ -0,0 +1,25 @@
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+from slides2html.image_utils import PLACEHOLDER_SIZE, encode_variants, placeholder_name
+
+
+@pytest.mark.parametrize("mode", ["P", "I;16", "1", "RGBA"])
+def test_placeholder_of_any_png_mode(mode):
+    img = Image.new("RGB", (400, 225), (10, 120, 200)).convert(mode)
+    variants = encode_variants(img, "00_p0.png", ["webp"], placeholder=True)
+    uri = variants[placeholder_name("00_p0.png")].decode()
+    assert uri.startswith("data:image/png;base64,")
+    tiny = Image.open(io.BytesIO(base64.b64decode(uri.split(",", 1)[1])))
+    assert max(tiny.size) <= PLACEHOLDER_SIZE
+
+
+def test_placeholder_of_palette_png_file(tmpdir):
+    path = str(tmpdir.join("00_p0.png"))
+    Image.new("RGB", (400, 225), (10, 120, 200)).quantize(colors=16).save(path)
+    with Image.open(path) as img:
+        assert img.mode == "P"
+        assert placeholder_name("00_p0.png") in encode_variants(img, "00_p0.png", ["webp", "png"], widths=[200], placeholder=True)
@@ -0,0 +1,30 @@
+import json
+import os
+
+from fakeslides import FakeService, ImageServer, make_presentation
+
+from slides2html.downloader import make_session
+from slides2html.manifest import MANIFEST_FILENAME
+from slides2html.tool import Tool
+
+
+def build(server, service, site, imagesize):
+    before = server.requests
+    tool = Tool("deck", service=service, session=make_session(4))
+    tool.downloader.thumbnailsize = imagesize
+    tool.build_revealjs_site(os.path.join(site, "deck"), os.path.join(site, "deck.html"), incremental=True)
+    return server.requests - before
+
+
+def test_incremental_build_with_another_imagesize(tmpdir):
+    site = str(tmpdir)
+    with ImageServer() as server:
+        service = FakeService(server.url, [make_presentation("deck", 3)])
+        assert build(server, service, site, "MEDIUM") == 3
+        assert build(server, service, site, "MEDIUM") == 0
+        # unchanged revision, the images of the previous build are outdated.
+        assert build(server, service, site, "LARGE") == 3
+        with open(os.path.join(site, "deck", MANIFEST_FILENAME)) as f:
+            slides = json.load(f)['slides']
+        assert {slide['fingerprint']['thumbnailsize'] for slide in slides} == {"LARGE"}
+        assert build(server, service, site, "LARGE") == 0
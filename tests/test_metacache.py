@@ -0,0 +1,39 @@
+import os
+
+from fakeslides import FakeService, ImageServer, make_presentation
+
+from slides2html.downloader import PRESENTATION_FIELDS, SLIDES_IDS_FIELDS, SLIDES_NOTES_FIELDS, make_session
+from slides2html.metacache import MetadataCache
+from slides2html.metrics import metrics
+from slides2html.tool import Tool
+
+BACKGROUND = "https://docs.google.com/presentation/d/background/edit#slide=id.p0"
+
+
+def test_full_builds_use_the_cache(tmpdir):
+    site, cachedir = str(tmpdir.mkdir("site")), str(tmpdir.mkdir("cache"))
+    with ImageServer() as server:
+        service = FakeService(server.url, [make_presentation("deck", 3), make_presentation("background", 1)])
+
+        def build(**options):
+            metrics.enable()
+            try:
+                tool = Tool("deck", service=service, session=make_session(4), metacache=cachedir)
+                tool.build_revealjs_site(os.path.join(site, "deck"), os.path.join(site, "deck.html"), background=BACKGROUND, **options)
+                return metrics.counters["metadata_cache_hits"]
+            finally:
+                metrics.enabled = False
+                metrics.reset()
+
+        assert build() == 0
+        cache = MetadataCache(cachedir)
+        assert cache.get("deck")['fields'] == SLIDES_NOTES_FIELDS
+        assert cache.get("background")['fields'] == SLIDES_IDS_FIELDS
+        # unchanged deck and background, both are served by the cache.
+        assert build() == 2
+
+        # the cached notes don't have the elements hashes compared by incremental builds (the deck is up to date, the background isn't needed).
+        assert build(incremental=True) == 0
+        assert cache.get("deck")['fields'] == PRESENTATION_FIELDS
+        assert cache.get("deck")['slides'][0]['elements'] is not None
+        assert build() == 2
@@ -0,0 +1,36 @@
+import pytest
+
+from slides2html import sitemeta
+from slides2html.sitemeta import BUILT, SiteMetadata
+
+
+def journal_mode(site):
+    return site._connection().execute("PRAGMA journal_mode").fetchone()[0]
+
+
+def test_wal_on_local_filesystem(tmpdir):
+    site = SiteMetadata(str(tmpdir))
+    site.update("deck", title="Intro", state=BUILT)
+    assert site.get("deck")['title'] == "Intro"
+    assert journal_mode(site) == "wal"
+
+
+def test_rollback_journal_on_network_filesystem(tmpdir, monkeypatch):
+    monkeypatch.setattr(sitemeta, "filesystem_type", lambda path: "nfs4")
+    site = SiteMetadata(str(tmpdir))
+    site.update("deck", title="Intro", state=BUILT)
+    assert site.get("deck")['state'] == BUILT
+    assert journal_mode(site) == "delete"
+    assert not tmpdir.join("presentations.db-wal").exists()
+
+
+def test_journal_mode_option(tmpdir, monkeypatch):
+    monkeypatch.setattr(sitemeta, "filesystem_type", lambda path: "nfs4")
+    assert journal_mode(SiteMetadata(str(tmpdir.mkdir("wal")), journal_mode="wal")) == "wal"
+    assert journal_mode(SiteMetadata(str(tmpdir.mkdir("delete")), journal_mode="delete")) == "delete"
+    with pytest.raises(ValueError):
+        SiteMetadata(str(tmpdir), journal_mode="memory")
+
+
+def test_filesystem_type():
+    assert sitemeta.filesystem_type("/") is not None